@@ -0,0 +1,161 @@
+import sys
+import unittest
+
+from vt102 import screen
+
+# The tests drive the loop themselves rather than using async syntax, so that
+# this module still loads where vt102.aio can't.
+if sys.version_info >= (3, 5):
+    import asyncio
+
+    from vt102.aio import feeder
+
+class transport(object):
+    def __init__(self):
+        self.calls = []
+
+    def pause_reading(self):
+        self.calls.append("pause")
+
+    def resume_reading(self):
+        self.calls.append("resume")
+
+@unittest.skipIf(sys.version_info < (3, 5), "vt102.aio needs Python 3.5")
+class TestFeeder(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def wait(self, future):
+        return self.loop.run_until_complete(future)
+
+    def test_reader(self):
+        reader = asyncio.StreamReader()
+        f = feeder(screen((2, 10)))
+        task = asyncio.ensure_future(f.feed_from(reader))
+
+        reader.feed_data(u"h\xe9".encode("utf-8")[:2])
+        self.assertTrue(self.wait(f.changed()))
+        reader.feed_data(u"\xe9llo".encode("utf-8")[1:])
+        self.assertTrue(self.wait(f.changed()))
+        self.assertEqual(f.screen.display[0], u"h\xe9llo     ")
+
+        reader.feed_eof()
+        self.assertFalse(self.wait(f.changed()))
+        self.assertFalse(self.wait(f.changed()))
+        self.wait(task)
+
+    def test_slices(self):
+        f = feeder(screen((4, 10)), chunk=10)
+        p = f.protocol()
+        p.data_received(b"x" * 25)
+        p.eof_received()
+
+        # Callbacks run as soon as each slice is done, before the next.
+        wakes = []
+        done = self.loop.create_future()
+        def woke(changed):
+            if changed.result():
+                wakes.append(f.screen.display[:3])
+                f.changed().add_done_callback(woke)
+            else:
+                done.set_result(None)
+        f.changed().add_done_callback(woke)
+        self.wait(done)
+        self.assertEqual(wakes, [("x" * 10, " " * 10, " " * 10),
+                                 ("x" * 10, "x" * 10, " " * 10),
+                                 ("x" * 10, "x" * 10, "x" * 5 + " " * 5)])
+
+    def test_flow_control(self):
+        f = feeder(screen((4, 10)), chunk=4)
+        t = transport()
+        p = f.protocol()
+        p.connection_made(t)
+        p.data_received(b"y" * 20)
+        self.assertEqual(t.calls, ["pause"])
+        p.eof_received()
+
+        while self.wait(f.changed()):
+            pass
+        self.assertEqual(t.calls, ["pause", "resume"])
+        self.assertEqual(f.screen.display[:2], ("y" * 10,) * 2)
+
+    def test_parse_error(self):
+        errors = []
+        self.loop.set_exception_handler(
+            lambda loop, context: errors.append(context["exception"]))
+        f = feeder(screen((2, 10)), chunk=4)
+        t = transport()
+        p = f.protocol()
+        p.connection_made(t)
+        p.data_received(b"ok" + b"\x1b[;5H" * 40)
+        self.assertEqual(t.calls, ["pause"])
+
+        while self.wait(f.changed()):
+            pass
+        self.assertTrue(f.closed)
+        self.assertTrue(isinstance(f.error, ValueError))
+        self.assertEqual(errors, [f.error])
+        self.assertEqual(t.calls, ["pause", "resume"])
+        self.assertEqual(f.screen.display[0], "ok        ")
+
+        p.data_received(b"more")
+        self.assertFalse(self.wait(f.changed()))
+
+    def test_reader_parse_error(self):
+        reader = asyncio.StreamReader()
+        f = feeder(screen((2, 10)))
+        waiter = f.changed()
+        task = asyncio.ensure_future(f.feed_from(reader))
+        reader.feed_data(b"\x1b[;5H")
+        self.assertRaises(ValueError, self.wait, task)
+        self.assertTrue(f.closed)
+        self.assertTrue(isinstance(f.error, ValueError))
+        self.assertFalse(self.wait(waiter))
+
+    def test_wait_for(self):
+        reader = asyncio.StreamReader()
+        f = feeder(screen((3, 10)))
+        task = asyncio.ensure_future(f.feed_from(reader))
+        waits = [asyncio.ensure_future(f.wait_for(text))
+                 for text in ("$ ", "ok", "$ ")]
+        short = asyncio.ensure_future(f.wait_for("never", timeout=0.01))
+
+        reader.feed_data(b"make\r\n")
+        self.wait(asyncio.sleep(0.02))
+        self.assertFalse(any(w.done() for w in waits))
+        self.assertEqual(self.wait(short), None)
+
+        reader.feed_data(b"ok\r\n$ ")
+        self.assertEqual(self.wait(asyncio.gather(*waits)),
+                         [(2, 0, "$ "), (1, 0, "ok"), (2, 0, "$ ")])
+        self.assertEqual(self.wait(f.wait_for("ake", (0, 1, 1, 10))),
+                         (0, 1, "ake"))
+        self.assertEqual(self.wait(f.wait_for("make", (0, 1, 1, 10),
+                                              timeout=0.01)), None)
+
+        reader.feed_eof()
+        self.assertEqual(self.wait(f.wait_for("never")), None)
+        self.wait(task)
+
+    def test_subprocess(self):
+        f = feeder(screen((2, 20)))
+        process, _ = self.wait(self.loop.subprocess_exec(
+            f.protocol, sys.executable, "-c",
+            "import sys; sys.stdout.write('\\x1b[1mbold')",
+            stdin=None, stderr=None))
+        while self.wait(f.changed()):
+            pass
+        while process.get_returncode() is None:
+            self.wait(asyncio.sleep(0.01))
+        process.close()
+        self.assertEqual(f.screen.display[0], "bold" + " " * 16)
+        self.assertEqual(f.screen.attributes[0][0],
+                         (("bold",), "default", "default"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+from vt102 import bench, stream, screen
+
+class output(object):
+    # Takes whatever sort of string it's given, on Python 2 as well.
+    def __init__(self):
+        self.written = []
+
+    def write(self, text):
+        self.written.append(text)
+
+    def getvalue(self):
+        return "".join(self.written)
+
+class TestBench(unittest.TestCase):
+    def test_workloads(self):
+        for name, workload in bench.workloads.items():
+            data = workload(random.Random(1), 5000, (24, 80))
+            self.assertTrue(len(data) >= 5000, name)
+            self.assertEqual(data, workload(random.Random(1), 5000, (24, 80)))
+
+            # Everything generated is understood.
+            st = stream()
+            screen((24, 80)).attach(st)
+            st.process(data)
+            self.assertEqual(st.state, "stream")
+
+    def test_events(self):
+        # Print runs, a linefeed and a carriage return.
+        self.assertEqual(bench.events(u"ab\r\ncd"), 4)
+
+    def test_run_and_compare(self):
+        results = bench.run(["text", "top"], size=2000, repeat=1)
+        self.assertEqual(sorted(results), ["text/screen", "text/stream",
+                                           "text/terminal", "top/screen",
+                                           "top/stream", "top/terminal"])
+        for result in results.values():
+            self.assertTrue(result["chars_per_sec"] > 0)
+            self.assertTrue(result["events"] > 0)
+
+        out = output()
+        bench.report(results, baseline=results, out=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(lines[1].endswith("+0.0%"))
+
+    def test_diffs(self):
+        results = bench.run_diffs(repeat=1)
+        self.assertEqual(sorted(results),
+                         ["diff/scroll", "diff/typical", "diff/worst"])
+        sizes = [results["diff/%s" % name]["bytes"]
+                 for name in ("typical", "scroll", "worst")]
+        self.assertEqual(sizes, sorted(sizes))
+
+        out = output()
+        bench.report_diffs(results, baseline=results, out=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].endswith("+0.0%"))
+
+    @unittest.skipIf(sys.version_info < (3, 5),
+                     "vt102.spawn needs Python 3.5")
+    def test_spawn(self):
+        results = bench.run_spawn(["sgr"], size=20000, repeat=1)
+        self.assertEqual(sorted(results), ["sgr/cat", "sgr/spawn"])
+        for result in results.values():
+            self.assertEqual(result["chars"], results["sgr/cat"]["chars"])
+            self.assertTrue(result["chars_per_sec"] > 0)
+
+    def test_save(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        out, sys.stdout = sys.stdout, output()
+        try:
+            self.assertEqual(bench.main(["-w", "dsg", "-s", "500", "-n", "1",
+                                         "--save", path]), 0)
+            with open(path) as f:
+                self.assertEqual(sorted(json.load(f)),
+                                 ["dsg/screen", "dsg/stream",
+                                  "dsg/terminal"])
+        finally:
+            sys.stdout = out
+            os.remove(path)
+
+if __name__ == "__main__":
+    unittest.main()
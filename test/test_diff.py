@@ -0,0 +1,128 @@
+import random
+import unittest
+
+import vt102
+from vt102 import stream, screen
+from vt102.diff import encode
+
+def noise(rng, rows, cols, length):
+    """
+    Some random, but plausible, terminal output.
+    """
+    out = []
+    for _ in range(length):
+        op = rng.randint(0, 13)
+        if op <= 3:
+            out.append("".join(rng.choice("abcdefgh  qx") for _ in
+                               range(rng.randint(1, cols + 2))))
+        elif op == 4:
+            out.append("\x1b[%d;%dH" % (rng.randint(1, rows),
+                                         rng.randint(1, cols)))
+        elif op == 5:
+            out.append("\x1b[%sm" % ";".join(
+                str(rng.choice([0, 1, 2, 4, 5, 7, 24, 25, 27, 31, 39, 42, 49]))
+                for _ in range(rng.randint(0, 3))))
+        elif op == 6:
+            out.append("\x1b[%dK" % rng.randint(0, 2))
+        elif op == 7:
+            out.append(rng.choice(["\x1b[J", "\x1b[1J", "\x1b[2J"]))
+        elif op == 8:
+            out.append(rng.choice(["\x1b[L", "\x1b[2M", "\x1b[3P"]))
+        elif op == 9:
+            out.append(rng.choice(["\r\n", "\n", "\x1bD", "\x1bM", "\x08"]))
+        elif op == 10:
+            top = rng.randint(1, rows)
+            out.append(rng.choice(["\x1b[r", "\x1b[%d;%dr" %
+                                   (top, rng.randint(top, rows))]))
+        elif op == 11:
+            out.append(rng.choice(["\x1b(0", "\x1b(B", "\x1b)0", "\x1b)B",
+                                   "\x0e", "\x0f"]))
+        else:
+            out.append("\x1b[%d%s" % (rng.randint(1, 4), rng.choice("ABCD")))
+    return "".join(out)
+
+class TestDiff(unittest.TestCase):
+    def play(self, shape, data):
+        s = screen(shape)
+        st = stream()
+        s.attach(st)
+        st.process(data)
+        return s, st
+
+    def assertSameScreen(self, a, b):
+        self.assertEqual(a.display, b.display)
+        self.assertEqual(a.attributes, b.attributes)
+        self.assertEqual(a.cursor(), b.cursor())
+        self.assertEqual(a.cursor_attributes, b.cursor_attributes)
+        self.assertEqual(a.margins, b.margins)
+        self.assertEqual((a.g0, a.g1, a.current_charset),
+                         (b.g0, b.g1, b.current_charset))
+
+    def check(self, shape, before, after):
+        s, st = self.play(shape, before)
+        old = s.snapshot()
+        st.process(after)
+
+        remote, remote_stream = self.play(shape, before)
+        update = encode(old, s)
+        remote_stream.process(update)
+
+        self.assertSameScreen(remote, s)
+        return update
+
+    def test_random(self):
+        rng = random.Random(102)
+        for shape in [(3, 5), (5, 8), (10, 20), (24, 80), (2, 4)]:
+            for _ in range(40):
+                self.check(shape, noise(rng, shape[0], shape[1], 30),
+                           noise(rng, shape[0], shape[1], 20))
+
+    def test_from_nothing(self):
+        rng = random.Random(7)
+        s, st = self.play((6, 12), noise(rng, 6, 12, 50))
+
+        remote, remote_stream = self.play((6, 12), "")
+        remote_stream.process(encode(None, s))
+
+        self.assertSameScreen(remote, s)
+
+    def test_bottom_right_corner(self):
+        # Reverse index on the top row moves the last cell of the second row
+        # into the bottom right corner without scrolling it away.
+        update = self.check((3, 3), "", "\x1b[2;3Hx\x1b[H\x1bM")
+        self.assertTrue("\x1b[1;2r" in update, repr(update))
+
+        self.check((2, 3), "ab", "\x1b[1;3Hx\x1b[H\x1bMz")
+
+    def test_unchanged(self):
+        s, st = self.play((4, 10), "hello\r\nworld")
+        self.assertEqual(encode(s.snapshot(), s), "")
+
+    def test_single_change_is_small(self):
+        update = self.check((24, 80), "x" * 80 * 23, "\x1b[12;40Hy")
+        self.assertTrue(len(update) < 20, repr(update))
+
+    def test_cleared_screen(self):
+        update = self.check((24, 80), "x" * 80 * 23, "\x1b[2Jhi")
+        self.assertTrue(update.startswith("\x1b[2J"), repr(update))
+
+    def test_different_palettes(self):
+        class other(screen):
+            palette = vt102.palette()
+
+        s = other((3, 5))
+        st = stream()
+        s.attach(st)
+        st.process("\x1b[1;31mab\x1b[0mc")
+
+        remote, remote_stream = self.play((3, 5), "\x1b[4mzz")
+        remote_stream.process(encode(remote.snapshot(), s))
+
+        self.assertSameScreen(remote, s)
+
+    def test_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            encode(screen((2, 2)), screen((3, 3)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import random
+import unittest
+
+from vt102 import stream, screen, scrollback
+from vt102.render import html, html_lines, ansi, ansi_lines, colors
+
+from .test_diff import noise
+
+class TestRender(unittest.TestCase):
+    def setUp(self):
+        self.screen = screen((3, 12))
+        self.stream = stream()
+        self.screen.attach(self.stream)
+
+    def test_runs_are_merged(self):
+        # Different attributes that look the same are one span.
+        self.stream.process(u"\x1b[31mab\x1b[0;31;49mcd\x1b[m ef")
+        self.assertEqual(html_lines(self.screen)[0],
+                         u'<span style="color:#cd0000">abcd</span> ef')
+        self.assertEqual(ansi_lines(self.screen)[0], u"\x1b[31mabcd\x1b[m ef")
+
+    def test_trailing_blanks(self):
+        self.stream.process(u"a\r\n\x1b[44mb  \x1b[m\r\n\x1b[4mc ")
+        self.assertEqual(html_lines(self.screen), [
+            u"a",
+            u'<span style="background-color:#0000ee">b  </span>',
+            u'<span style="text-decoration:underline">c </span>'])
+        self.assertEqual(ansi(self.screen),
+                         u"a\n\x1b[44mb  \x1b[m\n\x1b[4mc \x1b[m\n")
+
+    def test_escaping(self):
+        self.stream.process(u"<a & b>")
+        self.assertEqual(html_lines(self.screen)[0], u"&lt;a &amp; b&gt;")
+        self.assertEqual(ansi_lines(self.screen)[0], u"<a & b>")
+
+    def test_reverse(self):
+        self.stream.process(u"\x1b[7mx\x1b[32my")
+        self.assertEqual(html_lines(self.screen)[0],
+                         u'<span style="color:#000000;'
+                         u'background-color:#e5e5e5">x</span>'
+                         u'<span style="color:#000000;'
+                         u'background-color:#00cd00">y</span>')
+
+    def test_colors(self):
+        self.stream.process(u"\x1b[1;31mx")
+        theme = dict(colors, red="crimson")
+        self.assertEqual(html_lines(self.screen, colors=theme)[0],
+                         u'<span style="font-weight:bold;color:crimson">'
+                         u'x</span>')
+        self.assertEqual(html_lines(self.screen)[0],
+                         u'<span style="font-weight:bold;color:#cd0000">'
+                         u'x</span>')
+
+    def test_cache(self):
+        self.stream.process(u"one\r\ntwo")
+        before = html_lines(self.screen)
+        again = html_lines(self.screen)
+        for a, b in zip(before, again):
+            self.assertTrue(a is b)
+
+        self.stream.process(u"!")
+        after = html_lines(self.screen)
+        self.assertTrue(after[0] is before[0])
+        self.assertEqual(after[1], u"two!")
+
+    def test_frame(self):
+        self.stream.process(u"\x1b[1mold")
+        frame = self.screen.snapshot()
+        self.stream.process(u"\rnew")
+        self.assertEqual(ansi(frame), u"\x1b[1mold\x1b[m\n\n\n")
+        self.assertEqual(ansi(self.screen), u"\x1b[1mnew\x1b[m\n\n\n")
+
+    def test_history(self):
+        sc = screen((2, 5), history=scrollback())
+        st = stream()
+        sc.attach(st)
+        st.process(u"a\r\nb\r\nc\r\nd")
+        self.assertEqual(ansi_lines(sc), [u"c", u"d"])
+        self.assertEqual(ansi_lines(sc, history=True), [u"a", u"b", u"c", u"d"])
+        self.assertEqual(html(sc, history=True),
+                         u'<pre class="vt102">a\nb\nc\nd\n</pre>')
+
+        frame = sc.snapshot()
+        self.assertEqual(ansi_lines(frame, history=True), [u"c", u"d"])
+        self.assertEqual(html(frame, history=True), html(frame))
+
+    def test_ansi_round_trip(self):
+        rng = random.Random(24)
+        rows, cols = 6, 10
+        for _ in range(50):
+            sc = screen((rows, cols))
+            st = stream()
+            sc.attach(st)
+            st.process(noise(rng, rows, cols, 30))
+
+            # A row as wide as the screen wraps on its last character, which
+            # on the bottom row scrolls the screen, so leave a row to spare.
+            copy = screen((rows + 1, cols))
+            st = stream()
+            copy.attach(st)
+            for y, line in enumerate(ansi_lines(sc)):
+                st.process(u"\x1b[%d;1H%s" % (y + 1, line))
+            # Blanks at the end of a row can come back in different colors,
+            # which don't show.
+            self.assertEqual(copy.display[:rows], sc.display)
+            self.assertEqual(ansi_lines(copy)[:rows], ansi_lines(sc))
+
+if __name__ == "__main__":
+    unittest.main()
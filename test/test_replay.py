@@ -0,0 +1,245 @@
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+if sys.version_info[0] > 2:
+    from vt102 import replay
+
+@unittest.skipIf(sys.version_info[0] < 3, "vt102.replay needs Python 3")
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def asciicast(self, name, events, width=10, height=3):
+        lines = [json.dumps({"version": 2, "width": width,
+                             "height": height})]
+        lines += [json.dumps(event) for event in events]
+        return self.write(name, "\n".join(lines).encode("utf-8") + b"\n")
+
+    def displays(self, states):
+        return [[line.rstrip() for line in s["display"]] for s in states]
+
+    def test_raw(self):
+        path = self.write("a.log", b"one\r\ntwo")
+        self.assertEqual(replay.detect(path), "raw")
+        states = list(replay.replay(path, shape=(2, 5)))
+        self.assertEqual(self.displays(states), [["one", "two"]])
+        self.assertEqual(states[0]["cursor"], [3, 1])
+        self.assertEqual(states[0]["offset"], 8)
+
+    def test_empty(self):
+        path = self.write("empty.log", b"")
+        states = list(replay.replay(path, shape=(1, 3)))
+        self.assertEqual(self.displays(states), [[""]])
+
+    def test_every_bytes(self):
+        path = self.write("a.log", u"ab\xe9cd".encode("utf-8"))
+        states = list(replay.replay(path, shape=(1, 6), every_bytes=3))
+        # The last interval ends where the recording does, so that screen
+        # is the one at the end too.
+        self.assertEqual([s["offset"] for s in states], [3, 6])
+        # The split character waits until the rest of it arrives.
+        self.assertEqual(self.displays(states), [["ab"], [u"ab\xe9cd"]])
+
+        states = list(replay.replay(path, shape=(1, 6), every_bytes=4))
+        self.assertEqual([s["offset"] for s in states], [4, 6])
+        self.assertEqual(self.displays(states), [[u"ab\xe9"], [u"ab\xe9cd"]])
+
+    def test_typescript(self):
+        path = self.write("session", b"Script started on today\n"
+                                     b"$ ls\r\nfile\r\n$ ")
+        self.write("session.timing", b"0.5 6\n1.0 6\n2.0 2\n")
+        self.assertEqual(replay.detect(path), "typescript")
+
+        states = list(replay.replay(path, shape=(3, 6), every=1))
+        self.assertEqual([s["time"] for s in states], [1, 2, 3, 3.5])
+        self.assertEqual(self.displays(states),
+                         [["$ ls", "", ""], ["$ ls", "file", ""],
+                          ["$ ls", "file", ""], ["$ ls", "file", "$"]])
+
+    def test_advanced_timing(self):
+        path = self.write("session", b"hello")
+        timing = self.write("other", b"H 0 COLUMNS 80\nO 0.1 2\n"
+                                     b"I 0.1 1\nO 0.2 3\n")
+        states = list(replay.replay(path, "typescript", timing,
+                                    shape=(1, 6)))
+        self.assertEqual(self.displays(states), [["hello"]])
+        self.assertAlmostEqual(states[0]["time"], 0.3)
+
+    def test_bad_timing(self):
+        path = self.write("session", b"hello")
+        self.write("session.timing", b"0.1 nope\n")
+        self.assertRaises(ValueError, list, replay.replay(path))
+
+    def test_asciicast(self):
+        path = self.asciicast("a.cast", [[0.5, "o", u"caf\xe9 "],
+                                         [0.7, "i", "x"],
+                                         [1.5, "o", "\x1b[1mok"]])
+        self.assertEqual(replay.detect(path), "asciicast")
+        states = list(replay.replay(path, every=1, attributes=True))
+        self.assertEqual(len(states), 2)
+        self.assertEqual(states[0]["size"], [3, 10])
+        self.assertEqual(self.displays(states),
+                         [[u"caf\xe9", "", ""], [u"caf\xe9 ok", "", ""]])
+        self.assertEqual(states[1]["attributes"][0][6],
+                         [["bold"], "default", "default"])
+
+    def test_many(self):
+        paths = [self.write("%d.log" % i, ("#%d" % i).encode("ascii"))
+                 for i in range(5)]
+        paths.append(self.asciicast("bad.cast", [])[:-4] + "missing")
+        results = dict((path, (states, error)) for path, states, error in
+                       replay.replay_many(paths, workers=2, shape=(1, 4)))
+
+        self.assertEqual(sorted(results), sorted(paths))
+        for i, path in enumerate(paths[:5]):
+            states, error = results[path]
+            self.assertEqual(error, None)
+            self.assertEqual(self.displays(states), [["#%d" % i]])
+        states, error = results[paths[5]]
+        self.assertEqual(states, None)
+        self.assertTrue(error.startswith("FileNotFoundError"), error)
+
+    def test_main(self):
+        path = self.write("a.log", b"hi")
+        out, sys.stdout = sys.stdout, io.StringIO()
+        try:
+            status = replay.main(["-j", "1", "--size", "1x3", path])
+            lines = sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = out
+
+        self.assertEqual(status, 0)
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"path": path, "size": [1, 3], "cursor": [2, 0],
+                           "display": ["hi "], "time": None, "offset": 2}])
+
+@unittest.skipIf(sys.version_info[0] < 3, "vt102.replay needs Python 3")
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+        # Output with escapes and multibyte characters everywhere, so that
+        # keyframes land in the middle of both.
+        rng = random.Random(16)
+        pieces = [u"h\xe9llo w\xf6rld ", u"\x1b[1;31m", u"\x1b[0m",
+                  u"\r\n", u"\x1b[5;3H", u"\x1b[2;4r", u"\x1b[r",
+                  u"\x1b7", u"\x1b8", u"\x1bM", u"\x1b(0lqk\x1b(B",
+                  u"\x0e\x0f", u"\x1b[K", u"\x1bH", u"\x1b[4h",
+                  u"\x1b[4l", u"\t"]
+        self.text = u"".join(rng.choice(pieces) for _ in range(3000))
+        self.data = self.text.encode("utf-8")
+        self.path = os.path.join(self.dir, "session.log")
+        with open(self.path, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def expected(self, data):
+        p = replay.player((6, 20))
+        p.feed(data)
+        return p
+
+    def assertSamePlayer(self, a, b):
+        self.assertEqual(a.screen.display, b.screen.display)
+        self.assertEqual(a.screen.attributes, b.screen.attributes)
+        self.assertEqual(a.screen.cursor(), b.screen.cursor())
+        self.assertEqual(a.screen.cursor_attributes,
+                         b.screen.cursor_attributes)
+        self.assertEqual(a.screen.margins, b.screen.margins)
+        self.assertEqual((a.screen.g0, a.screen.g1,
+                          a.screen.current_charset),
+                         (b.screen.g0, b.screen.g1,
+                          b.screen.current_charset))
+        self.assertEqual(a.screen.tabstops, b.screen.tabstops)
+        self.assertEqual(a.screen.cursor_save_stack,
+                         b.screen.cursor_save_stack)
+        self.assertEqual(a.stream.state, b.stream.state)
+
+        # Whatever the parser was in the middle of carries on the same.
+        a.feed(b"x\x1b[7my")
+        b.feed(b"x\x1b[7my")
+        self.assertEqual(a.screen.display, b.screen.display)
+
+    def test_seek_offset(self):
+        i = replay.index.build(self.path, shape=(6, 20), every_bytes=1000)
+        self.assertTrue(len(i) > len(self.data) // 1000)
+
+        rng = random.Random(2)
+        for offset in [0, 1, 999, 1000, len(self.data)] + \
+                [rng.randrange(len(self.data)) for _ in range(30)]:
+            self.assertSamePlayer(i.seek(offset=offset),
+                                  self.expected(self.data[:offset]))
+
+    def test_save_and_load(self):
+        i = replay.index.build(self.path, shape=(6, 20), every_bytes=500)
+        filename = os.path.join(self.dir, "session.idx")
+        i.save(filename)
+        self.assertTrue(os.path.getsize(filename) < len(self.data))
+
+        loaded = replay.index.load(filename)
+        self.assertEqual(len(loaded), len(i))
+        for offset in range(0, len(self.data), 777):
+            self.assertSamePlayer(loaded.seek(offset=offset),
+                                  self.expected(self.data[:offset]))
+
+    def test_not_an_index(self):
+        self.assertRaises(ValueError, replay.index.load, self.path)
+
+    def test_seek_time(self):
+        # A typescript with output every tenth of a second.
+        lines = []
+        offset = 0
+        while offset < len(self.data):
+            lines.append(("0.1 %d\n" % min(100, len(self.data) - offset))
+                         .encode("ascii"))
+            offset += 100
+        with open(self.path + ".timing", "wb") as f:
+            f.writelines(lines)
+
+        i = replay.index.build(self.path, shape=(6, 20), every=3)
+        self.assertEqual(i.format, "typescript")
+        # Times are added up from the timing file, so stay clear of the
+        # exact times output happened.
+        for time in [0, 0.05, 2.95, 3.05, 7.33, len(lines)]:
+            count = int(time * 10)
+            self.assertSamePlayer(i.seek(time=time),
+                                  self.expected(self.data[:count * 100]))
+
+    def test_asciicast(self):
+        path = os.path.join(self.dir, "session.cast")
+        with open(path, "w") as f:
+            f.write(json.dumps({"version": 2, "width": 20, "height": 6}))
+            for n in range(0, len(self.text), 50):
+                f.write("\n" + json.dumps([n / 500.0, "o",
+                                           self.text[n:n + 50]]))
+
+        i = replay.index.build(path, every=1)
+        self.assertEqual(i.shape, (6, 20))
+        for time in [0.5, 1.0, 2.345]:
+            count = int(time * 500) // 50 + 1
+            self.assertSamePlayer(i.seek(time=time),
+                                  self.expected(self.text[:count * 50]))
+
+    def test_raw_has_no_times(self):
+        i = replay.index.build(self.path)
+        self.assertRaises(ValueError, i.seek, time=1)
+        self.assertRaises(ValueError, i.seek)
+
+if __name__ == "__main__":
+    unittest.main()
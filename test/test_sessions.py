@@ -0,0 +1,140 @@
+import os
+import sys
+import unittest
+
+from vt102 import screen
+
+if sys.version_info >= (3, 5):
+    from vt102.sessions import manager, read_into
+
+@unittest.skipIf(sys.version_info < (3, 5), "vt102.sessions needs Python 3.5")
+class TestSessions(unittest.TestCase):
+    def setUp(self):
+        self.sessions = manager(bufsize=16)
+        self.writers = []
+
+    def tearDown(self):
+        self.sessions.close()
+        for w in self.writers:
+            try:
+                os.close(w)
+            except OSError:
+                pass
+
+    def add(self, key=None, shape=(2, 10)):
+        r, w = os.pipe()
+        self.writers.append(w)
+        return self.sessions.add(r, screen(shape), key=key), w
+
+    def test_only_ready_sessions_are_read(self):
+        quiet, _ = self.add("quiet")
+        busy, w = self.add("busy")
+
+        os.write(w, b"hello")
+        self.assertEqual(self.sessions.poll(0), [busy])
+        self.assertEqual(busy.screen.display[0], "hello     ")
+        self.assertEqual(quiet.screen.display[0], " " * 10)
+        self.assertEqual(self.sessions.poll(0), [])
+
+    def test_reads_are_bounded(self):
+        s, w = self.add(shape=(4, 10))
+        os.write(w, b"x" * 40)
+
+        self.assertEqual(self.sessions.poll(0), [s])
+        self.assertEqual(s.screen.display[:2],
+                         ("x" * 10, "x" * 6 + "    "))
+        while self.sessions.poll(0):
+            pass
+        self.assertEqual(s.screen.display[:3], ("x" * 10,) * 3)
+
+    def test_split_characters(self):
+        s, w = self.add()
+        data = u"\xe9t\xe9".encode("utf-8")
+        for byte in data:
+            os.write(w, bytes([byte]))
+            self.sessions.poll(0)
+        self.assertEqual(s.screen.display[0], u"\xe9t\xe9       ")
+
+    def test_errors_are_per_session(self):
+        bad, w = self.add("bad")
+        good, v = self.add("good")
+
+        os.write(w, b"\x1b[;5H")
+        os.write(v, b"hello")
+        changed = self.sessions.poll(0)
+        self.assertEqual(sorted(s.key for s in changed), ["bad", "good"])
+        self.assertTrue(isinstance(bad.error, ValueError))
+        self.assertFalse(bad.closed)
+        self.assertFalse("bad" in self.sessions)
+        self.assertEqual(good.error, None)
+        self.assertEqual(good.screen.display[0], "hello     ")
+
+        os.write(v, b"!")
+        self.assertEqual(self.sessions.poll(0), [good])
+        self.assertEqual(good.screen.display[0], "hello!    ")
+        os.close(bad.fd)
+
+    def test_read_into(self):
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+        buffer = bytearray(4)
+        self.assertEqual(read_into(r, buffer), None)
+        os.write(w, b"abcdef")
+        self.assertEqual(read_into(r, buffer), 4)
+        self.assertEqual(read_into(r, buffer), 2)
+        self.assertEqual(buffer, bytearray(b"efcd"))
+        os.close(w)
+        self.assertEqual(read_into(r, buffer), 0)
+        os.close(r)
+
+    def test_lookup(self):
+        s, _ = self.add("a")
+        self.assertTrue("a" in self.sessions)
+        self.assertTrue(self.sessions["a"] is s)
+        self.assertEqual(self.sessions.get("b"), None)
+        self.assertEqual(list(self.sessions), [s])
+        self.assertRaises(KeyError, self.add, "a")
+
+        unnamed, _ = self.add()
+        self.assertEqual(unnamed.key, unnamed.fd)
+
+    def test_remove(self):
+        s, w = self.add("a")
+        self.assertTrue(self.sessions.remove("a", close=True) is s)
+        self.assertFalse("a" in self.sessions)
+        self.assertRaises(OSError, os.fstat, s.fd)
+
+    def test_closed(self):
+        s, w = self.add("a")
+        os.write(w, b"bye")
+        os.close(w)
+
+        self.assertEqual(self.sessions.poll(0), [s])
+        self.assertFalse(s.closed)
+        self.assertEqual(self.sessions.poll(0), [s])
+        self.assertTrue(s.closed)
+        self.assertEqual(len(self.sessions), 0)
+        os.close(s.fd)
+
+    def test_idle(self):
+        old, _ = self.add("old")
+        new, w = self.add("new")
+        old.last_active -= 60
+
+        self.assertEqual(self.sessions.idle(30), [old])
+        os.write(w, b"x")
+        self.sessions.poll(0)
+        self.assertEqual(self.sessions.reap(30), [old])
+        self.assertEqual(list(self.sessions), [new])
+
+    def test_run(self):
+        s, w = self.add()
+        os.write(w, b"done")
+        os.close(w)
+        self.sessions.run(timeout=1)
+        self.assertTrue(s.closed)
+        self.assertEqual(s.screen.display[0], "done      ")
+        os.close(s.fd)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import re
+import signal
+import sys
+import unittest
+
+if sys.version_info >= (3, 5):
+    from vt102.spawn import spawn
+
+def python(code, **kwargs):
+    return spawn([sys.executable, "-c", code], **kwargs)
+
+@unittest.skipIf(sys.version_info < (3, 5), "vt102.spawn needs Python 3.5")
+class TestSpawn(unittest.TestCase):
+    def until(self, p, predicate):
+        while not predicate():
+            self.assertFalse(p.closed, p.screen.display)
+            p.read(5)
+
+    def test_output(self):
+        p = python("print('\\x1b[1mhello')", shape=(2, 10))
+        p.read_all()
+        self.assertEqual(p.screen.display[0], "hello     ")
+        self.assertEqual(p.screen.attributes[0][0],
+                         (("bold",), "default", "default"))
+        self.assertEqual(p.wait(), 0)
+        p.close()
+
+    def test_exit_status(self):
+        p = python("import sys; sys.exit(3)")
+        p.read_all()
+        self.assertEqual(p.wait(), 3)
+        self.assertEqual(p.poll(), 3)
+        p.close()
+
+    def test_killed(self):
+        p = python("import time; time.sleep(10)")
+        p.kill(signal.SIGKILL)
+        self.assertEqual(p.wait(), -signal.SIGKILL)
+        self.assertEqual(p.poll(), -signal.SIGKILL)
+        p.close()
+
+    def test_initial_size(self):
+        p = python("import os; print(tuple(os.get_terminal_size()))",
+                   shape=(7, 33))
+        p.read_all()
+        self.assertTrue("(33, 7)" in p.screen.display[0])
+        p.close()
+
+    def test_resize(self):
+        p = python("import os, signal, sys\n"
+                   "def winch(*args):\n"
+                   "    print(tuple(os.get_terminal_size()))\n"
+                   "    sys.exit()\n"
+                   "signal.signal(signal.SIGWINCH, winch)\n"
+                   "sys.stdout.write('ready\\n')\n"
+                   "sys.stdout.flush()\n"
+                   "signal.pause()\n")
+        self.until(p, lambda: "ready" in p.screen.display[0])
+        p.resize((30, 100))
+        self.assertEqual(p.screen.size, (30, 100))
+        p.read_all()
+        self.assertTrue("(100, 30)" in p.screen.display[1])
+        p.close()
+
+    def test_send_keys(self):
+        p = python("import sys; print(repr(sys.stdin.readline()))",
+                   shape=(4, 40))
+        p.send_keys("ab", "left", "enter")
+        p.read_all()
+        self.assertTrue("'ab\\x1b[D\\n'" in "".join(p.screen.display),
+                        p.screen.display)
+        p.close()
+
+    def test_wait_for(self):
+        p = python("import sys\n"
+                   "print('working')\n"
+                   "sys.stdin.readline()\n"
+                   "print('done: 42')\n"
+                   "sys.stdin.readline()\n", shape=(5, 20))
+        self.assertEqual(p.wait_for("working", timeout=10),
+                         (0, 0, "working"))
+        self.assertEqual(p.wait_for("done", timeout=0.1), None)
+
+        p.send_keys("enter")
+        found = p.wait_for(re.compile(r"done: (\d+)"), timeout=10)
+        self.assertEqual(found.y, 2)
+        self.assertEqual(found.text, "done: 42")
+
+        p.send_keys("enter")
+        self.assertEqual(p.wait_for("never"), None)
+        self.assertTrue(p.closed)
+        p.close()
+
+    def test_close(self):
+        p = python("import time; time.sleep(10)")
+        p.close()
+        self.assertTrue(p.closed)
+        self.assertEqual(p.read(0), 0)
+        self.assertNotEqual(p.wait(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
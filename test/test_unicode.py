@@ -5,6 +5,34 @@ import unittest
 
 from vt102 import *
 
+class TestBytes(unittest.TestCase):
+    # Plain strings are bytes on Python 2, and get decoded like bytes.
+    def test_process_bytes(self):
+        s = stream()
+        sc = screen((1, 4))
+        sc.attach(s)
+        s.process(b"\x1b(0lqk")
+
+        self.assertEqual(sc.display[0], u"\u250c\u2500\u2510 ")
+
+    def test_terminal_process_bytes(self):
+        t = terminal((1, 4))
+        t.process(b"\x1b(0lqk")
+
+        self.assertEqual(t.display[0], u"\u250c\u2500\u2510 ")
+
+    def test_split_memoryview(self):
+        s = stream()
+        sc = screen((1, 4))
+        sc.attach(s)
+        data = memoryview(u"\u0442\u0435".encode("utf-8"))
+        s.feed_bytes(data[:1])
+        s.feed_bytes(data[1:3])
+        self.assertEqual(sc.display[0], u"\u0442   ")
+        s.feed_bytes(data[3:])
+
+        self.assertEqual(sc.display[0], u"\u0442\u0435  ")
+
 if sys.version_info[0] > 2:
     class TestUnicode(unittest.TestCase):
         def test_unicode_input(self):
@@ -17,6 +45,64 @@ if sys.version_info[0] > 2:
 
             self.assertEqual(sc.display[0], u"тест")
 
+        def test_feed_bytes(self):
+            s = stream()
+            sc = screen((2, 4))
+            sc.attach(s)
+
+            s.feed_bytes(u"тест".encode("utf-8"))
+
+            self.assertEqual(sc.display[0], u"тест")
+
+        def test_feed_bytes_split_character(self):
+            s = stream()
+            sc = screen((2, 4))
+            sc.attach(s)
+
+            data = u"тест".encode("utf-8")
+            s.feed_bytes(data[:3])
+            self.assertEqual(sc.display[0], u"т   ")
+
+            s.feed_bytes(bytearray(data[3:5]))
+            self.assertEqual(sc.display[0], u"те  ")
+
+            s.feed_bytes(memoryview(data)[5:])
+            self.assertEqual(sc.display[0], u"тест")
+
+        def test_feed_bytes_replaces_invalid_bytes(self):
+            s = stream()
+            sc = screen((2, 4))
+            sc.attach(s)
+
+            s.feed_bytes(b"a\xffb")
+
+            self.assertEqual(sc.display[0], u"a\ufffdb ")
+
+        def test_feed_bytes_other_encoding(self):
+            s = stream(encoding="utf-16-le")
+            sc = screen((2, 4))
+            sc.attach(s)
+
+            data = u"т\x1b[1;3Hест".encode("utf-16-le")
+            for i in range(len(data)):
+                s.feed_bytes(data[i:i+1])
+
+            self.assertEqual(sc.display[0], u"т ес")
+            self.assertEqual(sc.display[1], u"т   ")
+
+        def test_wide_control_character(self):
+            class extended(stream):
+                basic = dict(stream.basic)
+                basic[0x100] = "wide"
+
+            s = extended()
+            events = []
+            s.add_event_listener("wide", lambda: events.append("wide"))
+            s.add_event_listener("print-run", events.append)
+            s.process(u"a0\u0100b")
+
+            self.assertEqual(events, [u"a0", "wide", u"b"])
+
 if __name__ == "__main__":
     unittest.main()
 
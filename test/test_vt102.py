@@ -1,11 +1,14 @@
+import random
+import re
 import unittest
+import warnings
 
-from vt102 import stream, screen, escape as esc, control as ctrl
+from vt102 import stream, screen, terminal, watcher, escape as esc, control as ctrl
 
 class TestStream(unittest.TestCase):
     def test_docs(self):
         import doctest, vt102
-        doctest.testmod(vt102)
+        self.assertEqual(doctest.testmod(vt102).failed, 0)
 
     class counter:
         def __init__(self):
@@ -117,9 +120,250 @@ class TestStream(unittest.TestCase):
         self.assertEqual(c.count, 1 )
         self.assertEqual(s.state, "stream")
 
+    class recorder(stream):
+        def __init__(self):
+            stream.__init__(self)
+            self.events = []
+
+        def dispatch(self, event, *args):
+            self.events.append((event, args))
+
+    def test_process_matches_consume(self):
+        input = "ab\x1b[1;31mcd\r\n\x1b[2;5H\x1b(0q\x1b[?25hx\x1b7\x08\x09" * 50
+
+        processed = self.recorder()
+        processed.process(input)
+
+        # Consuming one character at a time can only ever see runs of one, so
+        # glue back together runs that came from neighbouring characters.
+        consumed = self.recorder()
+        merged = []
+        gluing = False
+        for char in input:
+            consumed.consume(char)
+            events, consumed.events = consumed.events, []
+            printed = len(events) > 0 and events[0][0] == "print-run"
+            if gluing and printed:
+                run = merged[-1][1][0] + events[0][1][0]
+                merged[-1] = ("print-run", (run,))
+            else:
+                merged.extend(events)
+            gluing = printed
+
+        self.assertEqual(processed.events, merged)
+
+    def test_process_calls_overridden_consume(self):
+        class counted(self.recorder):
+            def __init__(self):
+                super(counted, self).__init__()
+                self.chars = []
+
+            def consume(self, char):
+                self.chars.append(char)
+                super(counted, self).consume(char)
+
+        s = counted()
+        s.process("ab\x1b[1m")
+
+        self.assertEqual(s.chars, list("ab\x1b[1m"))
+        self.assertEqual(s.events, [
+            ("print-run", ("a",)),
+            ("print-run", ("b",)),
+            ("select-graphic-rendition", (1,)),
+        ])
+
+    def test_print_run_gathers_text_between_controls(self):
+        s = self.recorder()
+        s.process("abc\r\ndef\x1b[mgh")
+
+        self.assertEqual(s.events, [
+            ("print-run", ("abc",)),
+            ("carriage-return", ()),
+            ("linefeed", ()),
+            ("print-run", ("def",)),
+            ("select-graphic-rendition", ()),
+            ("print-run", ("gh",)),
+        ])
+
+    def test_print_still_dispatched_per_character(self):
+        s = stream()
+        printed = []
+        s.add_event_listener("print", printed.append)
+        s.process("ab\ncd")
+
+        self.assertEqual(printed, ["a", "b", "c", "d"])
+
+    def test_process_keeps_state_between_chunks(self):
+        s = self.recorder()
+        s.process("\x1b[1")
+        s.process("2;4")
+        self.assertEqual(s.events, [])
+
+        s.process("H")
+        self.assertEqual(s.events, [("cursor-move", (12, 4))])
+        self.assertEqual(s.state, "stream")
+
+    def test_state_names(self):
+        s = stream()
+        self.assertEqual(s.state, "stream")
+
+        s.process("\x1b")
+        self.assertEqual(s.state, "escape")
+        s.process("(")
+        self.assertEqual(s.state, "charset-g0")
+
+        s.state = "mode"
+        s.process("h")
+        self.assertEqual(s.state, "stream")
+
+    def test_subclass_extends_tables(self):
+        class extended(self.recorder):
+            basic = dict(stream.basic)
+            basic[ctrl.DC1] = "xon"
+            sequence = dict(stream.sequence)
+            sequence[ord("n")] = "device-status"
+
+        s = extended()
+        s.process("a" + chr(ctrl.DC1) + "b\x1b[6n")
+
+        self.assertEqual(s.events, [
+            ("print-run", ("a",)),
+            ("xon", ()),
+            ("print-run", ("b",)),
+            ("device-status", (6,)),
+        ])
+
+        # The stock stream isn't affected.
+        s = self.recorder()
+        s.process("a" + chr(ctrl.DC1) + "\x1b[6n")
+        self.assertEqual(s.events, [("print-run", ("a" + chr(ctrl.DC1),))])
+
+    def test_listeners(self):
+        s = stream()
+        calls = []
+        s.process(u"a\r")
+
+        # Listeners added at any point are called, in the order they were
+        # added, whether there's one of them or several.
+        s.add_event_listener("carriage-return", lambda: calls.append(1))
+        s.process(u"\r")
+        s.add_event_listener("carriage-return", lambda: calls.append(2))
+        s.add_event_listener("cursor-up", lambda *args: calls.append(args))
+        s.process(u"\r\x1b[3A\x1b[A")
+        self.assertEqual(calls, [1, 1, 2, (3,), ()])
+
+    def test_listener_called_directly(self):
+        s = stream()
+        listener = lambda: None
+        s.add_event_listener("bell", listener)
+        self.assertTrue(listener in s._slots)
+
+        # A subclass's own dispatch sees every event.
+        s = self.recorder()
+        s.add_event_listener("bell", listener)
+        self.assertFalse(listener in s._slots)
+
+    def test_listener_exception_stops_dispatch(self):
+        s = stream()
+        calls = []
+        def fail(*args):
+            raise ValueError()
+        s.add_event_listener("linefeed", fail)
+        s.add_event_listener("linefeed", lambda: calls.append(1))
+        self.assertRaises(ValueError, s.process, u"\n")
+        self.assertEqual(calls, [])
+
+    def test_dump_and_load(self):
+        s = stream(fail_on_unknown_esc=False, encoding="utf-16-le",
+                   errors="strict")
+        s.feed_bytes(u"\x1b[12;3".encode("utf-16-le") + b"4")
+
+        other = stream()
+        other.load(s.dump())
+        self.assertEqual(other.state, "escape-lb")
+        self.assertEqual((other.params, other.current_param), ([12], "3"))
+        self.assertEqual(other.encoding, "utf-16-le")
+        self.assertFalse(other.fail_on_unknown_esc)
+
+        events = []
+        other.add_event_listener("cursor-move",
+                                 lambda *args: events.append(args))
+        other.feed_bytes(b"\x00H\x00")
+        self.assertEqual(events, [(12, 34)])
+
+    def test_dispatch_without_parser(self):
+        s = stream()
+        calls = []
+        s.add_event_listener("cursor-move", lambda *args: calls.append(args))
+        s.dispatch("cursor-move", 2, 3)
+        s.dispatch("no-such-event", 1)
+        self.assertEqual(calls, [(2, 3)])
+
+    def test_instrument(self):
+        s = stream(fail_on_unknown_esc=False)
+        sc = screen((3, 10))
+        sc.attach(s)
+        s.instrument(sample=1)
+        s.process(u"ab\x1b[1mc\x00\x1b[?25l\x1b[3zd\r\n")
+
+        self.assertEqual(s.stats["events"], {
+            "print-run": 3,
+            "select-graphic-rendition": 1,
+            "carriage-return": 1,
+            "linefeed": 1,
+        })
+        self.assertEqual(s.stats["unknown"], {"CSI 'z'": 1})
+        self.assertEqual(s.stats["ignored"], {"NUL": 1, "CSI ? l": 1})
+        self.assertEqual(s.stats["transitions"]["stream -> escape"], 3)
+        self.assertEqual(s.stats["transitions"]["escape-lb -> mode"], 1)
+        handler = s.stats["handlers"]["screen._print_run"]
+        self.assertEqual(handler["samples"], 3)
+        self.assertEqual(handler["estimated_seconds"], handler["seconds"])
+        self.assertEqual(sc.display[0], "abcd      ")
+
+        s.reset_stats()
+        self.assertEqual(s.stats["events"], {})
+        s.process(u"e")
+        self.assertEqual(s.stats["events"], {"print-run": 1})
+
+    def test_instrument_samples(self):
+        s = stream()
+        screen((3, 10)).attach(s)
+        s.instrument(sample=4)
+        s.process(u"a\r" * 10)
+
+        self.assertEqual(s.stats["events"]["carriage-return"], 10)
+        self.assertEqual(
+            s.stats["handlers"]["screen._carriage_return"]["samples"], 2)
+
+    def test_uninstrument(self):
+        s = stream()
+        s.instrument()
+        s.process(u"a")
+        s.uninstrument()
+
+        # Nothing is left on the instance, so it's back to the plain parser.
+        self.assertFalse("dispatch" in s.__dict__)
+        self.assertTrue(s._table is s._compile()[0])
+        s.process(u"b")
+        self.assertEqual(s.stats["events"], {"print-run": 1})
+
+    def test_instrument_subclass_dispatch(self):
+        s = self.recorder()
+        s.instrument(sample=1)
+        s.process(u"a\r")
+
+        self.assertEqual(s.events, [("print-run", ("a",)),
+                                    ("carriage-return", ())])
+        self.assertEqual(sorted(s.stats["handlers"]),
+                         ["recorder.dispatch('carriage-return')",
+                          "recorder.dispatch('print-run')"])
+
 class TestScreen(unittest.TestCase):
+    screen = screen
+
     def test_remove_non_existant_attribute(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes]] * 2
         s._remove_text_attr("underline")
@@ -127,7 +371,7 @@ class TestScreen(unittest.TestCase):
                                  s.default_attributes]] * 2
 
     def test_attributes(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes]] * 2
         s._select_graphic_rendition(1) # Bold
@@ -144,7 +388,7 @@ class TestScreen(unittest.TestCase):
         ]
 
     def test_colors(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes]] * 2
         s._select_graphic_rendition(30) # black foreground
@@ -155,7 +399,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.cursor_attributes, ((), "red", "black"))
 
     def test_reset_resets_colors(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes]] * 2
         s._select_graphic_rendition(30) # black foreground
@@ -165,7 +409,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.cursor_attributes, s.default_attributes)
 
     def test_multi_attribs(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes]] * 2
         s._select_graphic_rendition(1) # Bold
@@ -175,7 +419,7 @@ class TestScreen(unittest.TestCase):
                 s.cursor_attributes == (("blink", "bold"), "default", "default")
 
     def test_attributes_reset(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes]] * 2
         s._select_graphic_rendition(1) # Bold
@@ -195,39 +439,302 @@ class TestScreen(unittest.TestCase):
             [(("bold",), "default", "default"), s.default_attributes],
         ]
 
+    def test_attributes_are_interned(self):
+        s = self.screen((2,2))
+        s._select_graphic_rendition(5, 1, 31)
+        s._print("a")
+
+        other = self.screen((2,2))
+        other._select_graphic_rendition(31, 1, 5)
+
+        self.assertEqual(s.cursor_attributes,
+                         (("blink", "bold"), "red", "default"))
+        self.assertTrue(other.cursor_attributes is s.cursor_attributes)
+        self.assertEqual(s._rows[0].attrs[0], other._cursor_id)
+        self.assertEqual(s._rows[0].attrs.typecode, "H")
+
+    def test_palette(self):
+        from vt102 import palette
+
+        p = palette()
+        bold = p.intern((("bold", "underline"), "red", "default"))
+        self.assertEqual(p.intern((("underline", "bold"), "red", "default")),
+                         bold)
+        self.assertNotEqual(p.intern(screen.default_attributes), bold)
+        self.assertEqual(p[bold], (("bold", "underline"), "red", "default"))
+        self.assertEqual(len(p), 2)
+
+    def test_palette_transitions(self):
+        from vt102 import palette as fresh
+
+        class own(self.screen):
+            palette = fresh()
+
+        s = own((1, 1))
+        s._select_graphic_rendition(1, 31)
+        s._select_graphic_rendition(0)
+        s._select_graphic_rendition(1, 31)
+        self.assertEqual(len(s.palette.transitions), 2)
+
+        # Attributes that don't mean anything aren't remembered.
+        s._select_graphic_rendition(*range(100, 2000))
+        self.assertEqual(len(s.palette.transitions), 2)
+        self.assertEqual(s.cursor_attributes, (("bold",), "red", "default"))
+
+    def test_palette_transitions_per_class(self):
+        class underlining(self.screen):
+            def _text_attr(self, attr):
+                super(underlining, self)._text_attr(4)
+
+        plain = self.screen((1, 1))
+        odd = underlining((1, 1))
+        self.assertTrue(odd.palette is plain.palette)
+
+        odd._select_graphic_rendition(1)
+        plain._select_graphic_rendition(1)
+        self.assertEqual(odd.cursor_attributes,
+                         (("underline",), "default", "default"))
+        self.assertEqual(plain.cursor_attributes,
+                         (("bold",), "default", "default"))
+
     def test_resize(self):
-        s = screen((2,2))
-        assert s.display == ["  ", "  "]
+        s = self.screen((2,2))
+        assert s.display == ("  ", "  ")
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes]] * 2
 
         s.resize((3,3))
-        self.assertEqual(s.display, ["   ", "   ", "   "])
+        self.assertEqual(s.display, ("   ", "   ", "   "))
         assert s.attributes == [[s.default_attributes,
                                  s.default_attributes,
                                  s.default_attributes]] * 3
 
     def test_print(self):
-        s = screen((3,3))
+        s = self.screen((3,3))
         s._print("s")
 
-        self.assertEqual(s.display, ["s  ", "   ", "   "])
+        self.assertEqual(s.display, ("s  ", "   ", "   "))
         self.assertEqual(s.cursor(), (1, 0))
 
         s.x = 1; s.y = 1
         s._print("a")
 
-        self.assertEqual(s.display, ["s  ", " a ", "   "])
+        self.assertEqual(s.display, ("s  ", " a ", "   "))
+
+    def test_print_run(self):
+        s = self.screen((3,3))
+        s._print_run("sam")
+
+        self.assertEqual(s.display, ("sam", "   ", "   "))
+        self.assertEqual(s.cursor(), (0, 1))
+
+        s.x = 1
+        s._print_run("is foo!")
+
+        self.assertEqual(s.display, ("sam", " is", " fo", "o! ")[1:])
+        self.assertEqual(s.cursor(), (2, 2))
+
+    def test_print_override(self):
+        class shouting(self.screen):
+            def _print(self, char):
+                super(shouting, self)._print(char.upper())
+
+        st = stream()
+        s = shouting((1, 5))
+        s.attach(st)
+        st.process(u"abc")
+        self.assertEqual(s.display, ("ABC  ",))
+
+    def test_print_run_attributes(self):
+        s = self.screen((2,3))
+        s._select_graphic_rendition(1) # Bold
+        s.x = 2
+        s._print_run("ab")
+
+        bold = (("bold",), "default", "default")
+        self.assertEqual(s.attributes, [
+            [s.default_attributes, s.default_attributes, bold],
+            [bold, s.default_attributes, s.default_attributes],
+        ])
+
+    def test_display_rows_are_cached(self):
+        s = self.screen((3,3))
+        s._print_run("sam")
+        before = s.display
+
+        s.y = 2
+        s._print("x")
+        after = s.display
+
+        self.assertEqual(after, ("sam", "   ", "x  "))
+        self.assertTrue(after[0] is before[0])
+        self.assertFalse(after[2] is before[2])
+
+        # What's handed out can't be changed in place.
+        with self.assertRaises(TypeError):
+            s.display[0] = "foo"
+        self.assertEqual(s.display[0], "sam")
+
+    def test_decoder_is_deprecated(self):
+        s = self.screen((1, 1))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            decode = s.decoder
+
+        self.assertEqual(decode(b"ok")[0], u"ok")
+        self.assertEqual([w.category for w in caught], [DeprecationWarning])
+
+    def test_scrolling_moves_attributes(self):
+        s = self.screen((2,2))
+        s._select_graphic_rendition(1) # Bold
+        s.y = 1
+        # Wrapping off the last column of the last row scrolls.
+        s._print_run("ab")
+
+        bold = (("bold",), "default", "default")
+        self.assertEqual(s.display, ("ab", "  "))
+        self.assertEqual(s.attributes, [
+            [bold, bold],
+            [s.default_attributes, s.default_attributes],
+        ])
+
+    def test_damage(self):
+        s = self.screen((3,5))
+        self.assertEqual(s.consume_damage(), ({}, None))
+
+        s.x = 1
+        s._print_run("ab")
+        s.y = 2
+        s._erase_in_line(1)
+
+        damage = s.consume_damage()
+        self.assertEqual(damage.rows, {0: (1, 3), 2: (0, 4)})
+        self.assertEqual(damage.cursor, (3, 2))
+
+        # Consuming resets it.
+        self.assertEqual(s.consume_damage(), ({}, None))
+
+        # Spans in the same row are merged.
+        s._home()
+        s._print("x")
+        s.x = 4
+        s._print("y")
+        self.assertEqual(s.consume_damage().rows, {0: (0, 5)})
+
+    def test_damage_cursor_only(self):
+        s = self.screen((3,3))
+        s._cursor_position(2, 2)
+        self.assertEqual(s.consume_damage(), ({}, (1, 1)))
+
+        # Moving away and back again isn't a move.
+        s._cursor_down()
+        s._cursor_up()
+        self.assertEqual(s.consume_damage(), ({}, None))
+
+    def test_damage_scroll(self):
+        s = self.screen((3,3))
+        s.y = 2
+        s._index()
+
+        self.assertEqual(s.consume_damage().rows,
+                         {0: (0, 3), 1: (0, 3), 2: (0, 3)})
+
+        s.y = 1
+        s._insert_line()
+        self.assertEqual(s.consume_damage().rows, {2: (0, 3)})
+
+    def test_history(self):
+        s = self.screen((2,3), history=3)
+        s.display = ["ab ", "cd "]
+        s.y = 1
+        for line in ("ef", "gh", "ij"):
+            s._linefeed()
+            s._print_run(line)
+
+        self.assertEqual(s.display, ("gh ", "ij "))
+        self.assertEqual(list(s.history), ["ab ", "cd ", "ef "])
+        self.assertEqual(s.history[-1], "ef ")
+
+        s._index()
+        self.assertEqual(list(s.history), ["cd ", "ef ", "gh "])
+
+    def test_history_bytes(self):
+        from vt102 import scrollback
+
+        s = self.screen((1,3), history=scrollback(lines=None, bytes=5))
+        for line in (u"ab", u"\u00e9", u"c"):
+            s._print_run(line)
+            s._linefeed()
+
+        # "ab " is 3 bytes, "\u00e9  " is 4, "c  " is 3.
+        self.assertEqual(list(s.history), [u"c  "])
+        self.assertEqual(s.history.size(), 3)
+
+    def test_history_off_by_default(self):
+        s = self.screen((1,2))
+        s._print_run("abcd")
+
+        self.assertEqual(len(s.history), 0)
+
+    def test_history_attributes(self):
+        s = self.screen((1,2), history=1)
+        s._select_graphic_rendition(4)
+        s._print_run("ab")
+
+        underline = (("underline",), "default", "default")
+        self.assertEqual(s.history.attributes(0, s.palette),
+                         [underline, underline])
+
+    def test_snapshot(self):
+        s = self.screen((3,3))
+        s._select_graphic_rendition(1) # Bold
+        s._print_run("sam")
+        first = s.snapshot()
+
+        s._select_graphic_rendition(0)
+        s._print_run("is")
+        second = s.snapshot()
+
+        bold = (("bold",), "default", "default")
+        self.assertEqual(first.display, ("sam", "   ", "   "))
+        self.assertEqual(first.attributes[0], [bold] * 3)
+        self.assertEqual(first.cursor(), (0, 1))
+        self.assertEqual(first.cursor_attributes, bold)
+        self.assertEqual(second.display, ("sam", "is ", "   "))
+        self.assertEqual(second.cursor(), (2, 1))
+
+        # Rows that didn't change between snapshots are shared, rows that
+        # did aren't.
+        self.assertTrue(first._rows[0] is second._rows[0])
+        self.assertTrue(first._rows[2] is second._rows[2])
+        self.assertFalse(first._rows[1] is second._rows[1])
+
+    def test_snapshot_survives_scroll_and_erase(self):
+        s = self.screen((2,2))
+        s.display = ["ab", "cd"]
+        frame = s.snapshot()
+
+        s.y = 1
+        s._index()
+        s._erase_in_line(2)
+        s._home()
+        s._delete_character(1)
+        s.attributes = [[((), "red", "default")] * 2] * 2
+
+        self.assertEqual(frame.display, ("ab", "cd"))
+        self.assertEqual(frame.attributes,
+                         [[s.default_attributes] * 2] * 2)
+        self.assertEqual(s.display, ("d ", "  "))
 
     def test_carriage_return(self):
-        s = screen((3,3))
+        s = self.screen((3,3))
         s.x = 2
         s._carriage_return()
         
         self.assertEqual(s.x, 0)
 
     def test_index(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         s.display = ["bo", "sh"]
         s.x = 1
         s._index()
@@ -241,11 +748,11 @@ class TestScreen(unittest.TestCase):
 
         # Indexing on the last row should push everything up and create a new
         # row at the bottom.
-        self.assertEqual(s.display, ["sh", "  "])
+        self.assertEqual(s.display, ("sh", "  "))
         self.assertEqual(s.y, 1)
 
     def test_reverse_index(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         s.display = ["bo", "sh"]
         s.x = 1
         s._reverse_index()
@@ -254,18 +761,18 @@ class TestScreen(unittest.TestCase):
         # new row at the top.
         self.assertEqual(s.y, 0 )
         self.assertEqual(s.x, 1)
-        self.assertEqual(s.display, ["  ", "bo"])
+        self.assertEqual(s.display, ("  ", "bo"))
 
         s.y = 1
         s._reverse_index()
 
-        self.assertEqual(s.display, ["  ", "bo"])
+        self.assertEqual(s.display, ("  ", "bo"))
         self.assertEqual(s.y, 0 )
 
     def test_line_feed(self):
         # Line feeds are the same as indexes, except they move the cursor to
         # the first character on the created/next line
-        s = screen((2,2))
+        s = self.screen((2,2))
         s.display = ["bo", "sh"]
         s.x = 1; s.y = 0
         s._linefeed()
@@ -274,7 +781,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.y, 1)
 
     def test_tabstops(self):
-        s = screen((10,10))
+        s = self.screen((10,10))
         s.x = 1
         s._set_tab_stop()
         s.x = 8
@@ -291,7 +798,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.x, 9)
 
     def test_clear_tabstops(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
         s.x = 1
         s._set_tab_stop()
         s._clear_tab_stop(0x30)
@@ -312,23 +819,23 @@ class TestScreen(unittest.TestCase):
 
     def test_resize_shifts_horizontal(self):
         # If the current display is thinner than the requested size...
-        s = screen((2,2))
+        s = self.screen((2,2))
         s.display = ["bo", "sh"]
         # New columns should get added to the right.
         s.resize((2,3))
 
-        self.assertEqual(s.display, ["bo ", "sh "])
+        self.assertEqual(s.display, ("bo ", "sh "))
 
         # If the current display is wider than the requested size...
-        s = screen((2,2))
+        s = self.screen((2,2))
         s.display = ["bo", "sh"]
         # Columns should be removed from the right...
         s.resize((2, 1))
 
-        self.assertEqual(s.display, ["b", "s"])
+        self.assertEqual(s.display, ("b", "s"))
 
     def test_backspace(self):
-        s = screen((2,2))
+        s = self.screen((2,2))
         self.assertEqual(s.x, 0)
         s._backspace()
         self.assertEqual(s.x, 0)
@@ -337,7 +844,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.x, 0)
 
     def test_save_cursor(self):
-        s = screen((10,10))
+        s = self.screen((10,10))
         s._save_cursor()
 
         s.x = 3
@@ -356,7 +863,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.y, 0)
 
     def test_restore_cursor_with_none_saved(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
         s.x = 5
         s.y = 5
         s._restore_cursor()
@@ -365,7 +872,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.y, 5)
 
     def test_insert_line(self):
-        s = screen((3,3))
+        s = self.screen((3,3))
         s.display = ["sam", "is ", "   "]
 
         self.assertEqual(s.x, 0)
@@ -373,7 +880,7 @@ class TestScreen(unittest.TestCase):
 
         s._insert_line(1)
 
-        self.assertEqual(s.display, ["sam", "   ", "is "])
+        self.assertEqual(s.display, ("sam", "   ", "is "))
 
         self.assertEqual(s.x, 0)
         self.assertEqual(s.y, 0)
@@ -381,25 +888,110 @@ class TestScreen(unittest.TestCase):
         s.display = ["sam", "is ", "foo"]
         s._insert_line(2)
 
-        self.assertEqual(s.display, ["sam", "   ", "   "])
+        self.assertEqual(s.display, ("sam", "   ", "   "))
+
+    def test_delete_line(self):
+        s = self.screen((4,3))
+        s.display = ["sam", "is ", "foo", "bar"]
+        s.y = 1
+        s._delete_line(2)
+
+        self.assertEqual(s.display, ("sam", "bar", "   ", "   "))
+        self.assertEqual(s.y, 1)
+
+    def test_set_margins(self):
+        s = self.screen((5,3))
+        s.x = s.y = 2
+        s._set_margins(2, 4)
+
+        self.assertEqual(s.margins, (1, 3))
+        self.assertEqual(s.cursor(), (0, 0))
+
+        # Regions of less than two rows are ignored.
+        s._set_margins(3, 3)
+        self.assertEqual(s.margins, (1, 3))
+
+        # No arguments is the whole screen.
+        s._set_margins()
+        self.assertEqual(s.margins, (0, 4))
+
+    def test_index_in_margins(self):
+        s = self.screen((5,3), history=10)
+        s.display = ["a  ", "b  ", "c  ", "d  ", "e  "]
+        s._set_margins(2, 4)
+        s.y = 3
+        s._index()
+
+        self.assertEqual(s.display, ("a  ", "c  ", "d  ", "   ", "e  "))
+        self.assertEqual(s.y, 3)
+        # Only scrolling off the top of the screen keeps history.
+        self.assertEqual(len(s.history), 0)
+
+        # Below the region the cursor moves down, but never scrolls.
+        s.y = 4
+        s._index()
+        self.assertEqual(s.display, ("a  ", "c  ", "d  ", "   ", "e  "))
+        self.assertEqual(s.y, 4)
+
+        s._set_margins(1, 2)
+        s.y = 1
+        s._index()
+        self.assertEqual(s.display, ("c  ", "   ", "d  ", "   ", "e  "))
+        self.assertEqual(list(s.history), ["a  "])
+
+    def test_reverse_index_in_margins(self):
+        s = self.screen((5,3))
+        s.display = ["a  ", "b  ", "c  ", "d  ", "e  "]
+        s._set_margins(2, 4)
+        s.y = 1
+        s._reverse_index()
+
+        self.assertEqual(s.display, ("a  ", "   ", "b  ", "c  ", "e  "))
+        self.assertEqual(s.y, 1)
+
+    def test_insert_delete_line_in_margins(self):
+        s = self.screen((5,3))
+        s.display = ["a  ", "b  ", "c  ", "d  ", "e  "]
+        s._set_margins(2, 4)
+        s.y = 1
+        s._insert_line(1)
+
+        self.assertEqual(s.display, ("a  ", "b  ", "   ", "c  ", "e  "))
+
+        s._delete_line(1)
+        self.assertEqual(s.display, ("a  ", "   ", "c  ", "   ", "e  "))
+
+        # Outside the region nothing happens.
+        s.y = 4
+        s._insert_line(1)
+        s._delete_line(1)
+        self.assertEqual(s.display, ("a  ", "   ", "c  ", "   ", "e  "))
+
+    def test_margins_from_stream(self):
+        st = stream()
+        s = self.screen((4,3))
+        s.attach(st)
+        st.process("a\r\nb\r\nc\r\nd\x1b[2;3r\x1b[3;1H\nx")
+
+        self.assertEqual(s.display, ("a  ", "c  ", "x  ", "d  "))
 
     def test_delete_characters(self):
-        s = screen((3,3))
+        s = self.screen((3,3))
         s.display = ["sam", "is ", "foo"]
         s.x = 0
         s.y = 0
         s._delete_character(2)
 
-        self.assertEqual(s.display, ["m  ", "is ", "foo"])
+        self.assertEqual(s.display, ("m  ", "is ", "foo"))
 
         s.y = 2
         s.x = 2
         s._delete_character(1)
 
-        self.assertEqual(s.display, ["m  ", "is ", "fo "])
+        self.assertEqual(s.display, ("m  ", "is ", "fo "))
 
     def test_erase_in_line(self):
-        s = screen((5,5))
+        s = self.screen((5,5))
         s.display = ["sam i", 
                      "s foo", 
                      "but a", 
@@ -410,11 +1002,11 @@ class TestScreen(unittest.TestCase):
 
         # Erase from cursor to the end of line
         s._erase_in_line(0)
-        assert s.display == ["sa   ",
+        assert s.display == ("sa   ",
                              "s foo", 
                              "but a", 
                              "re yo", 
-                             "u?   "]
+                             "u?   ")
 
         # Erase from the beginning of the line to the cursor
         s.display = ["sam i", 
@@ -423,11 +1015,11 @@ class TestScreen(unittest.TestCase):
                      "re yo", 
                      "u?   "]
         s._erase_in_line(1)
-        assert s.display == ["    i",
+        assert s.display == ("    i",
                              "s foo", 
                              "but a", 
                              "re yo", 
-                             "u?   "]
+                             "u?   ")
 
         s.y = 1
         # Erase the entire line
@@ -437,14 +1029,14 @@ class TestScreen(unittest.TestCase):
                      "re yo", 
                      "u?   "]
         s._erase_in_line(2)
-        assert s.display == ["sam i",
+        assert s.display == ("sam i",
                              "     ", 
                              "but a", 
                              "re yo", 
-                             "u?   "]
+                             "u?   ")
 
     def test_erase_in_display(self):
-        s = screen((5,5))
+        s = self.screen((5,5))
         s.display = ["sam i", 
                      "s foo", 
                      "but a", 
@@ -454,11 +1046,11 @@ class TestScreen(unittest.TestCase):
 
         # Erase from the cursor to the end of the display.
         s._erase_in_display(0)
-        assert s.display == ["sam i",
+        assert s.display == ("sam i",
                              "s foo", 
                              "     ", 
                              "     ", 
-                             "     "]
+                             "     ")
 
         # Erase from cursor to the beginning of the display. 
         s.display = ["sam i", 
@@ -467,23 +1059,23 @@ class TestScreen(unittest.TestCase):
                      "re yo", 
                      "u?   "]
         s._erase_in_display(1)
-        assert s.display == ["     ",
+        assert s.display == ("     ",
                              "     ", 
                              "     ", 
                              "re yo", 
-                             "u?   "]
+                             "u?   ")
 
         s.y = 1
         # Erase the entire screen
         s._erase_in_display(2)
-        assert s.display == ["     ",
+        assert s.display == ("     ",
                              "     ", 
                              "     ", 
                              "     ", 
-                             "     "]
+                             "     ")
 
     def test_cursor_up(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
 
         # Moving the cursor up at the top doesn't do anything
         s._cursor_up(1)
@@ -501,7 +1093,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.y, 2)
 
     def test_cursor_down(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
 
         # Moving the cursor down at the bottom doesn't do anything
         s.y = 9
@@ -520,7 +1112,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.y, 8)
 
     def test_cursor_back(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
 
         # Moving the cursor left at the margin doesn't do anything
         s.x = 0 
@@ -539,7 +1131,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.x, 2)
 
     def test_cursor_forward(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
 
         # Moving the cursor right at the margin doesn't do anything
         s.x = 9 
@@ -557,7 +1149,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.x, 8 )
 
     def test_cursor_position(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
 
         # Rows/columns are backwards of x/y and are 1-indexed instead of 0-indexed
         s._cursor_position(5, 10)
@@ -576,7 +1168,7 @@ class TestScreen(unittest.TestCase):
         self.assertEqual(s.y, 9)
 
     def test_home(self):
-        s = screen((10, 10))
+        s = self.screen((10, 10))
         s.x = 5
         s.y = 5
         s._home()
@@ -586,20 +1178,307 @@ class TestScreen(unittest.TestCase):
 
     def test_resize_shifts_vertical(self):
         # If the current display is shorter than the requested screen size... 
-        s = screen((2,2))
+        s = self.screen((2,2))
         s.display = ["bo", "sh"]
         # New rows should get added on the bottom...
         s.resize((3,2))
 
-        self.assertEqual(s.display, ["bo", "sh", "  "])
+        self.assertEqual(s.display, ("bo", "sh", "  "))
 
         # If the current display is taller than the requested screen size...
-        s = screen((2,2))
+        s = self.screen((2,2))
         s.display = ["bo", "sh"]
         # Rows should be removed from the top...
         s.resize((1,2))
 
-        self.assertEqual(s.display, ["sh"])
+        self.assertEqual(s.display, ("sh",))
+
+    def test_find(self):
+        s = self.screen((3, 10))
+        s.display = ["one two   ", " " * 10, "two       "]
+
+        self.assertEqual(list(s.finditer("t\\w+")),
+                         [(0, 4, "two"), (2, 0, "two")])
+        self.assertEqual(s.find("o"), (0, 0, "o"))
+        self.assertEqual(s.find("three"), None)
+
+        # Rows are searched on their own, blanks and all.
+        self.assertEqual(s.find("two +$").x, 4)
+        self.assertEqual(s.find("two +one"), None)
+
+    def test_find_after_changes(self):
+        s = self.screen((2, 5))
+        pattern = re.compile("ab")
+        self.assertEqual(list(s.finditer(pattern)), [])
+
+        s._print_run("ab")
+        self.assertEqual(list(s.finditer(pattern)), [(0, 0, "ab")])
+        before = s.snapshot()
+        s._cursor_position(1, 2)
+        s._print_run("c")
+        self.assertEqual(list(s.finditer(pattern)), [])
+        self.assertEqual(s.find("ac"), (0, 0, "ac"))
+        self.assertEqual(before.display[0], "ab   ")
+
+    def test_find_history(self):
+        from vt102 import scrollback
+
+        s = self.screen((2, 3), history=scrollback(lines=3))
+        for line in "abcdef":
+            s._print_run(line)
+            s._carriage_return()
+            s._linefeed()
+            if line == "c":
+                self.assertEqual(list(s.finditer("[a-z]")),
+                                 [(-2, 0, "a"), (-1, 0, "b"), (0, 0, "c")])
+
+        # "a" and "b" have been dropped, and lines found earlier have moved
+        # further back.
+        self.assertEqual(list(s.finditer("[a-z]")),
+                         [(-3, 0, "c"), (-2, 0, "d"), (-1, 0, "e"),
+                          (0, 0, "f")])
+        self.assertEqual(list(s.finditer("[a-z]", history=False)),
+                         [(0, 0, "f")])
+
+        s.history.clear()
+        self.assertEqual(list(s.finditer("[a-z]")), [(0, 0, "f")])
+
+    def test_lines(self):
+        from vt102 import scrollback
+
+        s = self.screen((2, 4), history=scrollback(lines=3))
+        for line in ["ab", "c d", "e"]:
+            s._print_run(line)
+            s._carriage_return()
+            s._linefeed()
+
+        self.assertEqual(s.lines(), ["e", ""])
+        self.assertEqual(s.lines(trim=False), ["e   ", "    "])
+        self.assertEqual(s.lines(-2), ["ab", "c d", "e", ""])
+        self.assertEqual(s.lines(-10, 1), ["ab", "c d", "e"])
+        self.assertEqual(s.lines(-2, -1), ["ab"])
+        self.assertEqual(s.lines(1, 1), [])
+        self.assertEqual(s.text(-2), "ab\nc d\ne")
+        self.assertEqual(s.text(-2, trim=False), "ab  \nc d \ne   \n    ")
+
+    def test_lines_after_changes(self):
+        s = self.screen((2, 4))
+        s._print_run("abc")
+        before = s.lines()
+        self.assertTrue(s.lines()[0] is before[0])
+
+        s._cursor_position(2, 1)
+        s._print_run("x")
+        after = s.lines()
+        self.assertEqual(after, ["abc", "x"])
+        self.assertTrue(after[0] is before[0])
+
+        s._cursor_position(1, 2)
+        s._erase_in_line(0)
+        self.assertEqual(s.lines(), ["a", "x"])
+        self.assertEqual(s.text(), "a\nx")
+
+    def test_watcher(self):
+        s = self.screen((3, 6))
+        w = watcher(s, re.compile(r"\d+"))
+        self.assertEqual(w.check(), None)
+
+        s._print_run("ab 12")
+        self.assertEqual(w.check(), (0, 3, "12"))
+        s._cursor_position(3, 1)
+        s._print_run("7")
+        self.assertEqual(w.check(), (0, 3, "12"))
+
+        # Rows moving count as changing.
+        s._scroll_up(0, 2)
+        self.assertEqual(w.check(), (1, 0, "7"))
+        s._erase_in_display(2)
+        self.assertEqual(w.check(), None)
+
+    def test_watcher_region(self):
+        s = self.screen((3, 6))
+        s.display = ["a.b   ", "  a.b ", "a.b   "]
+
+        # Strings are looked for as they are.
+        self.assertEqual(watcher(s, "a.b", (1, 0, 3, 6)).check(),
+                         (1, 2, "a.b"))
+        self.assertEqual(watcher(s, "a.b", (0, 0, 3, 4)).check(),
+                         (0, 0, "a.b"))
+        self.assertEqual(watcher(s, "a.b", (0, 1, 3, 4)).check(), None)
+        self.assertEqual(watcher(s, "axb").check(), None)
+
+    def test_dump_and_load(self):
+        from vt102 import scrollback
+
+        s = self.screen((4, 12), history=scrollback(lines=5, bytes=100))
+        s._print_run("old")
+        s._cursor_position(4, 1)
+        s._index()
+        s._cursor_position(2, 3)
+        s._select_graphic_rendition(1, 31, 44)
+        s._print_run("red      and")
+        s._select_graphic_rendition(0)
+        s._print_run("x")
+        s._select_graphic_rendition(4)
+        s._cursor_position(4, 9)
+        s._set_tab_stop()
+        s._save_cursor()
+        s._cursor_position(3, 2)
+        s._set_margins(2, 4)
+        s._charset_g1("0")
+        s._shift_out()
+        s.irm = "replace"
+        s._print_run(u"\xe9")
+
+        for history in (False, True):
+            other = self.screen((1, 1))
+            other.load(s.dump(history=history))
+            self.assertEqual(other.size, s.size)
+            self.assertEqual(other.display, s.display)
+            self.assertEqual(other.attributes, s.attributes)
+            self.assertEqual(other.cursor(), s.cursor())
+            self.assertEqual(other.cursor_attributes, s.cursor_attributes)
+            self.assertEqual(other.margins, s.margins)
+            self.assertEqual(other.tabstops, s.tabstops)
+            self.assertEqual(other.cursor_save_stack, s.cursor_save_stack)
+            self.assertEqual((other.g0, other.g1, other.current_charset),
+                             (s.g0, s.g1, s.current_charset))
+            self.assertEqual(other.irm, "replace")
+            self.assertEqual((other.history.lines, other.history.bytes),
+                             (5, 100))
+            self.assertEqual(list(other.history),
+                             ["old         "] if history else [])
+
+    def test_dump_is_small(self):
+        s = self.screen((24, 80))
+        s._cursor_position(12, 30)
+        s._print_run("hello")
+        # A few bytes a row.
+        self.assertTrue(len(s.dump()) < 24 * 10, len(s.dump()))
+
+    def test_load_something_else(self):
+        s = self.screen((2, 2))
+        self.assertRaises(ValueError, s.load, b"nope")
+        self.assertRaises(ValueError, s.load, stream().dump())
+
+class TestTerminal(TestScreen):
+    screen = terminal
+
+    def test_dump_and_load_mid_sequence(self):
+        data = self.noise(7)
+        for cut in range(0, len(data), 211):
+            t = terminal((6, 20), fail_on_unknown_esc=False)
+            t.process(data[:cut])
+            t.feed_bytes(u"\x1b[1;3\xe9".encode("utf-8")[:-1])
+
+            again = terminal((2, 2))
+            again.load(t.dump())
+            for each in (t, again):
+                each.feed_bytes(u"\xe9".encode("utf-8")[-1:])
+                each.process(u"4mxy" + data[cut:])
+            self.assertSameScreen(again, t)
+            self.assertEqual(again.fail_on_unknown_esc, False)
+
+    def test_dump_halves(self):
+        t = terminal((2, 6))
+        t.process(u"ab\x1b[1;3")
+        data = t.dump()
+
+        sc = screen((1, 1))
+        sc.load(data)
+        self.assertEqual(sc.display, t.display)
+        self.assertEqual(sc.cursor(), (2, 0))
+
+        st = stream()
+        st.load(data[len(screen.dump(t)):])
+        self.assertEqual((st.state, st.params, st.current_param),
+                         ("escape-lb", [1], "3"))
+        self.assertEqual(data, sc.dump() + st.dump())
+
+    def noise(self, seed):
+        rng = random.Random(seed)
+        pieces = [u"hello ", u"w\xf6rld", u"\x1b[1;31m", u"\x1b[0m", u"\x1b[7m",
+                  u"\r\n", u"\n", u"\x08", u"\t", u"\x1b[5;3H", u"\x1b[2;4r",
+                  u"\x1b[r", u"\x1b7", u"\x1b8", u"\x1bM", u"\x1bD", u"\x1bE",
+                  u"\x1b(0lqk\x1b(B", u"\x1b)0\x0eqq\x0f", u"\x1b[K", u"\x1b[1J",
+                  u"\x1b[2P", u"\x1b[3L", u"\x1b[M", u"\x1b[4h", u"\x1b[4l",
+                  u"\x1b[2A", u"\x1b[3C", u"\x1b[B", u"\x1b[D", u"\x07",
+                  u"\x1b[?25l", u"\x1b[6n", u"\x1bH", u"\x1b[g", u"\x1b[", u"2"]
+        return u"".join(rng.choice(pieces) for _ in range(2000))
+
+    def assertSameScreen(self, a, b):
+        self.assertEqual(a.display, b.display)
+        self.assertEqual(a.attributes, b.attributes)
+        self.assertEqual(a.cursor(), b.cursor())
+        self.assertEqual(a.cursor_attributes, b.cursor_attributes)
+        self.assertEqual((a.g0, a.g1, a.current_charset),
+                         (b.g0, b.g1, b.current_charset))
+
+    def test_same_as_stream_and_screen(self):
+        for seed in range(5):
+            data = self.noise(seed)
+            st = stream(fail_on_unknown_esc=False)
+            s = screen((6, 20))
+            s.attach(st)
+            t = terminal((6, 20), fail_on_unknown_esc=False)
+            for n in range(0, len(data), 97):
+                st.process(data[n:n + 97])
+                t.process(data[n:n + 97])
+            self.assertSameScreen(t, s)
+            self.assertEqual(t.state, st.state)
+
+    def test_print_override_process(self):
+        class shouting(terminal):
+            def _print(self, char):
+                super(shouting, self)._print(char.upper())
+
+        t = shouting((1, 5))
+        t.process(u"abc")
+        self.assertEqual(t.display, ("ABC  ",))
+
+    def test_consume_override_process(self):
+        class counted(terminal):
+            chars = ""
+
+            def consume(self, char):
+                self.chars += char
+                super(counted, self).consume(char)
+
+        t = counted((1, 6))
+        t.process(u"ab\x1b[2Cc")
+        self.assertEqual(t.chars, u"ab\x1b[2Cc")
+        self.assertEqual(t.display, ("ab  c ",))
+
+    def test_listeners(self):
+        t = terminal((2, 10))
+        t.process(u"ab")
+        events = []
+        t.add_event_listener("print-run", events.append)
+        t.add_event_listener("cursor-up", lambda *args: events.append(args))
+        t.process(u"cd\x1b[2A\x1b[1me")
+
+        self.assertEqual(events, ["cd", (2,), "e"])
+        self.assertEqual(t.display, ("abcde     ", " " * 10))
+        self.assertEqual(t.attributes[0][4], (("bold",), "default",
+                                              "default"))
+
+    def test_instrument(self):
+        t = terminal((2, 10))
+        t.instrument(sample=1)
+        t.process(u"hi\r\n")
+
+        self.assertEqual(t.display, ("hi        ", " " * 10))
+        self.assertEqual(t.stats["events"], {"print-run": 1,
+                                             "carriage-return": 1,
+                                             "linefeed": 1})
+
+    def test_feed_bytes(self):
+        t = terminal((1, 5))
+        data = u"\x1b[1m\xe9".encode("utf-8")
+        t.feed_bytes(data[:-1])
+        t.feed_bytes(data[-1:])
+
+        self.assertEqual(t.display, (u"\xe9    ",))
 
 if __name__ == "__main__":
     unittest.main()
@@ -99,12 +99,19 @@ Here's a real-world example:
 >>> 
 """
 
+import re
 import string
 import codecs
+import struct
+import timeit
+import warnings
 
+from array import array
+from collections import deque, namedtuple
 from copy import copy
+from itertools import groupby, islice
 
-from .graphics import text, colors
+from .graphics import text, colors, dsg
 
 from . import control as ctrl, escape as esc
 # from .control import *
@@ -113,17 +120,193 @@ from . import control as ctrl, escape as esc
 class StreamProcessError(Exception):
     pass
 
-class stream:
+# Parser states, see `stream.states`.
+_STREAM, _ESCAPE, _ESCAPE_LB, _MODE, _CHARSET_G0, _CHARSET_G1 = range(6)
+
+def _ignore(self, char):
+    pass
+
+def _transition(state):
+    """
+    An action that moves the parser to `state`.
+    """
+    def action(self, char):
+        self._state = state
+    return action
+
+def _control(event, slot):
+    """
+    An action that dispatches a basic control character's `event`, which
+    has the listener slot `slot`.
+    """
+    def action(self, char):
+        listener = self._slots[slot]
+        if listener is not None:
+            listener()
+    return action
+
+def _command(event, slot):
+    """
+    An action that dispatches a non-parameterised escape's `event` and
+    returns to the stream state.
+    """
+    def action(self, char):
+        listener = self._slots[slot]
+        if listener is not None:
+            listener()
+        self._state = _STREAM
+    return action
+
+def _designate(event, slot):
+    """
+    An action that dispatches a character set designation.
+    """
+    def action(self, char):
+        listener = self._slots[slot]
+        if listener is not None:
+            listener(char)
+        self._state = _STREAM
+    return action
+
+def _counted(state, action, label=None):
+    """
+    An action that does what `action` does and counts it in the stream's
+    `stats`: the state transition it makes, if any, and the sequence it
+    ends if that's one the stream doesn't understand. `label` is
+    `(kind, name)`, where `kind` is `"unknown"` or `"ignored"` and `name`
+    names the sequence given the character.
+    """
+    def counted(self, char):
+        stats = self.stats
+        if label is not None:
+            kind, name = label
+            counts = stats[kind]
+            key = name(char)
+            counts[key] = counts.get(key, 0) + 1
+        action(self, char)
+        if self._state != state:
+            counts = stats["transitions"]
+            key = "%s -> %s" % (self.states[state], self.states[self._state])
+            counts[key] = counts.get(key, 0) + 1
+    return counted
+
+def _quoted(char):
+    """
+    The repr of a character, without the `u` Python 2 puts on it.
+    """
+    text = repr(char)
+    return text[1:] if text.startswith("u") else text
+
+def _qualname(callback):
+    """
+    The qualified name of a listener, such as `"screen._linefeed"`. Python 2
+    has no `__qualname__`, so for a bound method there it's made up from the
+    class that defines the method.
+    """
+    name = getattr(callback, "__qualname__", None)
+    if name is not None:
+        return name
+
+    name = getattr(callback, "__name__", None)
+    owner = getattr(callback, "__self__", None)
+    if name is None:
+        return repr(callback)
+    if owner is not None:
+        for cls in type(owner).__mro__:
+            if name in cls.__dict__:
+                return "%s.%s" % (cls.__name__, name)
+    return name
+
+def _final(event, slot=None):
+    """
+    An action for the final character of a control sequence. The final
+    character is the command to execute, which corresponds to the `event`
+    that's dispatched with the parameters seen so far. Unknown commands
+    (`event` of `None`) are dropped, as are commands no one listens to,
+    without their last parameter being parsed.
+    """
+    def action(self, char):
+        listener = self._slots[slot] if event is not None else None
+        if listener is not None:
+            if len(self.current_param) > 0:
+                self.params.append(int(self.current_param))
+            listener(*self.params)
+        self._state = _STREAM
+        self.current_param = ""
+        self.params = []
+    return action
+
+def _direct(method):
+    """
+    An action that calls a basic control character's handler, see
+    `terminal`.
+    """
+    def action(self, char):
+        method(self)
+    return action
+
+def _direct_command(method):
+    """
+    An action that calls a non-parameterised escape's handler, if there is
+    one, and returns to the stream state.
+    """
+    def action(self, char):
+        if method is not None:
+            method(self)
+        self._state = _STREAM
+    return action
+
+def _direct_final(method):
+    """
+    An action that calls the handler of a control sequence with its
+    parameters, or drops the sequence if there's no handler.
+    """
+    if method is None:
+        return _final(None)
+
+    def action(self, char):
+        if len(self.current_param) > 0:
+            self.params.append(int(self.current_param))
+        method(self, *self.params)
+        self._state = _STREAM
+        self.current_param = ""
+        self.params = []
+    return action
+
+def _direct_designate(method):
+    """
+    An action that calls a character set designation's handler.
+    """
+    def action(self, char):
+        method(self, char)
+        self._state = _STREAM
+    return action
+
+# The listener slots of the events every stream has, see `stream._compile`.
+_PRINT_RUN, _PRINT = 0, 1
+
+class stream(object):
     """
     A stream is the state machine that parses a stream of terminal characters
     and dispatches events based on what it sees. This can be attached to a 
     screen object and it's events, or can be used some other way.
 
     `stream.basic`, `stream.escape`, and `stream.sequence` are the relevant 
-    events that get thrown with one addition: `print`. For details on the
-    event parameters, see the [vt102 user's
+    events that get thrown with two additions: `print` and `print-run`. For
+    details on the event parameters, see the [vt102 user's
     guide](http://vt100.net/docs/vt102-ug/)
 
+    Printable text is dispatched as `print-run` with as many characters as
+    could be gathered between two control characters. Listeners that would
+    rather see one character at a time can listen for `print` instead, which
+    is dispatched for every character of the run.
+
+    The parser is driven by a transition table built from those three class
+    tables the first time a stream of a given class is created. Subclasses
+    can add events by extending the class tables. A subclass that overrides
+    `consume` is handed every character by `process` instead, which skips
+    the fast path.
+
     Quick example:
 
         >>> s = stream()
@@ -179,130 +362,272 @@ class stream:
         esc.IRMR: "set-replace",
     }
 
-    def __init__(self, fail_on_unknown_esc=True):
-        self.state = "stream"
+    #: The names of the parser states, indexed by the small integers the
+    #: transition table uses internally.
+    states = ("stream", "escape", "escape-lb", "mode", "charset-g0",
+              "charset-g1")
+
+    def __init__(self, fail_on_unknown_esc=True, encoding="utf-8",
+                 errors="replace"):
+        self._table, self._fallback, self._printable, self._events = \
+            self._compile()
+        self._state = _STREAM
         self.params = []
         self.current_param = ""
         self.listeners = {} 
         self.fail_on_unknown_esc = fail_on_unknown_esc
-
-    def _escape_sequence(self, char):
-        """
-        Handle characters seen when in an escape sequence. Most non-vt52
-        commands start with a left-bracket after the escape and then a 
-        stream of parameters and a command.
-        """
-
-        num = ord(char)
-        if char == "[":
-            self.state = "escape-lb"
-        elif char == "(":
-            self.state = "charset-g0"
-        elif char == ")":
-            self.state = "charset-g1"
-        elif num in self.escape:
-            self.dispatch(self.escape[num])
-            self.state = "stream"
-        elif self.fail_on_unknown_esc:
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors)
+        self.stats = None
+        self._slots = [None] * len(self._events)
+        self._rebind()
+
+    @property
+    def state(self):
+        """
+        The name of the current parser state, see `stream.states`.
+        """
+        return self.states[self._state]
+
+    @state.setter
+    def state(self, state):
+        self._state = self.states.index(state)
+
+    @classmethod
+    def _compile(cls):
+        """
+        Build the transition table for this class from `basic`, `escape`
+        and `sequence`. The table has a row for each state mapping
+        characters to the action to take, and a fallback action for each
+        state for every other character. It's built once per class, so
+        subclasses that extend the class tables get their own.
+        """
+
+        if "_compiled" in cls.__dict__:
+            return cls._compiled
+
+        # Every event gets a slot, which each stream fills with whatever
+        # should be called for it.
+        slots = {"print-run": _PRINT_RUN, "print": _PRINT}
+        def slot(event):
+            return slots.setdefault(event, len(slots))
+
+        stream_row = {}
+        for num, event in cls.basic.items():
+            stream_row[chr(num)] = _control(event, slot(event))
+        stream_row[chr(ctrl.ESC)] = _transition(_ESCAPE)
+        stream_row[u"\x00"] = _ignore
+
+        # Most non-vt52 commands start with a left-bracket after the escape
+        # and then a stream of parameters and a command.
+        escape_row = {}
+        for num, event in cls.escape.items():
+            escape_row[chr(num)] = _command(event, slot(event))
+        escape_row[u"["] = _transition(_ESCAPE_LB)
+        escape_row[u"("] = _transition(_CHARSET_G0)
+        escape_row[u")"] = _transition(_CHARSET_G1)
+
+        # Parameters are a list of numbers in ascii (e.g. '12', '4', '42',
+        # etc) separated by a semicolon (e.g. "12;4;42"). Anything else is the
+        # final character of the sequence. See the [vt102 user
+        # guide](http://vt100.net/docs/vt102-ug/) for more details.
+        parameters_row = {}
+        for num, event in cls.sequence.items():
+            parameters_row[chr(num)] = _final(event, slot(event))
+        for digit in u"0123456789":
+            parameters_row[digit] = cls._parameter_digit
+        parameters_row[u";"] = cls._parameter_separator
+        parameters_row[u"?"] = _transition(_MODE)
+
+        # 'l' or 'h' designates the end of a mode stream. We don't really care
+        # about mode streams so anything else seen while in the mode state, is
+        # just ignored.
+        mode_row = {u"l": _transition(_STREAM), u"h": _transition(_STREAM)}
+
+        table = [stream_row, escape_row, parameters_row, mode_row, {}, {}]
+        fallback = [cls._print_char, cls._unknown_escape, _final(None),
+                    _ignore, _designate("charset-g0", slot("charset-g0")),
+                    _designate("charset-g1", slot("charset-g1"))]
+
+        # Everything that isn't special in the stream state is printable, so
+        # runs of it can be matched in one go.
+        printable = re.compile(u"[^%s]+" % u"".join(
+            re.escape(char) for char in sorted(stream_row)))
+
+        cls._compiled = table, fallback, printable, slots
+        return cls._compiled
+
+    def _unknown_escape(self, char):
+        if self.fail_on_unknown_esc:
             raise StreamProcessError("Unexpected character '%c' == '0x%02x'" % (char, ord(char)))
 
-    def _end_escape_sequence(self, char):
-        """
-        Handle the end of an escape sequence. The final character in an escape
-        sequence is the command to execute, which corresponds to the event that
-        is dispatched here.
-        """
+    def _parameter_digit(self, char):
+        self.current_param += char
 
-        num = ord(char)
-        if num in self.sequence:
-            self.dispatch(self.sequence[num], *self.params)
-        self.state = "stream"
+    def _parameter_separator(self, char):
+        self.params.append(int(self.current_param))
         self.current_param = ""
-        self.params = []
 
-    def _escape_parameters(self, char):
-        """
-        Parse parameters in an escape sequence. Parameters are a list of
-        numbers in ascii (e.g. '12', '4', '42', etc) separated by a semicolon
-        (e.g. "12;4;42").
-        
-        See the [vt102 user guide](http://vt100.net/docs/vt102-ug/) for more
-        details on the formatting of escape parameters. 
-        """
+    def _print_char(self, char):
+        self._print_run(char)
 
-        if char == ";":
-            self.params.append(int(self.current_param))
-            self.current_param = ""
-        elif char == "?":
-            self.state = "mode"
-        elif not char.isdigit():
-            if len(self.current_param) > 0:
-                self.params.append(int(self.current_param))
-
-            # If we're in parameter parsing mode, but we see a non-numeric 
-            # value, it must be the end of the control sequence.
-            self._end_escape_sequence(char)
-        else:
-            self.current_param += char
-
-    def _mode(self, char):
-        if char in "lh":
-            # 'l' or 'h' designates the end of a mode stream. We don't
-            # really care about mode streams so anything else seen while
-            # in the mode state, is just ignored.
-            self.state = "stream"
-
-    def _charset_g0(self, char):
-        self.dispatch("charset-g0", char)
-        self.state = "stream"
-
-    def _charset_g1(self, char):
-        self.dispatch("charset-g1", char)
-        self.state = "stream"
-
-    def _stream(self, char):
+    def _print_run(self, chars):
         """
-        Process a character when in the
-        default 'stream' state.
+        Dispatch a run of printable characters.
         """
 
-        num = ord(char)
-        if num in self.basic:
-            self.dispatch(self.basic[num])
-        elif num == ctrl.ESC:
-            self.state = "escape"
-        elif num == 0x00:
-            # nulls are just ignored.
-            pass
-        else: 
-            self.dispatch("print", char) 
+        slots = self._slots
+        listener = slots[_PRINT_RUN]
+        if listener is not None:
+            listener(chars)
+        listener = slots[_PRINT]
+        if listener is not None:
+            for char in chars:
+                listener(char)
 
     def consume(self, char):
         """
         Consume a single character and advance the state as necessary.
         """
 
-        if self.state == "stream":
-            self._stream(char)
-        elif self.state == "escape":
-            self._escape_sequence(char)
-        elif self.state == "escape-lb":
-            self._escape_parameters(char)
-        elif self.state == "mode":
-            self._mode(char)
-        elif self.state == "charset-g0":
-            self._charset_g0(char)
-        elif self.state == "charset-g1":
-            self._charset_g1(char)
+        state = self._state
+        self._table[state].get(char, self._fallback[state])(self, char)
 
     def process(self, chars):
         """
-        Consume a string of  and advance the state as necessary.
-        """
-
-        while len(chars) > 0:
-            self.consume(chars[0])
-            chars = chars[1:]
+        Consume a string of characters and advance the state as necessary.
+
+        The chunk is walked in place, so processing is linear in its length.
+        Parser state is kept between calls, which means an escape sequence
+        may be split across any number of chunks. Runs of printable text
+        are matched in one go and dispatched as a single `print-run`.
+
+        A byte string, which is what a plain string is on Python 2, is
+        decoded first, see `feed_bytes`. If a subclass overrides `consume`,
+        it is called for each character instead.
+        """
+
+        if isinstance(chars, bytes):
+            self.feed_bytes(chars)
+            return
+        if type(self).consume != stream.consume:
+            for char in chars:
+                self.consume(char)
+            return
+
+        table = self._table
+        fallback = self._fallback
+        printable = self._printable.match
+        slots = self._slots
+        index = 0
+        end = len(chars)
+        while index < end:
+            char = chars[index]
+            state = self._state
+            action = table[state].get(char)
+            if action is not None:
+                action(self, char)
+                index += 1
+            elif state == _STREAM:
+                run = printable(chars, index)
+                if slots[_PRINT_RUN] is not None or slots[_PRINT] is not None:
+                    self._print_run(run.group())
+                index = run.end()
+            else:
+                fallback[state](self, char)
+                index += 1
+
+    def feed_bytes(self, data):
+        """
+        Decode a chunk of raw bytes in the stream's encoding and process it.
+        `data` may be `bytes`, `bytearray` or a `memoryview`. A multibyte
+        character that's split across chunks is held back until the rest of
+        it arrives.
+        """
+
+        if isinstance(data, memoryview):
+            # On Python 2 a decoder can't add a memoryview to what it held
+            # back, and `bytes` of one is its repr.
+            data = data.tobytes()
+        self.process(self._decoder.decode(data, False))
+
+    #: What a `dump` starts with, and the version of the format after it.
+    #: A `terminal` is a stream and a screen at once, so the methods of
+    #: each name their own class's rather than going through `self`.
+    dump_magic = b"vt102-stream"
+    dump_version = 1
+
+    def dump(self):
+        """
+        The state of the parser as bytes, for `load` to restore later: how
+        far it is through an escape sequence, the parameters so far, and
+        the undecoded end of a multibyte character, along with the
+        encoding and options. Listeners aren't part of it.
+
+            >>> st = stream()
+            >>> st.feed_bytes(b"\\x1b[1;3" + u"\\xe9".encode("utf-8")[:1])
+            >>> again = stream()
+            >>> again.load(st.dump())
+            >>> print(again.state)
+            escape-lb
+            >>> again.params == [1] and again.current_param == "3"
+            True
+        """
+
+        buffer, flag = self._decoder.getstate()
+        out = bytearray(stream.dump_magic)
+        out += _u8.pack(stream.dump_version)
+        out += _u8.pack(self._state)
+        out += _u8.pack(bool(self.fail_on_unknown_esc))
+        _pack_text(out, self.encoding)
+        _pack_text(out, self._decoder.errors)
+        _pack_text(out, u";".join(str(param) for param in self.params))
+        _pack_text(out, self.current_param)
+        out += _u16.pack(len(buffer))
+        out += buffer
+        out += _u64.pack(flag)
+        return bytes(out)
+
+    def load(self, data):
+        """
+        Restore the parser to the state `dump` saved in `data`, which can be
+        `bytes` or anything else with the buffer protocol.
+        """
+
+        self._load_stream(memoryview(data), 0)
+
+    def _load_stream(self, view, offset):
+        """
+        Restore a dump at `offset` in `view`, and return where it ended.
+        """
+
+        magic = stream.dump_magic
+        if view[offset:offset + len(magic)].tobytes() != magic:
+            raise ValueError("not a dump of a stream")
+        offset += len(magic)
+        version, state, fail = struct.unpack_from("<BBB", view, offset)
+        if version != stream.dump_version:
+            raise ValueError("can't load version %d of the stream dump" %
+                             version)
+        offset += 3
+        encoding, offset = _unpack_text(view, offset)
+        errors, offset = _unpack_text(view, offset)
+        params, offset = _unpack_text(view, offset)
+        current, offset = _unpack_text(view, offset)
+        size, = _u16.unpack_from(view, offset)
+        buffer = view[offset + 2:offset + 2 + size].tobytes()
+        offset += 2 + size
+        flag, = _u64.unpack_from(view, offset)
+        offset += 8
+
+        self._state = state
+        self.fail_on_unknown_esc = bool(fail)
+        self.params = [int(param) for param in params.split(u";") if param]
+        self.current_param = current
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors)
+        self._decoder.setstate((buffer, flag))
+        return offset
 
     def add_event_listener(self, event, function):
         """
@@ -314,6 +639,10 @@ class stream:
 
         More than one listener may be added for a single event. Each listener
         will be called.
+
+        The parser doesn't look listeners up as it goes; adding one puts it
+        in the event's slot, which is what the parser calls. Listeners
+        added to `listeners` by hand won't be seen by the parser.
         
         * **event** The event to listen for.
         * **function** The callable to invoke.
@@ -323,6 +652,43 @@ class stream:
             self.listeners[event] = []
 
         self.listeners[event].append(function)
+        self._bind(event)
+
+    def _bind(self, event):
+        """
+        Fill the slot of `event` with what the parser calls for it: nothing
+        if no one listens, the listener if there's one, or a function that
+        calls each of them in turn. If the stream dispatches in some way of
+        its own, every slot goes through `dispatch` instead.
+        """
+
+        slot = self._events.get(event)
+        if slot is None:
+            return
+
+        if (type(self).dispatch != stream.dispatch or
+                "dispatch" in self.__dict__) and \
+                (slot != _PRINT or self.listeners.get(event)):
+            # `print` is the exception: it's only dispatched character by
+            # character when someone asks for it.
+            dispatch = self.dispatch
+            def listener(*args):
+                dispatch(event, *args)
+        else:
+            listeners = self.listeners.get(event)
+            if not listeners:
+                listener = None
+            elif len(listeners) == 1:
+                listener = listeners[0]
+            else:
+                def listener(*args):
+                    for callback in listeners:
+                        callback(*args)
+        self._slots[slot] = listener
+
+    def _rebind(self):
+        for event in self._events:
+            self._bind(event)
 
     def dispatch(self, event, *args):
         """
@@ -337,7 +703,598 @@ class stream:
             else:
                 callback()
 
-class screen:
+    def instrument(self, sample=64):
+        """
+        Start keeping `stats` on what the stream sees. `stats` is a dict of
+        dicts:
+
+        * **events** How many times each event was dispatched.
+        * **handlers** For each listener, `samples`, the number of calls
+          that were timed (every `sample`th dispatch of an event is),
+          `seconds`, the time those took, and `estimated_seconds`, the time
+          all the calls are likely to have taken.
+        * **transitions** How many times the parser went from one state to
+          another, as `"stream -> escape"` and so on.
+        * **unknown** Sequences the stream doesn't know, such as `"ESC 'x'"`.
+        * **ignored** Sequences the stream knows but does nothing with.
+
+        The counting is done by versions of the transition table and of
+        `dispatch` that are put on this stream only, so a stream that isn't
+        instrumented runs exactly the code it always did. Call
+        `reset_stats` to start counting afresh and `uninstrument` to stop.
+        """
+
+        table, fallback, _, _ = self._compile()
+        mode = ("ignored", lambda char: "CSI ? %s" % char)
+        labels = {(_STREAM, u"\x00"): ("ignored", lambda char: "NUL"),
+                  (_MODE, u"h"): mode,
+                  (_MODE, u"l"): mode}
+        fallback_labels = {_ESCAPE: ("unknown",
+                                     lambda char: "ESC %s" % _quoted(char)),
+                           _ESCAPE_LB: ("unknown",
+                                        lambda char: "CSI %s" % _quoted(char))}
+
+        self._table = [dict((char, _counted(state, action,
+                                            labels.get((state, char))))
+                            for char, action in row.items())
+                       for state, row in enumerate(table)]
+        self._fallback = [_counted(state, action, fallback_labels.get(state))
+                          for state, action in enumerate(fallback)]
+        self.dispatch = self._instrumented_dispatch(sample)
+        self._rebind()
+        self.reset_stats()
+
+    def _instrumented_dispatch(self, sample):
+        dispatch = type(self).dispatch
+        # If a subclass dispatches in its own way, its listeners can't be
+        # timed one by one, so the whole dispatch is timed instead.
+        plain = dispatch == stream.dispatch
+        clock = timeit.default_timer
+
+        def timed(name, seconds):
+            handlers = self.stats["handlers"]
+            handler = handlers.get(name)
+            if handler is None:
+                handler = handlers[name] = {"samples": 0, "seconds": 0.0,
+                                            "estimated_seconds": 0.0}
+            handler["samples"] += 1
+            handler["seconds"] += seconds
+            handler["estimated_seconds"] = handler["seconds"] * sample
+
+        def instrumented(event, *args):
+            events = self.stats["events"]
+            count = events[event] = events.get(event, 0) + 1
+            if count % sample:
+                dispatch(self, event, *args)
+            elif plain:
+                for callback in self.listeners.get(event, []):
+                    start = clock()
+                    callback(*args)
+                    timed(_qualname(callback), clock() - start)
+            else:
+                start = clock()
+                dispatch(self, event, *args)
+                timed("%s.dispatch(%r)" % (type(self).__name__, event),
+                      clock() - start)
+
+        return instrumented
+
+    def reset_stats(self):
+        """
+        Start counting afresh.
+        """
+
+        self.stats = {"events": {}, "handlers": {}, "transitions": {},
+                      "unknown": {}, "ignored": {}}
+
+    def uninstrument(self):
+        """
+        Stop keeping stats and go back to the plain parser. The stats kept
+        so far are left in `stats`.
+        """
+
+        self._table, self._fallback, _, _ = self._compile()
+        self.__dict__.pop("dispatch", None)
+        self._rebind()
+
+class palette(object):
+    """
+    Interns attribute three-tuples (see `screen.default_attributes`). Every
+    distinct combination of text attributes and colors is stored once and
+    given a small integer id, which is what the screen keeps for each
+    character. Comparing two ids is the same as comparing the attributes.
+    """
+
+    def __init__(self):
+        self.styles = []
+        self.ids = {}
+        self.transitions = {}
+
+    def __len__(self):
+        return len(self.styles)
+
+    def __getitem__(self, id):
+        """
+        The attribute three-tuple for an id.
+        """
+        return self.styles[id]
+
+    def intern(self, attrs):
+        """
+        The id for an attribute three-tuple, adding it to the palette if it
+        hasn't been seen before. Text attributes are kept in sorted order so
+        that the same set of them always gets the same id.
+        """
+        id = self.ids.get(attrs)
+        if id is None:
+            style = (tuple(sorted(attrs[0])), attrs[1], attrs[2])
+            id = self.ids.get(style)
+            if id is None:
+                id = len(self.styles)
+                if id > 0xffff:
+                    raise ValueError("palette is full")
+                self.styles.append(style)
+                self.ids[style] = id
+
+            # Remember the unsorted spelling too, so it's found straight away
+            # next time.
+            self.ids[attrs] = id
+        return id
+
+class _row(object):
+    """
+    A single row of the screen. The characters are a list and their
+    attributes an array of palette ids, both of which get changed in place;
+    the row's display string and attribute list are only built when someone
+    asks for them, and then kept until the row is next written to.
+
+    Once a row is frozen it belongs to a snapshot and mustn't be written to
+    again; the screen writes to a copy instead.
+    """
+
+    __slots__ = ("chars", "attrs", "text", "trimmed", "styles", "found",
+                 "rle", "rendered", "frozen")
+
+    def __init__(self, chars, attrs):
+        self.chars = chars
+        self.attrs = attrs
+        self.text = None
+        self.trimmed = None
+        self.styles = None
+        self.found = None
+        self.rle = None
+        self.rendered = None
+        self.frozen = False
+
+    def copy(self):
+        """
+        An unfrozen copy of the row.
+        """
+        return _row(list(self.chars), array("H", self.attrs))
+
+    def display(self):
+        """
+        The row's characters as a string.
+        """
+        if self.text is None:
+            self.text = u"".join(self.chars)
+        return self.text
+
+    def stripped(self):
+        """
+        The row's characters as a string, without the blanks at the end.
+        """
+        if self.trimmed is None:
+            self.trimmed = self.display().rstrip(u" ")
+        return self.trimmed
+
+    def attributes(self, palette):
+        """
+        The row's attributes as a list of three-tuples with one entry per
+        character.
+        """
+        if self.styles is None:
+            styles = palette.styles
+            self.styles = [styles[id] for id in self.attrs]
+        return self.styles
+
+    def runs(self):
+        """
+        The row's attributes as runs of the same palette id, flattened to
+        `(id, count, id, count, ...)`.
+        """
+        if self.rle is None:
+            attrs = self.attrs
+            if not attrs:
+                self.rle = ()
+            elif attrs.count(attrs[0]) == len(attrs):
+                # Most rows are all one style, which is quickest to find out.
+                self.rle = (attrs[0], len(attrs))
+            else:
+                rle = []
+                for id, run in groupby(attrs):
+                    rle += (id, len(list(run)))
+                self.rle = tuple(rle)
+        return self.rle
+
+    def find(self, pattern):
+        """
+        Where the compiled `pattern` matches the row's text, as `(x, text)`
+        pairs. The matches are kept, for a handful of patterns, until the
+        row is next written to.
+        """
+        found = self.found
+        if found is None:
+            found = self.found = {}
+        hits = found.get(pattern)
+        if hits is None:
+            if len(found) >= 16:
+                found.clear()
+            hits = found[pattern] = tuple(
+                (match.start(), match.group())
+                for match in pattern.finditer(self.display()))
+        return hits
+
+class scrollback(object):
+    """
+    The lines that have scrolled off the top of a screen, oldest first.
+    Indexing gives a line's text, and `attributes` its attributes. Once
+    there are more than `lines` lines, or their text takes more than
+    `bytes` bytes when encoded as UTF-8, the oldest are dropped. Either
+    limit can be `None` for no limit.
+
+        >>> h = scrollback(lines=2)
+        >>> sc = screen((1, 3), history=h)
+        >>> for line in ("a", "b", "c", "d"):
+        ...     sc._print_run(line)
+        ...     sc._linefeed()
+        >>> list(h) == ["c  ", "d  "]
+        True
+    """
+
+    def __init__(self, lines=1000, bytes=None):
+        self.lines = lines
+        self.bytes = bytes
+        self._rows = deque()
+        self._sizes = deque()
+        self._size = 0
+
+        # Lines only ever leave from the front, so a line's number counting
+        # every line ever dropped never changes. Searches are remembered by
+        # those numbers, see `_search`.
+        self._dropped = 0
+        self._found = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        return self._rows[index].display()
+
+    def __iter__(self):
+        return (row.display() for row in self._rows)
+
+    def attributes(self, index, palette):
+        """
+        The attributes of the line at `index`, as three-tuples.
+        """
+        return self._rows[index].attributes(palette)
+
+    def size(self):
+        """
+        The number of bytes the kept lines take up, see `bytes`.
+        """
+        return self._size
+
+    def append(self, row):
+        """
+        Keep a row that has just left the screen, dropping the oldest rows if
+        that goes over either limit.
+        """
+        if self.lines == 0:
+            return
+
+        size = 0
+        if self.bytes is not None:
+            size = len(row.display().encode("utf-8"))
+        self._rows.append(row)
+        self._sizes.append(size)
+        self._size += size
+
+        while (self.lines is not None and len(self._rows) > self.lines) or \
+                (self.bytes is not None and self._size > self.bytes):
+            self._rows.popleft()
+            self._size -= self._sizes.popleft()
+            self._dropped += 1
+
+    def clear(self):
+        self._dropped += len(self._rows)
+        self._rows.clear()
+        self._sizes.clear()
+        self._size = 0
+
+    def _search(self, pattern):
+        """
+        Where the compiled `pattern` matches, as a deque of `(line, x, text)`
+        where `line` counts lines ever dropped too. Lines never change once
+        they're kept, so only lines added since the last search for the
+        same pattern are searched.
+        """
+        first = self._dropped
+        last = first + len(self._rows)
+
+        entry = self._found.get(pattern)
+        if entry is None:
+            if len(self._found) >= 16:
+                self._found.clear()
+            entry = self._found[pattern] = [first, deque()]
+        searched, hits = entry
+
+        while hits and hits[0][0] < first:
+            hits.popleft()
+        searched = max(searched, first)
+        for line, row in enumerate(islice(self._rows, searched - first, None),
+                                   searched):
+            for match in pattern.finditer(row.display()):
+                hits.append((line, match.start(), match.group()))
+        entry[0] = last
+        return hits
+
+# Checkpoints (see `screen.dump` and `stream.dump`) are little-endian, and
+# strings in them are UTF-8 with their length in front.
+_u8 = struct.Struct("<B")
+_u16 = struct.Struct("<H")
+_u16_pair = struct.Struct("<HH")
+_u16_native = struct.Struct("=H")
+_u32 = struct.Struct("<I")
+_u64 = struct.Struct("<Q")
+_screen_header = struct.Struct("<HHHHHHBHHHHII")
+
+# Runs of blanks at least this long are stored as a count.
+_blanks = re.compile(u" {3,}")
+
+def _pack_text(out, text):
+    data = text.encode("utf-8")
+    out += _u16.pack(len(data))
+    out += data
+
+def _decode(view):
+    return codecs.utf_8_decode(view, "strict", True)[0]
+
+def _unpack_text(view, offset):
+    size, = _u16.unpack_from(view, offset)
+    offset += 2
+    return _decode(view[offset:offset + size]), offset + size
+
+def _pack_array(out, code, values):
+    out += _u32.pack(len(values))
+    out += struct.pack("<%d%s" % (len(values), code), *values)
+
+def _unpack_array(view, offset, code):
+    count, = _u32.unpack_from(view, offset)
+    values = struct.unpack_from("<%d%s" % (count, code), view, offset + 4)
+    return values, offset + 4 + count * struct.calcsize(code)
+
+def _pack_rows(out, rows, ids):
+    """
+    Append `rows` to `out` as their lengths, their text run together with
+    runs of blanks taken out and counted instead, and their attributes as
+    runs. Runs carry on from one row to the next, so blank rows cost next
+    to nothing. Attributes are numbered in the order they're first seen,
+    in `ids`, which is keyed by palette id.
+    """
+    text = u"".join(row.display() for row in rows)
+    blanks = []
+    for match in _blanks.finditer(text):
+        blanks += (match.start(), match.end() - match.start())
+    data = _blanks.sub(u"", text).encode("utf-8")
+
+    runs = []
+    for row in rows:
+        rle = row.runs()
+        if runs and rle and runs[-2] == rle[0]:
+            runs[-1] += rle[1]
+            rle = rle[2:]
+        runs += rle
+
+    if runs and max(runs[1::2]) > 0xffff:
+        # Long runs, from a history full of blanks, are split into runs that
+        # fit in two bytes.
+        split = []
+        for i in range(0, len(runs), 2):
+            id, count = runs[i], runs[i + 1]
+            while count > 0xffff:
+                split += (id, 0xffff)
+                count -= 0xffff
+            split += (id, count)
+        runs = split
+
+    for id in dict.fromkeys(runs[0::2]):
+        if id not in ids:
+            ids[id] = len(ids)
+    runs[0::2] = [ids[id] for id in runs[0::2]]
+
+    _pack_array(out, "H", [len(row.chars) for row in rows])
+    _pack_array(out, "I", blanks)
+    out += _u32.pack(len(data))
+    out += data
+    _pack_array(out, "H", runs)
+
+def _unpack_rows(view, offset, ids):
+    """
+    Read rows written by `_pack_rows`, turning their attributes back into
+    palette ids with `ids`. Returns the rows and where they ended.
+    """
+    lengths, offset = _unpack_array(view, offset, "H")
+    blanks, offset = _unpack_array(view, offset, "I")
+    size, = _u32.unpack_from(view, offset)
+    text = _decode(view[offset + 4:offset + 4 + size])
+    offset += 4 + size
+    runs, offset = _unpack_array(view, offset, "H")
+    # Runs are put together as the bytes of the array, which is quicker
+    # than adding them to it one at a time.
+    packed = [_u16_native.pack(id) for id in ids]
+    attrs = array("H", b"".join([packed[id] * count for id, count in
+                                 zip(runs[0::2], runs[1::2])]))
+
+    if blanks:
+        # Put the blanks back: `at` is how far through the whole text, and
+        # `taken` how far through what was kept.
+        pieces = []
+        at = taken = 0
+        for i in range(0, len(blanks), 2):
+            start, count = blanks[i], blanks[i + 1]
+            pieces.append(text[taken:taken + start - at])
+            pieces.append(u" " * count)
+            taken += start - at
+            at = start + count
+        pieces.append(text[taken:])
+        text = u"".join(pieces)
+
+    rows = []
+    start = 0
+    for length in lengths:
+        rows.append(_row(list(text[start:start + length]),
+                         attrs[start:start + length]))
+        start += length
+    return rows, offset
+
+class frame(object):
+    """
+    A read-only picture of a screen at one moment, see `screen.snapshot`. It
+    shares its rows with the screen it was taken from (and with other
+    snapshots) until the screen next writes to them, so taking one is cheap
+    and keeping many only costs memory for the rows that changed between
+    them.
+    """
+
+    def __init__(self, rows, palette, size, cursor, cursor_attributes,
+                 margins, charsets):
+        self._rows = rows
+        self.palette = palette
+        self.size = size
+        self.x, self.y = cursor
+        self.cursor_attributes = cursor_attributes
+        self.margins = margins
+        self.g0, self.g1, self.current_charset = charsets
+
+    def __repr__(self):
+        return repr(list(self.display))
+
+    def __str__(self):
+        lines = ['"%s"' % l for l in self.display]
+
+        return "[" + ",\n ".join(lines) + "]"
+
+    @property
+    def display(self):
+        """
+        The text on the screen, as a tuple of strings (one per row).
+        """
+        return tuple([row.display() for row in self._rows])
+
+    @property
+    def attributes(self):
+        """
+        The attributes of every character, as a list of rows of three-tuples.
+        """
+        palette = self.palette
+        return [row.attributes(palette) for row in self._rows]
+
+    def cursor(self):
+        """
+        Where the cursor was.
+        """
+        return (self.x, self.y)
+
+#: What changed on a screen since it was last asked, see
+#: `screen.consume_damage`. `rows` maps each changed row to the `(start,
+#: stop)` span of columns that changed in it, and `cursor` is the new cursor
+#: position if the cursor moved, or `None`.
+damage = namedtuple("damage", ["rows", "cursor"])
+
+#: Where a search matched, see `screen.finditer`: the row, the column the
+#: match starts at, and the text matched.
+hit = namedtuple("hit", ["y", "x", "text"])
+
+class watcher(object):
+    """
+    Watches for `pattern` to appear on `screen`, or in `region` of it. The
+    pattern is a compiled regular expression, or a string to look for as it
+    is. `region` is `(top, left, bottom, right)`, the rows and columns to
+    look in as slices would give them; by default it's the whole screen.
+
+        >>> sc = screen((2, 10))
+        >>> w = watcher(sc, "$ ")
+        >>> w.check() is None
+        True
+        >>> sc._print_run("make")
+        >>> sc._carriage_return()
+        >>> sc._linefeed()
+        >>> sc._print_run("$ ")
+        >>> found = w.check()
+        >>> found.y, found.x, found.text == "$ "
+        (1, 0, True)
+
+    Call `check` whenever the screen might have changed; it only searches
+    rows that have been written to or moved since the last check, and does
+    nothing at all if none have. See `vt102.spawn.spawn.wait_for` and
+    `vt102.aio.feeder.wait_for`, which do the waiting.
+    """
+
+    def __init__(self, screen, pattern, region=None):
+        if not hasattr(pattern, "finditer"):
+            pattern = re.compile(re.escape(pattern))
+        self.screen = screen
+        self.pattern = pattern
+        self.region = region
+
+        # The row last seen at each line, its text, and what matched in it.
+        self._seen = {}
+        self._version = None
+        self._found = None
+
+    def check(self):
+        """
+        The first `hit` for the pattern on the screen as it is now, or
+        `None`.
+        """
+
+        screen = self.screen
+        if screen._version == self._version:
+            return self._found
+        self._version = screen._version
+
+        rows, cols = screen.size
+        top, left, bottom, right = self.region or (0, 0, rows, cols)
+        bottom = min(bottom, rows)
+        pattern = self.pattern
+        seen = self._seen
+        found = None
+        for y in range(top, bottom):
+            row = screen._rows[y]
+            last = seen.get(y)
+            if last is None or last[0] is not row or last[1] is not row.text:
+                text = row.display()
+                hits = [(match.start(), match.group())
+                        for match in pattern.finditer(text, left, right)]
+                last = seen[y] = (row, text, hits)
+            if found is None and last[2]:
+                x, text = last[2][0]
+                found = hit(y, x, text)
+        self._found = found
+        return found
+
+def _insert(rows, index, row):
+    """
+    Insert `row` into the deque `rows` before `index`. Deques only have an
+    `insert` of their own from Python 3.5.
+    """
+    rows.rotate(-index)
+    rows.appendleft(row)
+    rows.rotate(index)
+
+class screen(object):
     """
     A screen is an in memory buffer of strings that represents the screen
     display of the terminal. It can be instantiated on it's own and given 
@@ -345,6 +1302,21 @@ class screen:
     events.
 
     The screen buffer can be accessed through the screen's `display` property.
+    Internally every row is kept as a buffer that's changed in place, and
+    `display` and `attributes` are built from those buffers on demand. Each
+    row's string is cached until the row changes, so reading `display` after
+    a small change only rebuilds the rows that changed. What's returned is
+    a copy, and `display` is a tuple so that changing it in place fails
+    rather than doing nothing; assign to `display` or `attributes` to change
+    the screen.
+
+    The screen also keeps track of what's changed, so that whatever is
+    drawing it only has to redraw that. See `consume_damage`.
+
+    Rows are kept in a ring, so scrolling moves the ring along one row
+    rather than copying the screen. Rows that scroll off the top go into
+    `history`; pass `history` as a number of lines to keep, or as a
+    `scrollback` with its own limits. By default nothing is kept.
     """
 
     #: Default colors and styling. The value of this attribute should
@@ -361,11 +1333,49 @@ class screen:
     #:        :attr:`vt102.graphics.colors`
     default_attributes = (), "default", "default"
 
-    def __init__(self, shape, encoding="utf-8"):
+    #: The events a screen handles when it's attached to a stream, and the
+    #: methods that handle them.
+    handlers = (
+        ("print-run", "_print_run"),
+        ("backspace", "_backspace"),
+        ("tab", "_tab"),
+        ("linefeed", "_linefeed"),
+        ("reverse-linefeed", "_reverse_linefeed"),
+        ("carriage-return", "_carriage_return"),
+        ("index", "_index"),
+        ("reverse-index", "_reverse_index"),
+        ("store-cursor", "_save_cursor"),
+        ("restore-cursor", "_restore_cursor"),
+        ("cursor-up", "_cursor_up"),
+        ("cursor-down", "_cursor_down"),
+        ("cursor-right", "_cursor_forward"),
+        ("cursor-left", "_cursor_back"),
+        ("cursor-move", "_cursor_position"),
+        ("erase-in-line", "_erase_in_line"),
+        ("erase-in-display", "_erase_in_display"),
+        ("delete-characters", "_delete_character"),
+        ("insert-lines", "_insert_line"),
+        ("delete-lines", "_delete_line"),
+        ("set-margins", "_set_margins"),
+        ("select-graphic-rendition", "_select_graphic_rendition"),
+        ("charset-g0", "_charset_g0"),
+        ("charset-g1", "_charset_g1"),
+        ("shift-in", "_shift_in"),
+        ("shift-out", "_shift_out"),
+        ("bell", "_bell"),
+    )
+
+    #: Where attribute combinations are interned. Every cell stores the
+    #: palette id of its attributes rather than the three-tuple itself. The
+    #: palette is shared by all screens unless a subclass brings its own.
+    palette = palette()
+
+    def __init__(self, shape, encoding="utf-8", history=0):
         rows, cols = shape
 
+        # Decoding is up to the stream, see `stream.feed_bytes`. This is kept
+        # for anyone still reading it.
         self.encoding = encoding
-        self.decoder = codecs.getdecoder(encoding)
         self.size = (rows, cols)
         self.x = 0
         self.y = 0
@@ -378,16 +1388,413 @@ class screen:
 
         self.cursor_save_stack = []
 
-        # Initialize the screen to completely empty.
-        self.display = [u" " * cols] * rows
+        # Initialize the screen to completely empty, with the attributes
+        # completely empty too.
+        self._default_id = self.palette.intern(self.default_attributes)
+        self._rows = deque(self._blank_row() for _ in range(rows))
+        self._cursor_id = self._default_id
+
+        # The top and bottom rows of the scrolling region.
+        self.margins = (0, rows - 1)
+
+        if not isinstance(history, scrollback):
+            history = scrollback(lines=history)
+        self.history = history
+
+        # Spans of columns changed in each row, and where the cursor was,
+        # since the last call to `consume_damage`. Changes to every row,
+        # which scrolling makes, are remembered by `_damage_all` instead.
+        self._damage = {}
+        self._damage_all = False
+        self._damage_cursor = (self.x, self.y)
+
+        # Goes up whenever a row is written to or moved, so that a `watcher`
+        # can tell nothing has changed without looking at the rows.
+        self._version = 0
+
+    @property
+    def cursor_attributes(self):
+        """
+        The attributes that newly printed characters get.
+        """
+        return self.palette.styles[self._cursor_id]
+
+    @cursor_attributes.setter
+    def cursor_attributes(self, attrs):
+        self._cursor_id = self.palette.intern(attrs)
+
+    @property
+    def decoder(self):
+        """
+        A `codecs` decoder for the screen's encoding. The screen no longer
+        decodes what it prints, so this is deprecated and will go away;
+        give the stream bytes with `stream.feed_bytes` instead.
+        """
+        warnings.warn("screen.decoder is deprecated, decode with "
+                      "stream.feed_bytes instead", DeprecationWarning,
+                      stacklevel=2)
+        return codecs.getdecoder(self.encoding)
+
+    @property
+    def display(self):
+        """
+        The text on the screen, as a tuple of strings (one per row). It's
+        built fresh each time, so it's read-only; assign a list of lines to
+        `display` to change the screen.
+        """
+        return tuple([row.display() for row in self._rows])
+
+    @display.setter
+    def display(self, lines):
+        rows = []
+        for y, line in enumerate(lines):
+            # Keep whatever attributes were already on the row.
+            attrs = self._rows[y].attrs[:len(line)] if y < len(self._rows) \
+                    else array("H")
+            attrs += array("H", [self._default_id]) * (len(line) - len(attrs))
+            rows.append(_row(list(line), attrs))
+        self._rows = deque(rows)
+        self._damage_rows(0, len(rows))
+
+    @property
+    def attributes(self):
+        """
+        The attributes of every character on the screen, as a list of rows,
+        each of which is a list of attributes (see `default_attributes`).
+        """
+        palette = self.palette
+        return [row.attributes(palette) for row in self._rows]
+
+    @attributes.setter
+    def attributes(self, attributes):
+        intern = self.palette.intern
+        for y, attrs in enumerate(attributes[:len(self._rows)]):
+            row = self._writable(y)
+            row.attrs = array("H", [intern(attr) for attr in attrs])
+        self._damage_rows(0, len(self._rows))
+
+    def _blank_row(self, attrs=None):
+        """
+        A new, empty row as wide as the screen.
+        """
+        cols = self.size[1]
+        if attrs is None:
+            attrs = array("H", [self._default_id]) * cols
+        return _row([u" "] * cols, attrs)
+
+    def _writable(self, y, start=0, stop=None):
+        """
+        The row at `y`, with its cached views thrown away since columns
+        `start` to `stop` are about to be written to. If a snapshot holds the
+        row, it's copied first.
+        """
+        row = self._rows[y]
+        if row.frozen:
+            row = self._rows[y] = row.copy()
+        else:
+            row.text = row.trimmed = row.styles = row.found = row.rle = None
+            row.rendered = None
+
+        self._version += 1
+        if stop is None:
+            stop = self.size[1]
+        span = self._damage.get(y)
+        if span is not None:
+            start = min(start, span[0])
+            stop = max(stop, span[1])
+        self._damage[y] = (start, stop)
+
+        return row
+
+    def _damage_rows(self, start, stop):
+        """
+        Mark rows `start` to `stop` as entirely changed.
+        """
+        self._version += 1
+        if start == 0 and stop >= self.size[0]:
+            self._damage_all = True
+            return
+
+        cols = self.size[1]
+        for y in range(start, stop):
+            self._damage[y] = (0, cols)
+
+    def snapshot(self):
+        """
+        Take a read-only `frame` of the screen as it is now. The frame shares
+        rows with the screen, and a row is only copied when the screen next
+        writes to it, so this costs one pass over the rows.
+
+            >>> sc = screen((2, 4))
+            >>> sc._print_run("abc")
+            >>> before = sc.snapshot()
+            >>> sc._print_run("def")
+            >>> before.display == ("abc ", "    ")
+            True
+            >>> sc.display == ("abcd", "ef  ")
+            True
+        """
+        rows = tuple(self._rows)
+        for row in rows:
+            row.frozen = True
+        return frame(rows, self.palette, self.size, self.cursor(),
+                     self.cursor_attributes, self.margins,
+                     (self.g0, self.g1, self.current_charset))
+
+    def consume_damage(self):
+        """
+        Return what's changed since the last call as a `damage`, and start
+        tracking afresh. Rows appear in `damage.rows` with the span of columns
+        that were written, erased or moved by scrolling, inserting or deleting.
+        Cursor moves don't damage any rows; if the cursor has moved,
+        `damage.cursor` is its new position.
+        """
+        rows, self._damage = self._damage, {}
+        if self._damage_all:
+            self._damage_all = False
+            cols = self.size[1]
+            rows = dict((y, (0, cols)) for y in range(self.size[0]))
+
+        cursor = (self.x, self.y)
+        moved = cursor if cursor != self._damage_cursor else None
+        self._damage_cursor = cursor
+
+        return damage(rows, moved)
+
+    #: What a `dump` starts with, and the version of the format after it.
+    dump_magic = b"vt102-screen"
+    dump_version = 1
+
+    def dump(self, history=False):
+        """
+        The whole state of the screen as compact bytes, for `load` to
+        restore later: the text and attributes, the cursor, margins, modes,
+        character sets, tab stops and saved cursors, and the history's
+        limits. The lines in the history are only kept if `history` is
+        true.
+
+            >>> sc = screen((2, 8))
+            >>> sc._print_run("$ make")
+            >>> again = screen((1, 1))
+            >>> again.load(sc.dump())
+            >>> again.display == sc.display and again.cursor() == (6, 0)
+            True
+
+        Runs of blanks and of the same attributes are stored as counts, so
+        a mostly empty screen takes a few bytes a row.
+        """
+
+        ids = {}
+        body = bytearray()
+        lines = list(self.history._rows) if history else []
+        _pack_rows(body, list(self._rows) + lines, ids)
+        cursor = ids.get(self._cursor_id)
+        if cursor is None:
+            cursor = ids[self._cursor_id] = len(ids)
+
+        flags = ((self.irm == "insert") |
+                 (self.g0 is not None) << 1 |
+                 (self.g1 is not None) << 2 |
+                 (self.current_charset == "g1") << 3)
+        limits = self.history.lines, self.history.bytes
+        out = bytearray(screen.dump_magic)
+        out += _u8.pack(screen.dump_version)
+        out += _screen_header.pack(
+            self.size[0], self.size[1], self.x, self.y,
+            self.margins[0], self.margins[1], flags, cursor, len(ids),
+            len(self.tabstops), len(self.cursor_save_stack),
+            0xffffffff if limits[0] is None else limits[0],
+            0xffffffff if limits[1] is None else limits[1])
+
+        # Styles are written as text, with fields and styles separated by
+        # control characters that are never part of a name.
+        styles = [None] * len(ids)
+        for id, local in ids.items():
+            attrs, fg, bg = self.palette[id]
+            styles[local] = u"\x1f".join((u",".join(attrs), fg, bg))
+        data = u"\x1e".join(styles).encode("utf-8")
+        out += _u32.pack(len(data))
+        out += data
+        for stop in self.tabstops:
+            out += _u16.pack(stop)
+        for x, y in self.cursor_save_stack:
+            out += _u16_pair.pack(x, y)
+
+        out += body
+        return bytes(out)
+
+    def load(self, data):
+        """
+        Restore the screen to the state `dump` saved in `data`, which can be
+        `bytes` or anything else with the buffer protocol. It's read in
+        place, without being copied first.
+        """
+
+        self._load_screen(memoryview(data), 0)
+
+    def _load_screen(self, view, offset):
+        """
+        Restore a dump at `offset` in `view`, and return where it ended.
+        """
+
+        magic = screen.dump_magic
+        if view[offset:offset + len(magic)].tobytes() != magic:
+            raise ValueError("not a dump of a screen")
+        offset += len(magic)
+        version, = _u8.unpack_from(view, offset)
+        if version != screen.dump_version:
+            raise ValueError("can't load version %d of the screen dump" %
+                             version)
+        (rows, cols, x, y, top, bottom, flags, cursor, count, tabstops,
+         saved, most_lines, most_bytes) = \
+            _screen_header.unpack_from(view, offset + 1)
+        offset += 1 + _screen_header.size
+
+        intern = self.palette.intern
+        size, = _u32.unpack_from(view, offset)
+        styles = _decode(view[offset + 4:offset + 4 + size])
+        offset += 4 + size
+        ids = []
+        for style in styles.split(u"\x1e")[:count]:
+            attrs, fg, bg = style.split(u"\x1f")
+            ids.append(intern((tuple(attrs.split(u",")) if attrs else (),
+                               fg, bg)))
+        self.tabstops = []
+        for _ in range(tabstops):
+            self.tabstops.append(_u16.unpack_from(view, offset)[0])
+            offset += 2
+        self.cursor_save_stack = []
+        for _ in range(saved):
+            self.cursor_save_stack.append(_u16_pair.unpack_from(view, offset))
+            offset += 4
+
+        restored, offset = _unpack_rows(view, offset, ids)
+        history = scrollback(None if most_lines == 0xffffffff else most_lines,
+                             None if most_bytes == 0xffffffff else most_bytes)
+        for row in restored[rows:]:
+            history.append(row)
 
-        # Initialize the attributes to completely empty, but the same size as
-        # the screen.
-        self.attributes = [[self.default_attributes] * cols] * rows
-        self.cursor_attributes = self.default_attributes
+        self.size = (rows, cols)
+        self._rows = deque(restored[:rows])
+        self.history = history
+        self.x, self.y = x, y
+        self.margins = (top, bottom)
+        self.irm = "insert" if flags & 1 else "replace"
+        self.g0 = dsg if flags & 2 else None
+        self.g1 = dsg if flags & 4 else None
+        self.current_charset = "g1" if flags & 8 else "g0"
+        self._cursor_id = ids[cursor]
+        self._damage = {}
+        self._damage_rows(0, rows)
+        return offset
+
+    def finditer(self, pattern, history=True):
+        """
+        Search the text of the history (unless `history` is false) and the
+        screen, oldest line first, for `pattern`, a regular expression as a
+        string or compiled. Yields a `hit` for each match. Screen rows count
+        from 0 at the top, and history lines count back from -1 just above
+        it. Each row is searched on its own, trailing blanks and all, so a
+        match never spans rows.
+
+            >>> sc = screen((2, 10), history=5)
+            >>> sc.display = ["$ make", "error: 1"]
+            >>> sc._scroll_up(0, 1)
+            >>> for hit in sc.finditer(r"\\w+:"):
+            ...     print("%d %d %s" % hit)
+            0 0 error:
+            >>> [h.y for h in sc.finditer("make")]
+            [-1]
+
+        Matches are remembered per row until the row changes, and history
+        lines are only searched once, so searching again for the same
+        pattern after a little output only searches what changed.
+        """
+
+        pattern = re.compile(pattern)
+        if history:
+            base = self.history._dropped + len(self.history)
+            for line, x, text in list(self.history._search(pattern)):
+                yield hit(line - base, x, text)
+        for y, row in enumerate(self._rows):
+            for x, text in row.find(pattern):
+                yield hit(y, x, text)
+
+    def find(self, pattern, history=True):
+        """
+        The first `hit` for `pattern`, or `None`, see `finditer`.
+        """
+
+        pattern = re.compile(pattern)
+        if history:
+            hits = self.history._search(pattern)
+            if hits:
+                line, x, text = hits[0]
+                return hit(line - self.history._dropped - len(self.history),
+                           x, text)
+        for y, row in enumerate(self._rows):
+            found = row.find(pattern)
+            if found:
+                return hit(y, *found[0])
+        return None
+
+    def lines(self, start=0, stop=None, trim=True):
+        """
+        The text of rows `start` to `stop`, numbered as in `finditer`: the
+        screen's rows from 0 at the top, and history lines back from -1 just
+        above it. By default that's the screen and no history; `stop` is
+        `None` for the bottom of the screen. Unless `trim` is false, the
+        blanks at the end of each line are left out.
+
+            >>> sc = screen((2, 6), history=5)
+            >>> sc.display = ["$ make", "ok    "]
+            >>> sc._scroll_up(0, 1)
+            >>> sc.lines(-1) == ["$ make", "ok", ""]
+            True
+            >>> sc.lines(0, 1, trim=False) == ["ok    "]
+            True
+
+        Each line is kept until its row is next written to, so calling this
+        after every little bit of output is cheap.
+        """
+
+        rows = self.size[0]
+        if stop is None or stop > rows:
+            stop = rows
+        history = self.history._rows
+        start = max(start, -len(history))
+
+        picked = []
+        if start < 0 and stop > start:
+            picked += islice(history, len(history) + start,
+                             len(history) + min(stop, 0))
+        if stop > 0:
+            picked += islice(self._rows, max(start, 0), stop)
+
+        if trim:
+            return [row.stripped() for row in picked]
+        return [row.display() for row in picked]
+
+    def text(self, start=0, stop=None, trim=True):
+        """
+        The `lines` from `start` to `stop` joined by newlines. Unless `trim`
+        is false, empty lines at the end are left out too.
+
+            >>> sc = screen((3, 6))
+            >>> sc.display = ["$ ls  ", "a b   ", "      "]
+            >>> print(sc.text())
+            $ ls
+            a b
+        """
+
+        lines = self.lines(start, stop, trim)
+        if trim:
+            while lines and not lines[-1]:
+                lines.pop()
+        return u"\n".join(lines)
 
     def __repr__(self):
-        return repr(self.display)
+        return repr(list(self.display))
 
     def __str__(self):
         lines = ['"%s"' % l for l in self.display]
@@ -402,36 +1809,22 @@ class screen:
         """
 
         if events is not None:
-            events.add_event_listener("print", self._print)
-            events.add_event_listener("backspace", self._backspace)
-            events.add_event_listener("tab", self._tab)
-            events.add_event_listener("linefeed", self._linefeed)
-            events.add_event_listener("reverse-linefeed", 
-                                      self._reverse_linefeed)
-            events.add_event_listener("carriage-return", self._carriage_return)
-            events.add_event_listener("index", self._index)
-            events.add_event_listener("reverse-index", self._reverse_index)
-            events.add_event_listener("store-cursor", self._save_cursor)
-            events.add_event_listener("restore-cursor", self._restore_cursor)
-            events.add_event_listener("cursor-up", self._cursor_up)
-            events.add_event_listener("cursor-down", self._cursor_down)
-            events.add_event_listener("cursor-right", self._cursor_forward)
-            events.add_event_listener("cursor-left", self._cursor_back)
-            events.add_event_listener("cursor-move", self._cursor_position)
-            events.add_event_listener("erase-in-line", self._erase_in_line)
-            events.add_event_listener("erase-in-display", 
-                                      self._erase_in_display)
-            events.add_event_listener("delete-characters", 
-                                      self._delete_character)
-            events.add_event_listener("insert-lines", self._insert_line)
-            events.add_event_listener("delete-lines", self._delete_line)
-            events.add_event_listener("select-graphic-rendition",
-                                      self._select_graphic_rendition)
-            events.add_event_listener("charset-g0", self._charset_g0)
-            events.add_event_listener("charset-g1", self._charset_g1)
-            events.add_event_listener("shift-in", self._shift_in)
-            events.add_event_listener("shift-out", self._shift_out)
-            events.add_event_listener("bell", self._bell)
+            for event, handler in self._handlers():
+                events.add_event_listener(event, getattr(self, handler))
+
+    @classmethod
+    def _handlers(cls):
+        """
+        The class's `handlers`. Text is printed a run at a time, but a
+        subclass that overrides `_print` and not `_print_run` still has every
+        character go through its `_print`, as it did before there were runs.
+        """
+
+        if cls._print != screen._print and \
+                cls._print_run == screen._print_run:
+            return tuple((event, "_print_chars" if handler == "_print_run"
+                          else handler) for event, handler in cls.handlers)
+        return cls.handlers
 
     def cursor(self):
         """
@@ -461,30 +1854,39 @@ class screen:
             # size, then add rows to the bottom. Note that the old column size
             # is used here so these new rows will get expanded/contracted as
             # necessary by the column resize when it happens next.
-            self.display += [u" " * self.size[1]] * (rows - self.size[0])
-            self.attributes += [[self.default_attributes] * self.size[1]] * \
-                    (rows - self.size[0])
+            self._rows += [self._blank_row()
+                           for _ in range(rows - self.size[0])]
         elif self.size[0] > rows:
             # If the current display size is taller than the requested display,
-            # then take rows off the top.
-            self.display = self.display[self.size[0]-rows:]
-            self.attributes = self.attributes[self.size[0]-rows:]
+            # then take rows off the top, into the history.
+            for _ in range(self.size[0] - rows):
+                self.history.append(self._rows.popleft())
 
         # Next, of course, resize the columns.
         if self.size[1] < cols:
             # If the current display size is thinner than the requested size,
             # expand each row to be the new size.
-            self.display = \
-                [row + (u" " * (cols - self.size[1])) for row in self.display]
-            self.attributes = \
-                [row + ([self.default_attributes] * (cols - self.size[1])) for row in self.attributes]
+            for y in range(rows):
+                row = self._writable(y)
+                row.chars += [u" "] * (cols - self.size[1])
+                row.attrs += array("H", [self._default_id]) * \
+                        (cols - self.size[1])
         elif self.size[1] > cols:
             # If the current display size is fatter than the requested size,
             # then trim each row from the right to be the new size.
-            self.display = [row[:cols-self.size[1]] for row in self.display]
-            self.attributes = [row[:cols-self.size[1]] for row in self.attributes]
+            for y in range(rows):
+                row = self._writable(y)
+                del row.chars[cols:]
+                del row.attrs[cols:]
 
         self.size = (rows, cols)
+        self.margins = (0, rows - 1)
+        self._damage = {}
+        self._damage_rows(0, rows)
+
+        # Keep the cursor on the screen.
+        self.x = min(self.x, cols - 1)
+        self.y = min(self.y, rows - 1)
         return self.size
 
     def _shift_in(self):
@@ -498,14 +1900,14 @@ class screen:
 
     def _charset_g0(self, cs):
         if cs == '0':
-            self.g0 = graphics.dsg
+            self.g0 = dsg
         else:
             # TODO: Officially support UK/US/intl8 charsets
             self.g0 = None
 
     def _charset_g1(self, cs):
         if cs == '0':
-            self.g1 = graphics.dsg
+            self.g1 = dsg
         else:
             # TODO: Officially support UK/US/intl8 charsets
             self.g1 = None
@@ -519,35 +1921,50 @@ class screen:
         # Don't make bugs where we try to print a screen. 
         assert len(char) == 1
 
-        try:
-            try:
-                # Python 3
-                char = self.decoder(bytes(char, self.encoding))[0]
-            except TypeError:
-                # Python 2.x
-                char = self.decoder(char)[0]
+        self._print_run(char)
+
+    def _print_chars(self, chars):
+        """
+        Print a run of characters one at a time with `_print`.
+        """
 
-        except UnicodeDecodeError:
-            char = "?"
+        for char in chars:
+            self._print(char)
+
+    def _print_run(self, chars):
+        """
+        Print a run of characters starting at the current cursor position and
+        advance the cursor past them, wrapping at the right margin. Each row
+        the run touches is rebuilt once, rather than once per character.
+        """
 
         if self.current_charset == "g0" and self.g0 is not None:
-            char = char.translate(self.g0)
+            chars = chars.translate(self.g0)
         elif self.current_charset == "g1" and self.g1 is not None:
-            char = char.translate(self.g1)
+            chars = chars.translate(self.g1)
+
+        cols = self.size[1]
+        start = 0
+        end = len(chars)
+        while start < end:
+            if self.x >= cols:
+                self._linefeed()
 
-        row = self.display[self.y]
-        self.display[self.y] = row[:self.x] + char + row[self.x+1:]
+            stop = min(end, start + cols - self.x)
+            count = stop - start
 
-        attrs = self.attributes[self.y]
-        self.attributes[self.y] = attrs[:self.x] + [self.cursor_attributes] + \
-                attrs[self.x+1:]
+            row = self._writable(self.y, self.x, self.x + count)
+            row.chars[self.x:self.x+count] = chars[start:stop]
+            row.attrs[self.x:self.x+count] = array("H", [self._cursor_id]) * \
+                    count
 
-        self.x += 1
+            self.x += count
+            start = stop
 
-        if self.x >= self.size[1]:
-            # If this was the last column in a row, move the cursor to the
-            # next row.
-            self._linefeed()
+            if self.x >= cols:
+                # If this was the last column in a row, move the cursor to the
+                # next row.
+                self._linefeed()
 
     def _carriage_return(self):
         """
@@ -556,17 +1973,67 @@ class screen:
 
         self.x = 0
 
+    def _set_margins(self, top=0, bottom=0):
+        """
+        Set the top and bottom margins of the scrolling region, which are 1
+        based. A margin of 0 (or none given) means the top or bottom of the
+        screen. The region has to be at least two rows; anything else is
+        ignored. Setting the margins moves the cursor home.
+        """
+
+        top = max(top, 1) - 1
+        bottom = (bottom or self.size[0]) - 1
+        if top < bottom < self.size[0]:
+            self.margins = (top, bottom)
+            self._home()
+
+    def _scroll_up(self, top, bottom):
+        """
+        Scroll rows `top` to `bottom` up one row, adding a blank row at the
+        bottom. Rows scrolled off the top of the screen go into the history.
+        """
+
+        rows = self._rows
+        if top == 0 and bottom == self.size[0] - 1:
+            # The whole screen is just a turn of the ring.
+            self.history.append(rows.popleft())
+            rows.append(self._blank_row())
+        else:
+            row = rows[top]
+            del rows[top]
+            _insert(rows, bottom, self._blank_row())
+            if top == 0:
+                self.history.append(row)
+        self._damage_rows(top, bottom + 1)
+
+    def _scroll_down(self, top, bottom):
+        """
+        Scroll rows `top` to `bottom` down one row, adding a blank row at the
+        top. The bottom row is lost.
+        """
+
+        rows = self._rows
+        if top == 0 and bottom == self.size[0] - 1:
+            rows.pop()
+            rows.appendleft(self._blank_row())
+        else:
+            del rows[bottom]
+            _insert(rows, top, self._blank_row())
+        self._damage_rows(top, bottom + 1)
+
     def _index(self):
         """
         Move the cursor down one row in the same column. If the cursor is at 
-        the last row, create a new row at the bottom.
+        the bottom margin, scroll the region up and create a new row at the
+        bottom.
         """
 
-        if self.y + 1 >= self.size[0]:
+        top, bottom = self.margins
+        if self.y == bottom:
             # If the cursor is currently on the last row, then spawn another
             # and scroll down (removing the top row).
-            self.display = self.display[1:] + [u" " * self.size[1]]
-        else:
+            self._scroll_up(top, bottom)
+        elif self.y + 1 < self.size[0]:
             # If the cursor is anywhere else, then just move it to the 
             # next line.
             self.y += 1
@@ -574,13 +2041,15 @@ class screen:
     def _reverse_index(self):
         """
         Move the cursor up one row in the same column. If the cursor is at the
-        first row, create a new row at the top.
+        top margin, scroll the region down and create a new row at the top.
         """
-        if self.y == 0:
+
+        top, bottom = self.margins
+        if self.y == top:
             # If the cursor is currently at the first row, then scroll the
             # screen up.
-            self.display = [u" " * self.size[1]] + self.display[:-1]
-        else:
+            self._scroll_down(top, bottom)
+        elif self.y > 0:
             # If the cursor is anywhere other than the first row than just move
             # it up by one row.
             self.y -= 1
@@ -646,28 +2115,42 @@ class screen:
     def _insert_line(self, count=1):
         """
         Inserts lines at line with cursor. Lines displayed below cursor move 
-        down. Lines moved past the bottom margin are lost. 
+        down. Lines moved past the bottom margin are lost. Nothing happens if
+        the cursor is outside the scrolling region.
         """
-        trimmed = self.display[:self.y+1] + \
-                  [u" " * self.size[1]] * count + \
-                  self.display[self.y+1:self.y+count+1]
-        self.display = trimmed[:self.size[0]]
+        top, bottom = self.margins
+        if not top <= self.y <= bottom:
+            return
+
+        count = min(count, bottom - self.y)
+        for _ in range(count):
+            del self._rows[bottom]
+            _insert(self._rows, self.y + 1, self._blank_row())
+        self._damage_rows(self.y + 1, bottom + 1)
 
     def _delete_line(self, count=1):
         """
         Deletes count lines, starting at line with cursor. As lines are 
         deleted, lines displayed below cursor move up. Lines added to bottom of
         screen have spaces with same character attributes as last line moved 
-        up.
+        up. Lines are only moved within the scrolling region, and nothing
+        happens if the cursor is outside it.
         """
-        self.display = self.display[:self.y] + \
-                       self.display[self.y+1:]
-        self.display.append([u" " * self.size[1]] * count)
-        self.attributes = self.attributes[:self.y] + \
-                       self.attributes[self.y+1:]
-        last_attributes = self.attributes[-1]
-        for _ in xrange(count):
-            self.attributes.append(copy(last_attributes))
+        top, bottom = self.margins
+        if not top <= self.y <= bottom:
+            return
+
+        count = min(count, bottom - self.y + 1)
+        for _ in range(count):
+            del self._rows[self.y]
+
+        # Anything left below the cursor has moved up.
+        last = bottom - count
+        last_attributes = self._rows[last].attrs if last >= self.y else None
+        for _ in range(count):
+            _insert(self._rows, last + 1,
+                    self._blank_row(copy(last_attributes)))
+        self._damage_rows(self.y, bottom + 1)
 
     def _delete_character(self, count=1):
         """
@@ -676,59 +2159,55 @@ class screen:
         of cursor move left.
         """
 
-        # First resize the text display
-        row = self.display[self.y]
+        row = self._writable(self.y, self.x)
         count = min(count, self.size[1] - self.x)
-        row = row[:self.x] + row[self.x+count:] + u" " * count
-        self.display[self.y] = row
 
-        # Then resize the attribute array too
-        attrs = self.attributes[self.y]
-        attrs = attrs[:self.x] + attrs[self.x+count:] + [self.default_attributes] * count
-        self.attributes[self.y] = attrs
+        del row.chars[self.x:self.x+count]
+        row.chars += [u" "] * count
+
+        del row.attrs[self.x:self.x+count]
+        row.attrs += array("H", [self._default_id]) * count
 
     def _erase_in_line(self, type_of=0):
         """
         Erases the row in a specific way, depending on the type_of.
         """
 
-        row = self.display[self.y]
-        attrs = self.attributes[self.y]
         if type_of == 0:
             # Erase from the cursor to the end of line, including the cursor
-            row = row[:self.x] + u" " * (self.size[1] - self.x)
-            attrs = attrs[:self.x] + [self.default_attributes] * (self.size[1] - self.x)
+            start, stop = self.x, self.size[1]
         elif type_of == 1:
             # Erase from the beginning of the line to the cursor, including it
-            row = u" " * (self.x+1) + row[self.x+1:]
-            attrs = [self.default_attributes] * (self.x+1) + attrs[self.x+1:]
+            start, stop = 0, self.x + 1
         elif type_of == 2:
             # Erase the entire line.
-            row = u" " * self.size[1]
-            attrs = [self.default_attributes] * self.size[1]
+            start, stop = 0, self.size[1]
+        else:
+            return
 
-        self.display[self.y] = row
-        self.attributes[self.y] = attrs
+        row = self._writable(self.y, start, stop)
+        row.chars[start:stop] = [u" "] * (stop - start)
+        row.attrs[start:stop] = array("H", [self._default_id]) * \
+                (stop - start)
 
     def _erase_in_display(self, type_of=0):
         if type_of == 0:
             # Erase from cursor to the end of the display, including the 
             # cursor.
-            self.display = self.display[:self.y] + \
-                    [u" " * self.size[1]] * (self.size[0] - self.y)
-            self.attributes = self.attributes[:self.y] + \
-                    [[self.default_attributes] * self.size[1]] * (self.size[0] - self.y)
+            start, stop = self.y, self.size[0]
         elif type_of == 1:
             # Erase from the beginning of the display to the cursor, including 
             # it.
-            self.display = [u" " * self.size[1]] * (self.y + 1) + \
-                    self.display[self.y+1:]
-            self.attributes = [[self.default_attributes] * self.size[1]] * (self.y + 1) + \
-                    self.attributes[self.y+1:]
+            start, stop = 0, self.y + 1
         elif type_of == 2:
             # Erase the whole display.
-            self.display = [u" " * self.size[1]] * self.size[0]
-            self.attributes = [[self.default_attributes] * self.size[1]] * self.size[0]
+            start, stop = 0, self.size[0]
+        else:
+            return
+
+        for y in range(start, stop):
+            self._rows[y] = self._blank_row()
+        self._damage_rows(start, stop)
 
     def _set_insert_mode(self):
         self.irm = "insert"
@@ -809,7 +2288,7 @@ class screen:
         current = set(self.cursor_attributes[0])
         if attr in current:
             current.remove(attr)
-        return tuple(current) + self.cursor_attributes[1:]
+        return (tuple(current),) + self.cursor_attributes[1:]
 
     def _add_text_attr(self, attr):
         current = set(self.cursor_attributes[0])
@@ -848,13 +2327,33 @@ class screen:
         """
         Given some text attribute, set the current cursor attributes 
         appropriately.
+
+        Where the attribute leads from one palette entry to the next is
+        remembered in the palette, so after the first time it's a lookup.
+        Only attributes that do something are remembered; programs can send
+        any number of others. Each class of screen has transitions of its
+        own, since a subclass may handle attributes differently.
         """
+        transitions = self.palette.transitions
+        key = (type(self), self._cursor_id, attr)
+        id = transitions.get(key)
+        if id is not None:
+            self._cursor_id = id
+            return
+
         if attr in text:
             self._text_attr(attr)
         elif attr in colors["foreground"]:
             self._color_attr("foreground", attr)
         elif attr in colors["background"]:
             self._color_attr("background", attr)
+        else:
+            return
+
+        # A reset depends on the screen's default attributes rather than the
+        # palette, so that's never remembered.
+        if text.get(attr) != "reset":
+            transitions[key] = self._cursor_id
 
     def _select_graphic_rendition(self, *attrs):
         """
@@ -867,3 +2366,186 @@ class screen:
 
         for attr in attrs:
             self._set_attr(attr)
+
+class terminal(screen, stream):
+    """
+    A screen with a parser of its own, for when all a stream is wanted for
+    is to drive one screen. Rather than dispatching events for the screen
+    to listen to, the parser calls the screen's handlers directly.
+
+        >>> t = terminal((2, 10))
+        >>> t.process(u"\\x1b[1mhello")
+        >>> t.display[0] == u"hello     "
+        True
+
+    A terminal is a `screen` in every other way, and a `stream` too, with
+    `process`, `feed_bytes`, `state` and so on. Anyone who still wants to
+    hear about events can `add_event_listener`; the first listener switches
+    the terminal over to dispatching events (to the screen as well), which
+    costs what a stream attached to a screen does.
+    """
+
+    def __init__(self, shape, encoding="utf-8", history=0,
+                 fail_on_unknown_esc=True, errors="replace"):
+        screen.__init__(self, shape, encoding, history)
+        stream.__init__(self, fail_on_unknown_esc, encoding, errors)
+        self._table, self._fallback, self._csi, self._sequences = self._fuse()
+        self._parsed = {}
+        self._print_text = getattr(self, dict(self._handlers())["print-run"])
+        self._hooked = False
+
+    @classmethod
+    def _compile(cls):
+        """
+        The stream's transition table, with printable characters going
+        through the event rather than straight to the screen.
+        """
+
+        if "_compiled" in cls.__dict__:
+            return cls._compiled
+
+        table, fallback, printable, slots = stream._compile.__func__(cls)
+        fallback = list(fallback)
+        fallback[_STREAM] = stream._print_run
+        cls._compiled = table, fallback, printable, slots
+        return cls._compiled
+
+    @classmethod
+    def _fuse(cls):
+        """
+        The transition table with every event the screen handles calling
+        the handler instead, and every other event dropped.
+        """
+
+        if "_fused" in cls.__dict__:
+            return cls._fused
+
+        table, fallback, _, _ = cls._compile()
+        table = [dict(row) for row in table]
+        fallback = list(fallback)
+        handlers = dict((event, getattr(cls, handler))
+                        for event, handler in cls._handlers())
+
+        for num, event in cls.basic.items():
+            method = handlers.get(event)
+            table[_STREAM][chr(num)] = \
+                _direct(method) if method is not None else _ignore
+        for num, event in cls.escape.items():
+            table[_ESCAPE][chr(num)] = _direct_command(handlers.get(event))
+        for num, event in cls.sequence.items():
+            table[_ESCAPE_LB][chr(num)] = _direct_final(handlers.get(event))
+        fallback[_STREAM] = handlers["print-run"]
+        fallback[_CHARSET_G0] = _direct_designate(handlers["charset-g0"])
+        fallback[_CHARSET_G1] = _direct_designate(handlers["charset-g1"])
+
+        # Whole control sequences the screen handles, with parameters the
+        # table would accept, are matched in one go rather than a character
+        # at a time. Anything else, including a sequence split across
+        # chunks, goes through the table.
+        sequences = {}
+        for num, event in cls.sequence.items():
+            if event in handlers:
+                sequences[chr(num)] = handlers[event]
+        csi = re.compile(u"\\x1b\\[((?:[0-9]+;)*[0-9]*)([%s])" % u"".join(
+            re.escape(char) for char in sorted(sequences)))
+
+        cls._fused = table, fallback, csi.match, sequences
+        return cls._fused
+
+    def _hook(self):
+        """
+        Switch over to dispatching events, with the screen listening.
+        """
+
+        if self._hooked:
+            return
+        self._hooked = True
+        self._table, self._fallback, _, _ = self._compile()
+        self._csi = None
+        self._print_text = stream._print_run.__get__(self)
+        for event, handler in self._handlers():
+            stream.add_event_listener(self, event, getattr(self, handler))
+
+    def _parse(self, match):
+        """
+        The handler and parameters for a control sequence, which are kept
+        for the next time it's seen. Programs tend to repeat themselves.
+        """
+
+        params, final = match.groups()
+        call = self._sequences[final], tuple(
+            int(param) for param in params.split(u";") if param)
+        if len(self._parsed) >= 4096:
+            self._parsed.clear()
+        self._parsed[match.group()] = call
+        return call
+
+    def dump(self, history=False):
+        """
+        The state of the screen and of the parser, see `screen.dump` and
+        `stream.dump`.
+        """
+
+        return screen.dump(self, history) + stream.dump(self)
+
+    def load(self, data):
+        view = memoryview(data)
+        self._load_stream(view, self._load_screen(view, 0))
+
+    def add_event_listener(self, event, function):
+        self._hook()
+        stream.add_event_listener(self, event, function)
+
+    def instrument(self, sample=64):
+        self._hook()
+        stream.instrument(self, sample)
+
+    def process(self, chars):
+        """
+        Consume a string of characters and update the screen, see
+        `stream.process`.
+        """
+
+        if isinstance(chars, bytes):
+            self.feed_bytes(chars)
+            return
+        if type(self).consume != stream.consume:
+            for char in chars:
+                self.consume(char)
+            return
+
+        table = self._table
+        fallback = self._fallback
+        printable = self._printable.match
+        print_text = self._print_text
+        csi = self._csi
+        parsed = self._parsed
+        index = 0
+        end = len(chars)
+        while index < end:
+            char = chars[index]
+            state = self._state
+            if char == u"\x1b" and state == _STREAM and csi is not None:
+                match = csi(chars, index)
+                # Parameters left over from a mode sequence would be picked
+                # up by the next sequence, so leave those to the table.
+                if match is not None and not self.params and \
+                        not self.current_param:
+                    sequence = match.group()
+                    call = parsed.get(sequence)
+                    if call is None:
+                        call = self._parse(match)
+                    call[0](self, *call[1])
+                    index = match.end()
+                    continue
+            action = table[state].get(char)
+            if action is not None:
+                action(self, char)
+                index += 1
+            elif state == _STREAM:
+                run = printable(chars, index)
+                print_text(run.group())
+                index = run.end()
+            else:
+                fallback[state](self, char)
+                index += 1
@@ -0,0 +1,254 @@
+"""
+Feed a `screen` from asyncio. A `feeder` parses output as it arrives, from
+an `asyncio.StreamReader` or as the protocol of a transport, and coroutines
+can wait for the screen to change rather than poll it. It needs Python 3.5
+or later.
+
+    >>> import asyncio
+    >>> from vt102 import screen
+    >>> from vt102.aio import feeder
+    >>> async def main():
+    ...     reader = asyncio.StreamReader()
+    ...     f = feeder(screen((2, 10)))
+    ...     task = asyncio.ensure_future(f.feed_from(reader))
+    ...     reader.feed_data(b"hello")
+    ...     await f.changed()
+    ...     print(f.screen.display[0].rstrip())
+    ...     reader.feed_eof()
+    ...     print(await f.changed())
+    >>> loop = asyncio.new_event_loop()
+    >>> asyncio.set_event_loop(loop)
+    >>> loop.run_until_complete(main())
+    hello
+    False
+    >>> loop.close()
+
+Parsing is done in slices of at most `chunk` bytes, giving the event loop
+back between slices, so a session that's flooding output can't hold up
+everything else on the loop.
+"""
+
+import sys
+
+if sys.version_info < (3, 5):
+    raise ImportError("vt102.aio needs Python 3.5 or later")
+
+import asyncio
+from collections import deque
+
+from . import stream as _stream, watcher
+
+class feeder(object):
+    """
+    Parses output into `screen` on the event loop and wakes up coroutines
+    waiting in `changed`.
+
+    * **screen** The screen to feed.
+    * **stream** The stream to parse with. By default one in the screen's
+      encoding that ignores escapes it doesn't know.
+    * **chunk** The most bytes parsed before giving the loop back.
+    * **error** The exception parsing the output raised, if one did. The
+      feeder closes and the rest of the output is thrown away.
+    """
+
+    def __init__(self, screen, stream=None, chunk=16384):
+        if stream is None:
+            stream = _stream(fail_on_unknown_esc=False,
+                             encoding=screen.encoding)
+        screen.attach(stream)
+        self.screen = screen
+        self.stream = stream
+        self.chunk = chunk
+        self.closed = False
+        self.error = None
+
+        self._waiters = []
+        self._pending = deque()
+        self._queued = 0
+        self._scheduled = False
+        self._eof = False
+        self._transport = None
+        self._paused = False
+
+    def changed(self):
+        """
+        Wait for the screen to change. Returns `True` once output has been
+        parsed, or `False` if the output has ended instead.
+        """
+
+        future = asyncio.get_event_loop().create_future()
+        if self.closed:
+            future.set_result(False)
+        else:
+            self._waiters.append(future)
+        return future
+
+    async def wait_for(self, pattern, region=None, timeout=None):
+        """
+        Wait for `pattern`, a compiled regular expression or a string to
+        look for as it is, to be on the screen (or in `region` of it, see
+        `vt102.watcher`), and return where as a `vt102.hit`. Returns `None`
+        if `timeout` seconds go by first, or the output ends.
+
+        Each wait only searches rows that changed in the output parsed
+        since it last looked, so many can wait on one screen at once.
+        """
+
+        w = watcher(self.screen, pattern, region)
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        found = w.check()
+        while found is None and not self.closed:
+            if deadline is None:
+                await self.changed()
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(self.changed(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+            found = w.check()
+        return found
+
+    def _wake(self, result):
+        waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(result)
+
+    def close(self):
+        """
+        Mark the output as ended and wake anyone waiting.
+        """
+
+        if not self.closed:
+            self.closed = True
+            self._wake(False)
+
+    def feed(self, data):
+        """
+        Queue a chunk of output to be parsed. It's parsed in slices from
+        the event loop; if the queue grows past a few slices the transport,
+        if there is one, is asked to stop reading until it drains.
+        """
+
+        if not data or self.error is not None:
+            return
+        self._pending.append(memoryview(data))
+        self._queued += len(data)
+        if not self._scheduled:
+            self._scheduled = True
+            asyncio.get_event_loop().call_soon(self._drain)
+        if self._queued > 4 * self.chunk and not self._paused and \
+                self._transport is not None:
+            self._paused = True
+            self._transport.pause_reading()
+
+    def feed_eof(self):
+        """
+        Close once everything queued has been parsed.
+        """
+
+        self._eof = True
+        if not self._scheduled:
+            self.close()
+
+    def _drain(self):
+        budget = self.chunk
+        pending = self._pending
+        try:
+            while budget and pending:
+                data = pending[0]
+                if len(data) > budget:
+                    pending[0] = data[budget:]
+                    data = data[:budget]
+                else:
+                    pending.popleft()
+                budget -= len(data)
+                self._queued -= len(data)
+                self.stream.feed_bytes(data)
+        except Exception as e:
+            # Nothing is waiting on this call to see the exception, so log
+            # it and end the output here, rather than leave waiters hanging.
+            pending.clear()
+            self._queued = 0
+            self._eof = True
+            self.error = e
+            asyncio.get_event_loop().call_exception_handler({
+                "message": "failed to parse output",
+                "exception": e,
+            })
+
+        self._wake(True)
+
+        if pending:
+            asyncio.get_event_loop().call_soon(self._drain)
+            return
+
+        self._scheduled = False
+        if self._paused:
+            self._paused = False
+            self._transport.resume_reading()
+        if self._eof:
+            self.close()
+
+    async def feed_from(self, reader):
+        """
+        Read `reader`, an `asyncio.StreamReader`, to the end and parse
+        everything it gives. If parsing fails the exception is raised from
+        here, after the feeder has been closed.
+        """
+
+        try:
+            while True:
+                data = await reader.read(self.chunk)
+                if not data:
+                    break
+                self.stream.feed_bytes(data)
+                self._wake(True)
+                # Give the loop back, even if the reader already has more.
+                await asyncio.sleep(0)
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.close()
+
+    def protocol(self):
+        """
+        A protocol feeding this feeder, for `loop.connect_read_pipe` (on the
+        master side of a pty, say), `loop.create_connection` or
+        `loop.subprocess_exec`.
+        """
+
+        return _protocol(self)
+
+class _protocol(asyncio.Protocol, asyncio.SubprocessProtocol):
+    def __init__(self, feeder):
+        self.feeder = feeder
+
+    def connection_made(self, transport):
+        if hasattr(transport, "get_pipe_transport"):
+            # A subprocess; it's the pipe from its stdout that gets paused.
+            transport = transport.get_pipe_transport(1)
+        self.feeder._transport = transport
+
+    def data_received(self, data):
+        self.feeder.feed(data)
+
+    def pipe_data_received(self, fd, data):
+        self.feeder.feed(data)
+
+    def eof_received(self):
+        self.feeder.feed_eof()
+
+    def connection_lost(self, exc):
+        self.feeder.feed_eof()
+
+    def pipe_connection_lost(self, fd, exc):
+        # The process may have exited already, but its output only ends
+        # when its stdout does.
+        if fd == 1:
+            self.feeder.feed_eof()
@@ -0,0 +1,451 @@
+"""
+Measure how fast output is parsed, on its own and into a screen, for a few
+kinds of output that real programs write:
+
+* **text** Lines of plain text, like a build log or `cat`.
+* **redraw** Full-screen redraws, the way curses repaints.
+* **sgr** Colourised output, like `ls --color` or compiler errors.
+* **top** Scattered updates by cursor addressing, like `top` or `htop`.
+* **dsg** Boxes drawn with the DEC line-drawing character set.
+
+The output is generated, from a fixed seed so that every run measures the
+same thing. Run it from the command line:
+
+    python -m vt102.bench
+    python -m vt102.bench --save before.json
+    python -m vt102.bench --compare before.json
+    python -m vt102.bench --profile -w redraw
+
+`--diff` measures `vt102.diff.encode` instead, on a few kinds of change
+between two screens (see `diffs`):
+
+    python -m vt102.bench --diff
+
+`--spawn` measures the whole way from a program to the screen instead: `cat`
+writing each workload from a file to a pty, read by `vt102.spawn` into its
+screen, next to the same output read from the pty and thrown away:
+
+    python -m vt102.bench --spawn
+
+Or from Python:
+
+    >>> from vt102 import bench
+    >>> data = bench.workloads["sgr"](bench.random.Random(0), 1000, (24, 80))
+    >>> result = bench.measure(data, "screen", repeat=1)
+    >>> sorted(result)
+    ['chars', 'chars_per_sec', 'events', 'events_per_sec', 'seconds']
+"""
+
+import argparse
+import cProfile
+import json
+import pstats
+import random
+import os
+import sys
+import tempfile
+import timeit
+
+from . import stream, screen, terminal
+from .diff import encode
+from .graphics import colors
+
+_words = ("the quick brown fox jumps over lazy dog error warning make all "
+          "install build test src lib include main return if else for "
+          "while int char").split()
+
+def _line(rng, cols):
+    words = []
+    length = 0
+    target = rng.randint(0, cols - 1)
+    while length < target:
+        words.append(rng.choice(_words))
+        length += len(words[-1]) + 1
+    return u" ".join(words)[:cols - 1]
+
+def text(rng, size, shape):
+    rows, cols = shape
+    out, total = [], 0
+    while total < size:
+        out.append(_line(rng, cols) + u"\r\n")
+        total += len(out[-1])
+    return u"".join(out)
+
+def redraw(rng, size, shape):
+    rows, cols = shape
+    out, total = [], 0
+    while total < size:
+        frame = [u"\x1b[H\x1b[2J"]
+        for y in range(rows):
+            frame.append(u"\x1b[%d;1H" % (y + 1))
+            if rng.random() < 0.2:
+                frame.append(u"\x1b[7m%s\x1b[m" % _line(rng, cols))
+            else:
+                frame.append(_line(rng, cols))
+        out.append(u"".join(frame))
+        total += len(out[-1])
+    return u"".join(out)
+
+def sgr(rng, size, shape):
+    rows, cols = shape
+    out, total = [], 0
+    while total < size:
+        line = []
+        for word in _line(rng, cols).split(u" "):
+            line.append(u"\x1b[%s;3%dm%s\x1b[0m " %
+                        (rng.choice((u"0", u"1", u"4", u"1;4")),
+                         rng.randint(0, 7), word))
+        out.append(u"".join(line) + u"\r\n")
+        total += len(out[-1])
+    return u"".join(out)
+
+def top(rng, size, shape):
+    rows, cols = shape
+    out, total = [], 0
+    while total < size:
+        y, x = rng.randint(1, rows), rng.randint(1, cols - 8)
+        if rng.random() < 0.3:
+            update = u"\x1b[%d;%dH\x1b[K%5.1f" % (y, x, rng.random() * 100)
+        else:
+            update = u"\x1b[%d;%dH\x1b[1m%7d\x1b[m" % (y, x,
+                                                        rng.randint(0, 10**6))
+        out.append(update)
+        total += len(update)
+    return u"".join(out)
+
+def dsg(rng, size, shape):
+    rows, cols = shape
+    out, total = [], 0
+    while total < size:
+        width = rng.randint(4, cols - 2)
+        height = rng.randint(3, rows - 2)
+        y, x = rng.randint(1, rows - height), rng.randint(1, cols - width)
+        box = [u"\x1b[%d;%dH\x1b(0l%sk" % (y, x, u"q" * (width - 2))]
+        for row in range(1, height - 1):
+            box.append(u"\x1b[%d;%dHx\x1b[%dCx" % (y + row, x, width - 2))
+        box.append(u"\x1b[%d;%dHm%sj\x1b(B" % (y + height - 1, x,
+                                               u"q" * (width - 2)))
+        out.append(u"".join(box))
+        total += len(out[-1])
+    return u"".join(out)
+
+#: Everything that can be measured, by name.
+workloads = {"text": text, "redraw": redraw, "sgr": sgr, "top": top,
+             "dsg": dsg}
+
+#: What's measured: the stream on its own, with no one listening, the
+#: stream and a screen, or a `terminal`, which is both at once.
+modes = ("stream", "screen", "terminal")
+
+class _counter(stream):
+    def __init__(self):
+        super(_counter, self).__init__()
+        self.events = 0
+
+    def dispatch(self, event, *args):
+        self.events += 1
+
+def events(data):
+    """
+    How many events the stream dispatches for `data`.
+    """
+
+    counter = _counter()
+    counter.process(data)
+    return counter.events
+
+def _setup(mode, shape):
+    if mode == "terminal":
+        return terminal(shape)
+    st = stream()
+    if mode == "screen":
+        screen(shape).attach(st)
+    return st
+
+def measure(data, mode, shape=(24, 80), repeat=5):
+    """
+    Time processing `data` the best of `repeat` times, each with a fresh
+    stream (and screen, for the `screen` mode) or terminal.
+    """
+
+    best = None
+    for _ in range(repeat):
+        st = _setup(mode, shape)
+        start = timeit.default_timer()
+        st.process(data)
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    count = events(data)
+    return {"chars": len(data),
+            "events": count,
+            "seconds": best,
+            "chars_per_sec": len(data) / best,
+            "events_per_sec": count / best}
+
+def run(names=None, size=1 << 20, shape=(24, 80), repeat=5, seed=102):
+    """
+    Measure each workload in each mode, and return the results keyed by
+    `"workload/mode"`.
+    """
+
+    results = {}
+    for name in names or sorted(workloads):
+        data = workloads[name](random.Random(seed), size, shape)
+        for mode in modes:
+            results["%s/%s" % (name, mode)] = measure(data, mode, shape,
+                                                      repeat)
+    return results
+
+def report(results, baseline=None, out=None):
+    """
+    Print results as a table, with the change from `baseline`, results
+    from an earlier run, if it's given.
+    """
+
+    out = out or sys.stdout
+    header = "%-16s %12s %12s" % ("workload", "chars/s", "events/s")
+    if baseline is not None:
+        header += " %9s" % "change"
+    out.write(header + "\n")
+    for key in sorted(results):
+        result = results[key]
+        line = "%-16s %12.0f %12.0f" % (key, result["chars_per_sec"],
+                                        result["events_per_sec"])
+        if baseline is not None and key in baseline:
+            before = baseline[key]["chars_per_sec"]
+            line += " %+8.1f%%" % ((result["chars_per_sec"] / before - 1) *
+                                   100)
+        out.write(line + "\n")
+
+def _filled(rng, shape):
+    """
+    A screen full of colourised text, and the stream attached to it.
+    """
+
+    sc = screen(shape)
+    st = stream()
+    sc.attach(st)
+    # Colourised text is mostly escapes, so it takes a few screens' worth
+    # to fill one.
+    st.process(sgr(rng, shape[0] * shape[1] * 4, shape))
+    return sc, st
+
+def typical_diff(rng, shape):
+    """
+    A few fields updated here and there, the way `top` refreshes.
+    """
+
+    sc, st = _filled(rng, shape)
+    before = sc.snapshot()
+    st.process(top(rng, 200, shape))
+    return before, sc
+
+def scroll_diff(rng, shape):
+    """
+    A few lines of output scrolling the screen up.
+    """
+
+    sc, st = _filled(rng, shape)
+    before = sc.snapshot()
+    st.process(text(rng, shape[1] * 2, shape))
+    return before, sc
+
+def worst_diff(rng, shape):
+    """
+    Every cell changed, and to different colors from its neighbours, so
+    nothing can be kept and every character needs attributes of its own.
+    """
+
+    rows, cols = shape
+    sc, st = _filled(rng, shape)
+    before = sc.snapshot()
+    foreground = [name for name in sorted(set(colors["foreground"].values()))
+                  if name != "default"]
+    background = [name for name in sorted(set(colors["background"].values()))
+                  if name != "default"]
+    sc.display = [u"".join(rng.choice(u"abcdefgh") for _ in range(cols))
+                  for _ in range(rows)]
+    sc.attributes = [[((), foreground[x % len(foreground)],
+                       background[(x + y) % len(background)])
+                      for x in range(cols)] for y in range(rows)]
+    return before, sc
+
+#: Changes between two screens to measure the diff encoder on, by name.
+#: Each takes a random generator and a shape and returns the screen (or
+#: `frame`) before the change and the screen after it.
+diffs = {"typical": typical_diff, "scroll": scroll_diff, "worst": worst_diff}
+
+def measure_diff(before, after, repeat=5, number=20):
+    """
+    Time encoding the change from `before` to `after`, the best of `repeat`
+    times `number` encodes.
+    """
+
+    seconds = min(timeit.Timer(lambda: encode(before, after)).repeat(
+        repeat, number)) / number
+    return {"bytes": len(encode(before, after).encode("utf-8")),
+            "seconds": seconds,
+            "diffs_per_sec": 1 / seconds}
+
+def run_diffs(names=None, shape=(24, 80), repeat=5, seed=102):
+    """
+    Measure each of `diffs`, and return the results keyed by
+    `"diff/name"`.
+    """
+
+    results = {}
+    for name in names or sorted(diffs):
+        before, after = diffs[name](random.Random(seed), shape)
+        results["diff/%s" % name] = measure_diff(before, after, repeat)
+    return results
+
+def report_diffs(results, baseline=None, out=None):
+    """
+    Print diff results as a table, like `report`.
+    """
+
+    out = out or sys.stdout
+    header = "%-16s %12s %12s" % ("diff", "diffs/s", "bytes")
+    if baseline is not None:
+        header += " %9s" % "change"
+    out.write(header + "\n")
+    for key in sorted(results):
+        result = results[key]
+        line = "%-16s %12.0f %12d" % (key, result["diffs_per_sec"],
+                                      result["bytes"])
+        if baseline is not None and key in baseline:
+            before = baseline[key]["diffs_per_sec"]
+            line += " %+8.1f%%" % ((result["diffs_per_sec"] / before - 1) *
+                                   100)
+        out.write(line + "\n")
+
+class _discard(object):
+    """
+    Takes the place of a spawned program's stream, so that its output is
+    read but not parsed.
+    """
+
+    def feed_bytes(self, data):
+        pass
+
+def _cat(path, shape, parse):
+    from .spawn import spawn
+
+    p = spawn(["cat", path], shape=shape)
+    if not parse:
+        p.stream = _discard()
+    try:
+        start = timeit.default_timer()
+        p.read_all()
+        elapsed = timeit.default_timer() - start
+        p.wait()
+    finally:
+        p.close()
+    return elapsed
+
+def measure_spawn(data, parse, shape=(24, 80), repeat=5):
+    """
+    Time `cat` writing `data` to a pty and `vt102.spawn` reading all of it,
+    into the screen if `parse` is true and otherwise straight into the
+    bin, the best of `repeat` times.
+    """
+
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8"))
+        best = min(_cat(path, shape, parse) for _ in range(repeat))
+    finally:
+        os.remove(path)
+
+    count = events(data)
+    return {"chars": len(data),
+            "events": count,
+            "seconds": best,
+            "chars_per_sec": len(data) / best,
+            "events_per_sec": count / best}
+
+def run_spawn(names=None, size=1 << 20, shape=(24, 80), repeat=5, seed=102):
+    """
+    Measure each workload end to end, and return the results keyed by
+    `"workload/spawn"`, or `"workload/cat"` for the output thrown away.
+    """
+
+    results = {}
+    for name in names or sorted(workloads):
+        data = workloads[name](random.Random(seed), size, shape)
+        results["%s/cat" % name] = measure_spawn(data, False, shape, repeat)
+        results["%s/spawn" % name] = measure_spawn(data, True, shape, repeat)
+    return results
+
+def profile(names=None, size=1 << 20, shape=(24, 80), mode="screen",
+            limit=25, out=None):
+    """
+    Process each workload once under cProfile and print where the time
+    went.
+    """
+
+    out = out or sys.stdout
+    for name in names or sorted(workloads):
+        data = workloads[name](random.Random(102), size, shape)
+        st = _setup(mode, shape)
+        profiler = cProfile.Profile()
+        profiler.runcall(st.process, data)
+        out.write("%s/%s\n" % (name, mode))
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats("tottime").print_stats(limit)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m vt102.bench",
+        description="Measure how fast vt102 processes typical output.")
+    parser.add_argument("-w", "--workload", action="append",
+                        choices=sorted(workloads), dest="names",
+                        help="a workload to run (default: all of them)")
+    parser.add_argument("-s", "--size", type=int, default=1 << 20,
+                        help="characters of output per workload "
+                             "(default: %(default)s)")
+    parser.add_argument("-n", "--repeat", type=int, default=5,
+                        help="take the best of this many runs "
+                             "(default: %(default)s)")
+    parser.add_argument("--save", metavar="FILE",
+                        help="write the results to FILE as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="show the change from results saved earlier")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile each workload instead of timing it")
+    parser.add_argument("--mode", choices=modes, default="screen",
+                        help="what to profile (default: %(default)s)")
+    parser.add_argument("--diff", action="store_true",
+                        help="measure the diff encoder instead")
+    parser.add_argument("--spawn", action="store_true",
+                        help="measure output from cat through a pty instead")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profile(args.names, args.size, mode=args.mode)
+        return 0
+
+    if args.diff:
+        results = run_diffs(repeat=args.repeat)
+    elif args.spawn:
+        results = run_spawn(args.names, args.size, repeat=args.repeat)
+    else:
+        results = run(args.names, args.size, repeat=args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    if args.diff:
+        report_diffs(results, baseline)
+    else:
+        report(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+"""
+Encode the difference between two screens as the vt102 output that turns one
+into the other. This is useful for mirroring a session to a remote viewer:
+rather than replaying the whole byte stream, or sending the whole screen,
+send what changed since the viewer's last update.
+
+    >>> from vt102 import screen, stream
+    >>> from vt102.diff import encode
+    >>> local = screen((3, 10))
+    >>> remote, remote_stream = screen((3, 10)), stream()
+    >>> remote.attach(remote_stream)
+    >>> st = stream()
+    >>> local.attach(st)
+    >>> seen = local.snapshot()
+    >>> st.process(u"\\x1b[2;3H\\x1b[1mhello\\x1b[0m")
+    >>> update = encode(seen, local)
+    >>> update
+    '\\x1b[2;3H\\x1b[1mhello\\x1b[m'
+    >>> remote_stream.process(update)
+    >>> remote.display == local.display
+    True
+
+Both sides can be a `screen` or a `frame` from `screen.snapshot`. The
+encoding covers the text and attributes of every cell, the cursor position
+and attributes, the scrolling margins and the character sets.
+"""
+
+from array import array
+
+from . import control as ctrl, screen, _row
+from .graphics import sgr
+
+#: Unchanged cells between two changes in a row that are cheaper to write
+#: again than to move the cursor over.
+GAP = 4
+
+def _sequence(final, count=1):
+    """
+    A control sequence with a single parameter, leaving out a count of 1.
+    """
+    return "\x1b[%s" % final if count == 1 else "\x1b[%d%s" % (count, final)
+
+def _move(x, y, to_x, to_y):
+    """
+    The shortest sequence that moves the cursor from `x, y` to `to_x, to_y`
+    without scrolling.
+    """
+
+    if (x, y) == (to_x, to_y):
+        return ""
+
+    if to_x == 0 and to_y == 0:
+        absolute = "\x1b[H"
+    elif to_x == 0:
+        absolute = "\x1b[%dH" % (to_y + 1)
+    else:
+        absolute = "\x1b[%d;%dH" % (to_y + 1, to_x + 1)
+
+    if to_y > y:
+        vertical = _sequence("B", to_y - y)
+    elif to_y < y:
+        vertical = _sequence("A", y - to_y)
+    else:
+        vertical = ""
+
+    if to_x == x:
+        horizontal = ""
+    elif to_x == 0:
+        horizontal = "\r"
+    else:
+        if to_x > x:
+            horizontal = _sequence("C", to_x - x)
+        elif x - to_x <= 3:
+            horizontal = "\b" * (x - to_x)
+        else:
+            horizontal = _sequence("D", x - to_x)
+        horizontal = min(horizontal, "\r" + _sequence("C", to_x), key=len)
+
+    relative = vertical + horizontal
+    return relative if len(relative) < len(absolute) else absolute
+
+def _blank(row, cols, default):
+    return row.chars.count(u" ") == cols and row.attrs.count(default) == cols
+
+def _blank_row(cols, default):
+    return _row([u" "] * cols, array("H", [default]) * cols)
+
+class _encoder(object):
+    """
+    Keeps track of the state the receiving screen will be in as the update is
+    written, so each step can be made as short as possible.
+    """
+
+    def __init__(self, old, new):
+        self.rows, self.cols = new.size
+        self.x, self.y = old.x, old.y
+        self.margins = old.margins
+        self.attrs = old.cursor_attributes
+        self.out = []
+
+        self.styles = new.palette.styles
+        self.default = new.palette.intern(screen.default_attributes)
+
+        # Comparing palette ids is only the same as comparing attributes if
+        # both screens use the same palette. If they don't, the old screen's
+        # attributes are translated.
+        self.same_palette = old.palette is new.palette
+        self.old_styles = old.palette.styles
+        self.old_default = old.palette.intern(screen.default_attributes)
+        self.intern = new.palette.intern
+
+        # Set when writing has scrolled the top row away, see `write`.
+        self.lost_top = False
+
+    def move(self, x, y):
+        self.out.append(_move(self.x, self.y, x, y))
+        self.x, self.y = x, y
+
+    def set_margins(self, top, bottom):
+        if self.margins != (top, bottom):
+            if (top, bottom) == (0, self.rows - 1):
+                self.out.append("\x1b[r")
+            else:
+                self.out.append("\x1b[%d;%dr" % (top + 1, bottom + 1))
+            self.margins = (top, bottom)
+            # Setting the margins moves the cursor home.
+            self.x = self.y = 0
+
+    def write(self, row, start, stop):
+        """
+        Write cells `start` to `stop` of `row`, a row of the new screen, at
+        the cursor, which is on the row's column `start`.
+        """
+
+        y = self.y
+        scrolled = False
+        if stop == self.cols and self.margins[1] == y:
+            # Writing the last column wraps, and wrapping on the bottom
+            # margin scrolls. Move the margin out of the way first.
+            if y != self.rows - 1:
+                self.set_margins(0, self.rows - 1)
+            elif self.rows > 2:
+                self.set_margins(0, self.rows - 2)
+            elif self.rows == 2:
+                # There's no room to move it, so let it scroll and scroll back
+                # afterwards.
+                scrolled = True
+            else:
+                # On a single row there's nothing to scroll back from.
+                stop -= 1
+                if start == stop:
+                    return
+            self.move(start, y)
+
+        styles = self.styles
+        chars = row.chars
+        attrs = row.attrs
+        out = self.out
+        x = start
+        while x < stop:
+            id = attrs[x]
+            run = x + 1
+            while run < stop and attrs[run] == id:
+                run += 1
+            out.append(sgr(self.attrs, styles[id]))
+            self.attrs = styles[id]
+            out.append(u"".join(chars[x:run]))
+            x = run
+
+        if stop < self.cols:
+            self.x = stop
+        elif scrolled:
+            # The row that was written is now at the top and the bottom row
+            # is blank. Reverse index at the top brings it back down, but
+            # what was on the top row is gone.
+            out.append("\x1b[H\x1bM")
+            self.x = self.y = 0
+            self.lost_top = True
+        else:
+            self.x = 0
+            if y + 1 < self.rows:
+                self.y = y + 1
+
+    def row(self, y, old, new):
+        """
+        Bring row `y` from `old` to `new`, which are rows of the old and new
+        screens.
+        """
+
+        if old is new:
+            return
+        if self.same_palette and old.chars == new.chars and \
+                old.attrs == new.attrs:
+            return
+
+        cols = self.cols
+        old_chars, new_chars = old.chars, new.chars
+        new_attrs = new.attrs
+        if self.same_palette:
+            old_attrs = old.attrs
+        else:
+            old_attrs = [self.intern(self.old_styles[id]) for id in old.attrs]
+
+        changed = [x for x in range(cols)
+                   if old_chars[x] != new_chars[x] or
+                   old_attrs[x] != new_attrs[x]]
+        if not changed:
+            return
+
+        # Changes in the blank run at the end of the new row are cheaper to
+        # erase than to write, unless there are only a few of them.
+        tail = cols
+        while tail > 0 and new_chars[tail-1] == u" " and \
+                new_attrs[tail-1] == self.default:
+            tail -= 1
+        erase = None
+        if changed[-1] >= tail:
+            blanked = [x for x in changed if x >= tail]
+            if changed[-1] - blanked[0] >= 3:
+                erase = blanked[0]
+                changed = [x for x in changed if x < tail]
+
+        # Runs of changes close enough together are written in one go.
+        spans = []
+        for x in changed:
+            if spans and x - spans[-1][1] < GAP:
+                spans[-1][1] = x + 1
+            else:
+                spans.append([x, x + 1])
+
+        for start, stop in spans:
+            self.move(start, y)
+            self.write(new, start, stop)
+
+        if erase is not None:
+            self.move(erase, y)
+            self.out.append("\x1b[K")
+
+def encode(old, new):
+    """
+    Return the string that, processed by a `stream` attached to a screen
+    that looks like `old`, makes it look like `new`. `old` may be `None` for
+    a freshly created screen of the same size. The screens have to be the
+    same size.
+
+    The update moves the cursor with the shortest of absolute and relative
+    moves, erases to the end of a row where that's shorter than writing
+    blanks, changes attributes with the shortest select-graphic-rendition
+    sequence and writes changed cells in runs. Rows shared between the two
+    (see `screen.snapshot`) are skipped without being looked at.
+
+    vt102 wraps as soon as the last column is written, so writing the last
+    column of the bottom margin would scroll. The update moves the margin
+    out of the way first, or on a two row screen scrolls back again. A
+    screen of a single row can't have its last column written without
+    losing the row, so that column is left alone.
+    """
+
+    if old is None:
+        old = screen(new.size).snapshot()
+    if old.size != new.size:
+        raise ValueError("can't encode between screens of size %r and %r" %
+                         (old.size, new.size))
+
+    rows, cols = new.size
+    encoder = _encoder(old, new)
+    out = encoder.out
+
+    # Text is written as it is on the new screen, so it mustn't go through a
+    # character set translation on the way.
+    if old.current_charset != "g0":
+        out.append(chr(ctrl.SI))
+    if old.g0 is not None:
+        out.append("\x1b(B")
+
+    old_rows = list(old._rows)
+    new_rows = list(new._rows)
+
+    # If most of the screen has been cleared it's shorter to clear all of it
+    # and draw what's left.
+    cleared = 0
+    for old_row, new_row in zip(old_rows, new_rows):
+        if old_row is not new_row and \
+                _blank(new_row, cols, encoder.default) and \
+                not _blank(old_row, cols, encoder.old_default):
+            cleared += 1
+    if cleared > rows // 2:
+        out.append("\x1b[2J")
+        old_rows = [_blank_row(cols, encoder.old_default)] * rows
+
+    # On two rows, writing the last column of the bottom row loses the top
+    # row, so the bottom row goes first.
+    order = [1, 0] if rows == 2 else range(rows)
+    for y in order:
+        if y == 0 and encoder.lost_top:
+            old_rows[0] = _blank_row(cols, encoder.old_default)
+        encoder.row(y, old_rows[y], new_rows[y])
+
+    top, bottom = new.margins
+    encoder.set_margins(top, bottom)
+    encoder.move(new.x, new.y)
+    out.append(sgr(encoder.attrs, new.cursor_attributes))
+
+    if new.g0 is not None:
+        out.append("\x1b(0")
+    if new.g1 != old.g1:
+        out.append("\x1b)0" if new.g1 is not None else "\x1b)B")
+    if new.current_charset != "g0":
+        out.append(chr(ctrl.SO))
+
+    return u"".join(out)
@@ -46,3 +46,54 @@ colors = {
         47: "white",
     }
 }
+
+# SGR codes for every attribute we know how to turn on, and for the ones that
+# can be turned off on their own.
+_text_on = dict((name, code) for code, name in text.items()
+                if name in ("bold", "dim", "underline", "blink", "reverse"))
+_text_off = {"underline": 24, "blink": 25, "reverse": 27}
+_foreground = dict((name, code) for code, name in colors["foreground"].items()
+                   if code != 38)
+_background = dict((name, code) for code, name in colors["background"].items())
+
+def sgr(current, target):
+    """
+    The select-graphic-rendition sequence that changes the attributes from
+    `current` to `target`, which are both three-tuples of text attributes,
+    foreground and background, like a screen's `attributes`. It's the
+    shorter of resetting and changing just what's different.
+
+        >>> sgr(((), "default", "default"), (("bold",), "red", "default"))
+        '\\x1b[1;31m'
+        >>> sgr((("bold", "underline"), "red", "default"),
+        ...     (("bold",), "red", "default"))
+        '\\x1b[24m'
+    """
+
+    if current == target:
+        return ""
+
+    codes = [_text_on[attr] for attr in sorted(target[0])]
+    if target[1] != "default":
+        codes.append(_foreground[target[1]])
+    if target[2] != "default":
+        codes.append(_background[target[2]])
+    reset = "\x1b[%sm" % ";".join(str(code) for code in [0] + codes) \
+            if codes else "\x1b[m"
+
+    # If everything that's on now can be turned off on its own, changing just
+    # what's different might be shorter.
+    removed = set(current[0]) - set(target[0])
+    if not removed.issubset(_text_off):
+        return reset
+
+    codes = [_text_off[attr] for attr in sorted(removed)]
+    codes += [_text_on[attr]
+              for attr in sorted(set(target[0]) - set(current[0]))]
+    if target[1] != current[1]:
+        codes.append(_foreground[target[1]])
+    if target[2] != current[2]:
+        codes.append(_background[target[2]])
+    change = "\x1b[%sm" % ";".join(str(code) for code in codes)
+
+    return change if len(change) < len(reset) else reset
@@ -0,0 +1,199 @@
+"""
+Render a screen, or a `frame` of one, as HTML or as text with ANSI escapes.
+
+    >>> from vt102 import stream, screen
+    >>> from vt102.render import html, ansi
+    >>> sc = screen((1, 16))
+    >>> st = stream()
+    >>> sc.attach(st)
+    >>> st.process(u"\\x1b[1;31mfail\\x1b[0m <here>")
+    >>> print(html(sc))
+    <pre class="vt102"><span style="font-weight:bold;color:#cd0000">fail</span> &lt;here&gt;
+    </pre>
+    >>> ansi(sc)
+    '\\x1b[1;31mfail\\x1b[m <here>\\n'
+
+Neighbouring characters that look the same are rendered together, and
+blanks at the end of a row are left out. Each row's rendering is kept until
+the row is next written to, so rendering a screen again after a little
+output only renders the rows that changed.
+"""
+
+from . import screen
+from .graphics import sgr
+
+_default = screen.default_attributes
+
+#: The CSS colors for the eight colors a screen knows, and for the default
+#: foreground and background, which reverse video needs.
+colors = {
+    "black": "#000000",
+    "red": "#cd0000",
+    "green": "#00cd00",
+    "brown": "#cdcd00",
+    "blue": "#0000ee",
+    "magenta": "#cd00cd",
+    "cyan": "#00cdcd",
+    "white": "#e5e5e5",
+    "foreground": "#e5e5e5",
+    "background": "#000000",
+}
+
+_escapes = {ord(u"&"): u"&amp;", ord(u"<"): u"&lt;", ord(u">"): u"&gt;"}
+
+def _rows(screen, history):
+    """
+    The rows to render: the history's first, if asked for and there is
+    one, then the screen's. A `frame` has no history, so asking for it
+    makes no difference.
+    """
+
+    history = history and getattr(screen, "history", None)
+    if history:
+        return list(history._rows) + list(screen._rows)
+    return list(screen._rows)
+
+def _cached(rows, key, render):
+    """
+    Each row rendered by `render`, or the rendering it already has under
+    `key`. Renderings are kept on the row, which throws them away when it's
+    written to.
+    """
+
+    out = []
+    for row in rows:
+        rendered = row.rendered
+        if rendered is None:
+            rendered = row.rendered = {}
+        line = rendered.get(key)
+        if line is None:
+            if len(rendered) >= 8:
+                rendered.clear()
+            line = rendered[key] = render(row)
+        out.append(line)
+    return out
+
+def _runs(row, palette):
+    """
+    The row as `(attributes, text)` runs, leaving out the blanks at the end
+    that don't show: those without a background, reverse video or an
+    underline.
+    """
+
+    text = row.display()
+    runs = row.runs()
+
+    end = len(text)
+    for i in range(len(runs) - 2, -1, -2):
+        attrs, fg, bg = palette[runs[i]]
+        if bg != "default" or "reverse" in attrs or "underline" in attrs:
+            break
+        start = end - runs[i + 1]
+        shown = len(text[start:end].rstrip(u" "))
+        if shown:
+            end = start + shown
+            break
+        end = start
+
+    out = []
+    start = 0
+    for i in range(0, len(runs), 2):
+        if start >= end:
+            break
+        count = min(runs[i + 1], end - start)
+        out.append((palette[runs[i]], text[start:start + count]))
+        start += count
+    return out
+
+def _css(attrs, colors):
+    """
+    The CSS for a three-tuple of attributes, or `""` if it's the default.
+    """
+
+    text, fg, bg = attrs
+    fg = colors["foreground"] if fg == "default" else colors[fg]
+    bg = colors["background"] if bg == "default" else colors[bg]
+    if "reverse" in text:
+        fg, bg = bg, fg
+
+    css = []
+    if "bold" in text:
+        css.append("font-weight:bold")
+    if "dim" in text:
+        css.append("opacity:0.5")
+    decoration = [name for name in ("underline", "blink") if name in text]
+    if decoration:
+        css.append("text-decoration:%s" % " ".join(decoration))
+    if fg != colors["foreground"]:
+        css.append("color:%s" % fg)
+    if bg != colors["background"]:
+        css.append("background-color:%s" % bg)
+    return ";".join(css)
+
+def html_lines(screen, history=False, colors=colors):
+    """
+    Each row of `screen` as HTML, with a `<span>` for each run of text
+    that isn't in the default colors. `colors` is the CSS for each color,
+    see `colors`. If `history` is true the lines in the screen's history
+    come first.
+    """
+
+    palette = screen.palette
+    styles = {}
+
+    def render(row):
+        pieces = []
+        opened = ""
+        for attrs, text in _runs(row, palette):
+            css = styles.get(attrs)
+            if css is None:
+                css = styles[attrs] = _css(attrs, colors)
+            if css != opened:
+                if opened:
+                    pieces.append(u"</span>")
+                if css:
+                    pieces.append(u'<span style="%s">' % css)
+                opened = css
+            pieces.append(text.translate(_escapes))
+        if opened:
+            pieces.append(u"</span>")
+        return u"".join(pieces)
+
+    key = ("html", tuple(sorted(colors.items())))
+    return _cached(_rows(screen, history), key, render)
+
+def html(screen, history=False, colors=colors):
+    """
+    The screen as a `<pre>` element, see `html_lines`.
+    """
+
+    return u'<pre class="vt102">%s\n</pre>' % u"\n".join(
+        html_lines(screen, history, colors))
+
+def ansi_lines(screen, history=False):
+    """
+    Each row of `screen` as text, with select-graphic-rendition escapes
+    for its attributes. Every row starts and ends in the default
+    attributes, so rows can be printed on their own.
+    """
+
+    palette = screen.palette
+
+    def render(row):
+        pieces = []
+        current = _default
+        for attrs, text in _runs(row, palette):
+            pieces.append(sgr(current, attrs))
+            pieces.append(text)
+            current = attrs
+        pieces.append(sgr(current, _default))
+        return u"".join(pieces)
+
+    return _cached(_rows(screen, history), "ansi", render)
+
+def ansi(screen, history=False):
+    """
+    The screen as text with escapes, one line per row, see `ansi_lines`.
+    """
+
+    return u"".join(line + u"\n" for line in ansi_lines(screen, history))
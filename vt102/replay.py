@@ -0,0 +1,528 @@
+"""
+Replay recorded terminal sessions and report what the screen looked like,
+at the end or every so often along the way.
+
+Three kinds of recording are understood:
+
+* **raw** The bytes that were written to the terminal, and nothing else.
+* **typescript** The output of `script -t` (or `script -T`), with the timing
+  in a file of its own, by default the typescript's name plus `.timing`.
+* **asciicast** asciinema's version 2 format.
+
+Files are mapped rather than read, so a recording is never in memory all
+at once. From the command line, many files are replayed at once in a pool
+of processes and each screen comes out as a line of JSON:
+
+    python -m vt102.replay --every 60 sessions/*.cast > screens.jsonl
+
+From Python, `replay` goes through one recording and `replay_many` through
+many in parallel. An `index` of keyframes lets you jump to any point of a
+recording, only replaying from the keyframe before it.
+
+    >>> import tempfile
+    >>> from vt102.replay import replay
+    >>> with tempfile.NamedTemporaryFile(suffix=".log") as f:
+    ...     _ = f.write(b"$ make\\r\\nok\\r\\n$ ")
+    ...     f.flush()
+    ...     for state in replay(f.name, shape=(3, 10)):
+    ...         print(state["display"])
+    ['$ make    ', 'ok        ', '$         ']
+"""
+
+import sys
+
+if sys.version_info[0] < 3:
+    raise ImportError("vt102.replay needs Python 3")
+
+import argparse
+import concurrent.futures
+import json
+import mmap
+import os
+import zlib
+
+from . import stream, screen
+
+formats = ("raw", "typescript", "asciicast")
+
+#: Bytes fed to the stream at a time from a raw recording.
+CHUNK = 1 << 16
+
+def _map(path):
+    """
+    Map a file read-only. An empty file, which can't be mapped, is an empty
+    bytes object instead.
+    """
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def detect(path, timing=None):
+    """
+    Guess the format of a recording: asciicast if it starts like one,
+    typescript if it has a timing file, raw otherwise.
+    """
+
+    with open(path, "rb") as f:
+        start = f.read(64)
+    if start.startswith(b"{") and b'"version"' in start:
+        return "asciicast"
+    if timing is not None or os.path.exists(path + ".timing"):
+        return "typescript"
+    return "raw"
+
+def _raw(data, start):
+    offset = start[0] if start else 0
+    for offset in range(offset, len(data), CHUNK):
+        stop = min(offset + CHUNK, len(data))
+        yield None, offset, data[offset:stop], (stop, None, None)
+
+def _typescript(data, timing, start):
+    if start:
+        offset, now, position = start
+    else:
+        # script writes a line of its own before the session starts.
+        offset, now, position = 0, 0.0, 0
+        if data[:15] == b"Script started ":
+            offset = data.find(b"\n") + 1
+
+    with open(timing, "rb") as lines:
+        lines.seek(position)
+        for line in iter(lines.readline, b""):
+            fields = line.split()
+            if not fields:
+                continue
+            # `script -T` writes a type first; only output is in the
+            # typescript.
+            if fields[0].isalpha():
+                if fields[0] != b"O":
+                    continue
+                fields = fields[1:]
+            try:
+                delay, count = float(fields[0]), int(fields[1])
+            except (IndexError, ValueError):
+                raise ValueError("%s: not a timing line: %r" % (timing, line))
+            now += delay
+            yield now, offset, data[offset:offset + count], \
+                (offset + count, now, lines.tell())
+            offset += count
+
+def _asciicast(data, start):
+    end = data.find(b"\n")
+    if end < 0:
+        end = len(data)
+    header = json.loads(data[:end].decode("utf-8"))
+    if header.get("version") != 2:
+        raise ValueError("only version 2 asciicasts are supported")
+    yield header
+
+    offset = start[0] if start else end + 1
+    while offset < len(data):
+        end = data.find(b"\n", offset)
+        if end < 0:
+            end = len(data)
+        line = data[offset:end]
+        if line.strip():
+            when, kind, text = json.loads(line.decode("utf-8"))
+            if kind == "o":
+                yield float(when), offset, text, (end + 1, float(when), None)
+        offset = end + 1
+
+def events(path, format=None, timing=None, start=None):
+    """
+    Go through a recording as `(time, offset, data, next)` tuples: when the
+    data was written, in seconds from the start (`None` for raw
+    recordings), where it is in the file, what was written and where to
+    `start` to carry on after it. Data is bytes for raw recordings and
+    typescripts, and text for asciicasts.
+
+    For asciicasts the first item is the header instead.
+    """
+
+    if format is None:
+        format = detect(path, timing)
+    if format not in formats:
+        raise ValueError("unknown format %r" % (format,))
+
+    data = _map(path)
+    try:
+        if format == "raw":
+            source = _raw(data, start)
+        elif format == "typescript":
+            source = _typescript(data, timing or path + ".timing", start)
+        else:
+            source = _asciicast(data, start)
+        for event in source:
+            yield event
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def state(s, attributes=False):
+    """
+    A screen as a dictionary that can go straight to JSON.
+    """
+
+    out = {"size": list(s.size),
+           "cursor": list(s.cursor()),
+           "display": list(s.display)}
+    if attributes:
+        out["attributes"] = [[[list(a[0]), a[1], a[2]] for a in row]
+                             for row in s.attributes]
+    return out
+
+class player(object):
+    """
+    A screen and the stream feeding it, for replaying a recording.
+    """
+
+    def __init__(self, shape, encoding="utf-8"):
+        self.screen = screen(shape, encoding=encoding)
+        self.stream = stream(fail_on_unknown_esc=False, encoding=encoding)
+        self.screen.attach(self.stream)
+
+    def feed(self, data):
+        if isinstance(data, str):
+            self.stream.process(data)
+        else:
+            self.stream.feed_bytes(data)
+
+def replay(path, format=None, timing=None, shape=None, every=None,
+           every_bytes=None, attributes=False, encoding="utf-8"):
+    """
+    Replay a recording and yield the screen, as a `state` dictionary with
+    the `time` and byte `offset` it was taken at added, every `every`
+    seconds of the recording and every `every_bytes` bytes of it, and
+    once at the end, unless nothing has been output since the last one.
+
+    The screen size comes from the recording if it has one, and `shape`
+    or 24 by 80 otherwise.
+    """
+
+    format = format or detect(path, timing)
+    source = events(path, format, timing)
+    if format == "asciicast":
+        header = next(source)
+        if shape is None:
+            shape = (header["height"], header["width"])
+    p = player(shape or (24, 80), encoding)
+
+    def taken(when, offset):
+        out = state(p.screen, attributes)
+        out["time"] = when
+        out["offset"] = offset
+        return out
+
+    next_time = every
+    next_offset = every_bytes
+    when, offset = 0.0, 0
+    # Whether there's been output since the last screen was taken, or no
+    # screen has been taken yet.
+    fed = True
+    for when, offset, data, _ in source:
+        if next_time is not None and when is not None:
+            # Screens are taken at the last output before each tick.
+            while when >= next_time:
+                yield taken(next_time, offset)
+                fed = False
+                next_time += every
+
+        if next_offset is not None and isinstance(data, str):
+            if offset >= next_offset:
+                yield taken(when, offset)
+                fed = False
+                next_offset = (offset // every_bytes + 1) * every_bytes
+        elif next_offset is not None:
+            # Byte intervals are exact, so split the data at them.
+            while offset + len(data) >= next_offset:
+                cut = next_offset - offset
+                p.feed(data[:cut])
+                data, offset = data[cut:], next_offset
+                yield taken(when, offset)
+                fed = False
+                next_offset += every_bytes
+
+        if data:
+            p.feed(data)
+            fed = True
+        if not isinstance(data, str):
+            offset += len(data)
+
+    if fed:
+        yield taken(when, offset)
+
+class keyframe(object):
+    """
+    Everything needed to carry on replaying from one point in a recording:
+    the `screen.dump` and `stream.dump` taken there, and where to `start`
+    reading again.
+    """
+
+    def __init__(self, time, offset, start, screen, stream):
+        self.time = time
+        self.offset = offset
+        self.start = start
+        self.screen = screen
+        self.stream = stream
+
+class index(object):
+    """
+    Keyframes taken while replaying a recording once, so that getting to
+    any point in it later only means replaying from the keyframe before
+    it. See `index.build` and `index.seek`.
+
+    Screens are kept as their compact dumps, and saved indexes are
+    compressed, so an index is usually a small fraction of the size of its
+    recording.
+    """
+
+    MAGIC = b"vt102-index 2\n"
+
+    def __init__(self, path, format, timing, shape, encoding, keyframes):
+        self.path = path
+        self.format = format
+        self.timing = timing
+        self.shape = shape
+        self.encoding = encoding
+        self.keyframes = keyframes
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    @classmethod
+    def build(cls, path, format=None, timing=None, shape=None, every=None,
+              every_bytes=None, encoding="utf-8"):
+        """
+        Replay a recording, taking a keyframe every `every` seconds and
+        every `every_bytes` bytes of it, or every megabyte if neither is
+        given.
+        """
+
+        if every is None and every_bytes is None:
+            every_bytes = 1 << 20
+
+        format = format or detect(path, timing)
+        source = events(path, format, timing)
+        if format == "asciicast":
+            header = next(source)
+            if shape is None:
+                shape = (header["height"], header["width"])
+        shape = tuple(shape or (24, 80))
+        p = player(shape, encoding)
+        built = cls(path, format, timing, shape, encoding, [])
+
+        def take(when, offset, start):
+            built.keyframes.append(keyframe(when, offset, start,
+                                            p.screen.dump(), p.stream.dump()))
+
+        take(None if format == "raw" else 0.0, 0, None)
+        next_time, next_offset = every, every_bytes
+        for when, offset, data, start in source:
+            if format == "raw" and next_offset is not None:
+                # Raw recordings can carry on from any byte, so keyframes
+                # can be exactly where they're due.
+                while offset + len(data) > next_offset:
+                    cut = next_offset - offset
+                    p.feed(data[:cut])
+                    data, offset = data[cut:], next_offset
+                    take(None, offset, (offset, None, None))
+                    next_offset += every_bytes
+            p.feed(data)
+            due = False
+            if next_time is not None and when is not None and \
+                    when >= next_time:
+                due = True
+                next_time = (when // every + 1) * every
+            if next_offset is not None and start[0] >= next_offset:
+                due = True
+                next_offset = (start[0] // every_bytes + 1) * every_bytes
+            if due:
+                take(when, start[0], start)
+
+        return built
+
+    def _restore(self, k):
+        p = player(self.shape, self.encoding)
+        p.screen.load(k.screen)
+        p.stream.load(k.stream)
+        return p
+
+    def _events(self, k):
+        source = events(self.path, self.format, self.timing, k.start)
+        if self.format == "asciicast":
+            next(source)
+        return source
+
+    def seek(self, time=None, offset=None):
+        """
+        Return a `player` whose screen is as it was `time` seconds into the
+        recording, or after its first `offset` bytes.
+        """
+
+        if (time is None) == (offset is None):
+            raise ValueError("seek to either a time or an offset")
+        if time is not None and self.format == "raw":
+            raise ValueError("raw recordings have no times to seek to")
+
+        if time is not None:
+            key, target = (lambda k: k.time), time
+        else:
+            key, target = (lambda k: k.offset), offset
+        k = self.keyframes[0]
+        for candidate in self.keyframes[1:]:
+            if key(candidate) > target:
+                break
+            k = candidate
+        p = self._restore(k)
+
+        for when, at, data, start in self._events(k):
+            if time is not None:
+                if when > time:
+                    break
+            elif isinstance(data, str):
+                if at >= offset:
+                    break
+            elif at + len(data) >= offset:
+                p.feed(data[:offset - at])
+                break
+            p.feed(data)
+        return p
+
+    def save(self, filename):
+        """
+        Write the index to `filename`: a JSON header, then the dumps, all
+        compressed together.
+        """
+
+        header = {"path": self.path,
+                  "format": self.format,
+                  "timing": self.timing,
+                  "shape": self.shape,
+                  "encoding": self.encoding,
+                  "keyframes": [[k.time, k.offset, k.start, len(k.screen),
+                                 len(k.stream)] for k in self.keyframes]}
+        body = bytearray(json.dumps(header, separators=(",", ":"))
+                         .encode("utf-8"))
+        body += b"\n"
+        for k in self.keyframes:
+            body += k.screen
+            body += k.stream
+        with open(filename, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(zlib.compress(bytes(body), 9))
+
+    @classmethod
+    def load(cls, filename, path=None):
+        """
+        Read an index written by `save`. The recording is looked for where
+        it was when the index was built, unless `path` says otherwise.
+        """
+
+        with open(filename, "rb") as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError("%s isn't a vt102 index" % filename)
+            body = zlib.decompress(f.read())
+
+        end = body.index(b"\n")
+        header = json.loads(body[:end].decode("utf-8"))
+        at = end + 1
+        keyframes = []
+        for time, offset, start, screen_size, stream_size in \
+                header["keyframes"]:
+            middle = at + screen_size
+            end = middle + stream_size
+            keyframes.append(keyframe(time, offset,
+                                      None if start is None else tuple(start),
+                                      body[at:middle], body[middle:end]))
+            at = end
+
+        return cls(path or header["path"], header["format"],
+                   header["timing"], tuple(header["shape"]),
+                   header["encoding"], keyframes)
+
+def _replay(job):
+    path, options = job
+    try:
+        return path, list(replay(path, **options)), None
+    except Exception as e:
+        return path, None, "%s: %s" % (type(e).__name__, e)
+
+def replay_many(paths, workers=None, **options):
+    """
+    Replay many recordings in a pool of `workers` processes, one recording
+    to a process at a time, and yield `(path, states, error)` for each as
+    it finishes, where `states` is the list `replay` gives and `error` is
+    `None`, or a description of what went wrong and `states` is `None`.
+    """
+
+    workers = workers or os.cpu_count() or 1
+    paths = iter(paths)
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        # Only keep a few recordings per process in flight, so a long list
+        # of paths isn't all submitted, and all its results held, at once.
+        running = set()
+        for path in paths:
+            running.add(pool.submit(_replay, (path, options)))
+            if len(running) >= workers * 2:
+                done, running = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(running):
+            yield future.result()
+
+def _shape(value):
+    try:
+        rows, cols = value.lower().split("x")
+        return int(rows), int(cols)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected ROWSxCOLUMNS, not %r" %
+                                         value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m vt102.replay",
+        description="Replay recorded terminal sessions and print the "
+                    "screens as JSON lines.")
+    parser.add_argument("paths", nargs="+", metavar="recording")
+    parser.add_argument("-f", "--format", choices=formats,
+                        help="the format of the recordings, guessed if "
+                             "not given")
+    parser.add_argument("-s", "--size", type=_shape, dest="shape",
+                        metavar="ROWSxCOLUMNS",
+                        help="the screen size, for recordings without one "
+                             "(default 24x80)")
+    parser.add_argument("--every", type=float, metavar="SECONDS",
+                        help="print the screen every so many seconds of "
+                             "the recording, as well as at the end")
+    parser.add_argument("--every-bytes", type=int, metavar="BYTES",
+                        help="print the screen every so many bytes of the "
+                             "recording, as well as at the end")
+    parser.add_argument("-a", "--attributes", action="store_true",
+                        help="include the attributes of every cell")
+    parser.add_argument("-e", "--encoding", default="utf-8")
+    parser.add_argument("-j", "--jobs", type=int, metavar="N",
+                        help="the number of processes (default: one per "
+                             "CPU)")
+    args = parser.parse_args(argv)
+
+    options = dict(format=args.format, shape=args.shape, every=args.every,
+                   every_bytes=args.every_bytes, attributes=args.attributes,
+                   encoding=args.encoding)
+    failed = False
+    out = sys.stdout
+    for path, states, error in replay_many(args.paths, args.jobs, **options):
+        if error is not None:
+            failed = True
+            out.write(json.dumps({"path": path, "error": error}) + "\n")
+            continue
+        for s in states:
+            s["path"] = path
+            out.write(json.dumps(s) + "\n")
+        out.flush()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
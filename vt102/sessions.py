@@ -0,0 +1,228 @@
+"""
+Drive many terminal sessions from one thread. Each session is a file
+descriptor, usually the master side of a pty, with a `stream` and a `screen`
+attached to it. The manager waits on all of them at once with `selectors`
+(epoll, kqueue, ...) and only touches the ones that have data, so the cost
+of a poll grows with the traffic rather than with the number of sessions.
+
+    >>> import os
+    >>> from vt102 import screen
+    >>> from vt102.sessions import manager
+    >>> sessions = manager()
+    >>> r, w = os.pipe()
+    >>> s = sessions.add(r, screen((2, 10)), key="build")
+    >>> _ = os.write(w, b"make: ok")
+    >>> [s.key for s in sessions.poll(0)]
+    ['build']
+    >>> sessions["build"].screen.display[0]
+    'make: ok  '
+    >>> os.close(w)
+    >>> [s.closed for s in sessions.poll(0)]
+    [True]
+    >>> len(sessions)
+    0
+"""
+
+import sys
+
+if sys.version_info < (3, 5):
+    raise ImportError("vt102.sessions needs Python 3.5 or later")
+
+import errno
+import os
+import selectors
+import time
+
+from . import stream
+
+def read_into(fd, buffer):
+    """
+    Read whatever is waiting on the non-blocking file descriptor `fd` into
+    `buffer`, and return how many bytes that was: 0 once the other end has
+    gone away, or `None` if there was nothing to read after all.
+    """
+
+    try:
+        return os.readv(fd, [buffer])
+    except (BlockingIOError, InterruptedError):
+        return None
+    except OSError as e:
+        # Reading the master side of a pty whose child has exited fails
+        # with EIO rather than returning end of file.
+        if e.errno != errno.EIO:
+            raise
+        return 0
+
+class session(object):
+    """
+    A file descriptor and the `stream` and `screen` its output goes to.
+
+    * **key** What the manager knows the session by.
+    * **last_active** The `time.monotonic` time output last arrived, or the
+      session was added.
+    * **closed** Whether the other end has gone away.
+    * **error** The exception feeding its output raised, if one did.
+    """
+
+    def __init__(self, fd, screen, stream, key):
+        self.fd = fd
+        self.screen = screen
+        self.stream = stream
+        self.key = key
+        self.last_active = time.monotonic()
+        self.closed = False
+        self.error = None
+
+    def __repr__(self):
+        return "<session %r fd=%d>" % (self.key, self.fd)
+
+    def fileno(self):
+        return self.fd
+
+class manager(object):
+    """
+    A set of sessions fed from a single selector.
+
+    Each poll reads at most `bufsize` bytes from each ready session into a
+    buffer shared by all of them, and decodes it from there, so a session
+    that's flooding can't starve the others and there's no allocation per
+    read. Whatever is left is picked up on the next poll.
+    """
+
+    session = session
+
+    def __init__(self, bufsize=65536, selector=None):
+        self.selector = selector or selectors.DefaultSelector()
+        self.sessions = {}
+        self._buffer = bytearray(bufsize)
+        self._view = memoryview(self._buffer)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def __contains__(self, key):
+        return key in self.sessions
+
+    def __getitem__(self, key):
+        return self.sessions[key]
+
+    def get(self, key, default=None):
+        return self.sessions.get(key, default)
+
+    def add(self, fd, screen, key=None, stream=None):
+        """
+        Start reading `fd` into `screen` and return the new session. The
+        key defaults to the file descriptor. If no `stream` is given, one is
+        made in the screen's encoding that ignores escapes it doesn't know,
+        since one bad sequence shouldn't stop a session.
+        """
+
+        if key is None:
+            key = fd
+        if key in self.sessions:
+            raise KeyError("there's already a session %r" % (key,))
+
+        if stream is None:
+            stream = self._stream(screen)
+        screen.attach(stream)
+
+        os.set_blocking(fd, False)
+        s = self.session(fd, screen, stream, key)
+        self.selector.register(fd, selectors.EVENT_READ, s)
+        self.sessions[key] = s
+        return s
+
+    def _stream(self, screen):
+        return stream(fail_on_unknown_esc=False, encoding=screen.encoding)
+
+    def remove(self, key, close=False):
+        """
+        Stop reading a session and return it. If `close` is true its file
+        descriptor is closed too.
+        """
+
+        s = self.sessions.pop(key)
+        if not s.closed:
+            self.selector.unregister(s.fd)
+        if close:
+            try:
+                os.close(s.fd)
+            except OSError:
+                pass
+        return s
+
+    def poll(self, timeout=None):
+        """
+        Wait up to `timeout` seconds (forever if it's `None`) for output,
+        feed whatever has arrived to the screens and return the sessions
+        that changed. Sessions whose other end has gone away are returned
+        too, with `closed` set, and are removed from the manager; their
+        file descriptors are left for the caller to close. So are sessions
+        whose output couldn't be processed, with the exception in `error`,
+        so that one of them can't stop the others being read.
+        """
+
+        buffer, view = self._buffer, self._view
+        size = len(buffer)
+        now = None
+        changed = []
+        for key, _ in self.selector.select(timeout):
+            s = key.data
+            count = read_into(s.fd, buffer)
+            if count is None:
+                continue
+            if count == 0:
+                self.selector.unregister(s.fd)
+                s.closed = True
+                del self.sessions[s.key]
+            else:
+                try:
+                    s.stream.feed_bytes(view[:count] if count < size else view)
+                except Exception as e:
+                    self.selector.unregister(s.fd)
+                    s.error = e
+                    del self.sessions[s.key]
+                if now is None:
+                    now = time.monotonic()
+                s.last_active = now
+            changed.append(s)
+
+        return changed
+
+    def run(self, until=None, timeout=None):
+        """
+        Poll until there are no sessions left, or until `until()` returns
+        true. `timeout` is passed on to each `poll`.
+        """
+
+        while self.sessions and not (until and until()):
+            self.poll(timeout)
+
+    def idle(self, seconds):
+        """
+        The sessions that haven't had any output for at least `seconds`.
+        """
+
+        limit = time.monotonic() - seconds
+        return [s for s in self.sessions.values() if s.last_active <= limit]
+
+    def reap(self, seconds):
+        """
+        Remove the sessions that have been idle for at least `seconds`,
+        close their file descriptors, and return them.
+        """
+
+        return [self.remove(s.key, close=True) for s in self.idle(seconds)]
+
+    def close(self):
+        """
+        Remove every session, closing its file descriptor, and close the
+        selector.
+        """
+
+        for key in list(self.sessions):
+            self.remove(key, close=True)
+        self.selector.close()
@@ -0,0 +1,272 @@
+"""
+Run a program under a pseudo-terminal with its output going to a `screen`.
+
+    >>> from vt102.spawn import spawn
+    >>> p = spawn(["printf", "\\\\033[1mhello"], shape=(2, 10))
+    >>> p.read_all()
+    >>> p.screen.display[0]
+    'hello     '
+    >>> p.wait()
+    0
+    >>> p.close()
+
+Output is read in large non-blocking chunks straight into the stream's
+`feed_bytes`. Resizing the screen tells the program about its new size, the
+same way a terminal emulator would.
+"""
+
+import sys
+
+if sys.version_info < (3, 5):
+    raise ImportError("vt102.spawn needs Python 3.5 or later")
+
+import fcntl
+import os
+import pty
+import selectors
+import signal
+import struct
+import termios
+import time
+
+from . import stream, screen, watcher
+from .sessions import read_into
+
+#: What `spawn.send_keys` sends for named keys. Anything else is sent as
+#: it is.
+keys = {
+    "enter": "\r",
+    "tab": "\t",
+    "backspace": "\x7f",
+    "escape": "\x1b",
+    "up": "\x1b[A",
+    "down": "\x1b[B",
+    "right": "\x1b[C",
+    "left": "\x1b[D",
+    "home": "\x1b[1~",
+    "insert": "\x1b[2~",
+    "delete": "\x1b[3~",
+    "end": "\x1b[4~",
+    "page-up": "\x1b[5~",
+    "page-down": "\x1b[6~",
+    "f1": "\x1bOP",
+    "f2": "\x1bOQ",
+    "f3": "\x1bOR",
+    "f4": "\x1bOS",
+}
+keys.update(("ctrl-%s" % chr(c), chr(c - ord("a") + 1))
+            for c in range(ord("a"), ord("z") + 1))
+
+def set_size(fd, shape):
+    """
+    Set the size of the terminal `fd`, which sends SIGWINCH to the
+    processes running in it.
+    """
+
+    rows, cols = shape
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+def _exit_status(status):
+    """
+    The exit code in a status from `os.waitpid`, or minus the signal that
+    killed the process.
+    """
+
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+class ptyscreen(screen):
+    """
+    A screen that, once it's given the master side of a pty as `fd`, sets
+    the size of the pty whenever it's resized.
+    """
+
+    fd = None
+
+    def resize(self, shape):
+        super(ptyscreen, self).resize(shape)
+        if self.fd is not None:
+            set_size(self.fd, shape)
+
+class spawn(object):
+    """
+    A program running under a pseudo-terminal.
+
+    * **argv** The program and its arguments, looked up on the `PATH`.
+    * **shape** The size of the terminal, which the program starts with.
+    * **env** The environment, by default this process's with `TERM` set
+      to `vt102`.
+    * **cwd** The directory to run the program in.
+    * **bufsize** The most bytes read at a time.
+    """
+
+    screen_class = ptyscreen
+
+    def __init__(self, argv, shape=(24, 80), env=None, cwd=None,
+                 encoding="utf-8", bufsize=65536):
+        if env is None:
+            env = dict(os.environ, TERM="vt102")
+
+        self.screen = self.screen_class(shape, encoding=encoding)
+        self.stream = stream(fail_on_unknown_esc=False, encoding=encoding)
+        self.screen.attach(self.stream)
+
+        pid, fd = pty.fork()
+        if pid == 0:
+            try:
+                # The size has to be right before the program starts, it
+                # might not handle SIGWINCH.
+                set_size(0, shape)
+                if cwd is not None:
+                    os.chdir(cwd)
+                os.execvpe(argv[0], argv, env)
+            finally:
+                os._exit(127)
+
+        self.pid = pid
+        self.fd = fd
+        self.screen.fd = fd
+        self.closed = False
+        self.status = None
+        os.set_blocking(fd, False)
+
+        self._buffer = bytearray(bufsize)
+        self._view = memoryview(self._buffer)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(fd, selectors.EVENT_READ)
+
+    def fileno(self):
+        return self.fd
+
+    def read(self, timeout=None):
+        """
+        Wait up to `timeout` seconds (forever if it's `None`) for output and
+        feed it to the screen. Returns the number of bytes read, which is 0
+        if there wasn't any, or once the program has closed the terminal;
+        `closed` tells the two apart.
+        """
+
+        if self.closed:
+            return 0
+        if not self._selector.select(timeout):
+            return 0
+
+        count = read_into(self.fd, self._buffer)
+        if count is None:
+            return 0
+        if count == 0:
+            self.closed = True
+            self._selector.unregister(self.fd)
+        elif count < len(self._buffer):
+            self.stream.feed_bytes(self._view[:count])
+        else:
+            self.stream.feed_bytes(self._view)
+        return count
+
+    def read_all(self):
+        """
+        Read until the program closes the terminal, which is usually when
+        it exits.
+        """
+
+        while not self.closed:
+            self.read()
+
+    def wait_for(self, pattern, region=None, timeout=None):
+        """
+        Read until `pattern`, a compiled regular expression or a string to
+        look for as it is, is on the screen (or in `region` of it, see
+        `vt102.watcher`), and return where as a `vt102.hit`. Returns `None`
+        if `timeout` seconds go by first, or the program closes the
+        terminal.
+
+            p.send_keys("make", "enter")
+            p.wait_for(re.compile(r"^\\$ "), timeout=60)
+
+        Only rows that changed in the output just read are searched again.
+        """
+
+        w = watcher(self.screen, pattern, region)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            found = w.check()
+            if found is not None or self.closed:
+                return found
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            self.read(remaining)
+
+    def write(self, data):
+        """
+        Send `data`, bytes or a string in the screen's encoding, to the
+        program as if it were typed.
+        """
+
+        if not isinstance(data, bytes):
+            data = data.encode(self.screen.encoding)
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+            except BlockingIOError:
+                # The program isn't keeping up with its input. Keep its
+                # output moving while we wait, or it might never catch up.
+                self.read(0.01)
+
+    def send_keys(self, *names):
+        """
+        Send keys by name, such as `"up"`, `"enter"` or `"ctrl-c"` (see
+        `keys`). Anything that isn't a key name is sent as it is.
+
+            p.send_keys("ls", "enter")
+        """
+
+        self.write(u"".join(keys.get(name, name) for name in names))
+
+    def resize(self, shape):
+        """
+        Resize the screen, and so the terminal.
+        """
+
+        self.screen.resize(shape)
+
+    def kill(self, sig=signal.SIGTERM):
+        os.kill(self.pid, sig)
+
+    def poll(self):
+        """
+        The program's exit status if it has exited, otherwise `None`. The
+        status is the exit code, or minus the signal that killed it.
+        """
+
+        if self.status is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self.status = _exit_status(status)
+        return self.status
+
+    def wait(self):
+        """
+        Wait for the program to exit and return its exit status, see `poll`.
+        """
+
+        if self.status is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.status = _exit_status(status)
+        return self.status
+
+    def close(self):
+        """
+        Close the terminal, which hangs up on the program.
+        """
+
+        if self.fd is not None:
+            self._selector.close()
+            os.close(self.fd)
+            self.fd = self.screen.fd = None
+            self.closed = True